@@ -1,5 +1,5 @@
 from tkinter import ttk
-from camera import initialize_camera
+from camera import CameraService
 
 def create(app, container):
     """Create function for Step 1: Camera Initialization."""
@@ -11,13 +11,28 @@ def create(app, container):
     ttk.Label(frame, text="Step 1: Initialize Camera").pack(anchor="w", pady=5)
 
     # Button to start camera initialization
-    ttk.Button(frame, text="Start Camera", command=lambda:start_camera(app)).pack(pady=10)
+    start_button = ttk.Button(frame, text="Start Camera", command=lambda: start_camera(app, start_button))
+    start_button.pack(pady=10)
 
-def start_camera(app):
-    """Initialize the camera."""
-    camera = initialize_camera()
+def start_camera(app, start_button):
+    """Start the camera in the background; the GUI stays responsive until it reports ready."""
+    # Reuse the camera if it is already running
+    if getattr(app, "camera", None) is not None:
+        app.set_status("Camera ready", "success")
+        app.next_step()
+        return
+
+    start_button.config(state="disabled")
+    app.set_status("Starting camera...", "info")
+    poll_camera(app, CameraService().start(), start_button)
+
+def poll_camera(app, camera, start_button):
+    """Check the camera startup from the Tk event loop until it is ready or failed."""
+    if not camera.ready.is_set():
+        app.after(100, poll_camera, app, camera, start_button)
+        return
 
-    if camera:
+    if camera.error is None:
         # Store the camera object in the main app and update the status
         app.camera = camera  
         app.set_status("Camera ready", "success")
@@ -25,3 +40,5 @@ def start_camera(app):
     else:
         # If initialization failed, show error message
         app.set_status("Failed to initialize camera", "error")
+        if start_button.winfo_exists():
+            start_button.config(state="normal")
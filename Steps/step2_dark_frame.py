@@ -1,6 +1,7 @@
-import logging
+import logging, threading
 from tkinter import ttk
 from capture_image import capture_raw_image
+from dark_library import DarkLibrary
 
 def create(app, container):
     """Create function for Step 2: Capture or enter a dark frame."""
@@ -30,6 +31,13 @@ def create(app, container):
     # Button to apply manual value
     ttk.Button(manual, text="Use Value", command=lambda: set_nominal_dark_value(app, entry)).pack(pady=5)
 
+    # Per-pixel master darks over a ladder of exposures, captured once and reused in later sessions
+    library = ttk.Frame(frame)
+    library.pack(pady=5)
+    ttk.Label(library, text="Dark library (per-pixel darks for every exposure): ").pack(anchor="w")
+    ttk.Button(library, text="Capture Dark Library", command=lambda: capture_dark_library(app)).pack(side="left", padx=5)
+    ttk.Button(library, text="Load Saved Library", command=lambda: load_dark_library(app)).pack(side="left", padx=5)
+
 def capture_dark_frame(app):
     """Capture dark frame using the camera and store its mean."""
     # Check that the camera is initialized
@@ -39,6 +47,7 @@ def capture_dark_frame(app):
         if dark_frame is not None:
             # Store mean intensity of dark frame
             app.dark_value = dark_frame.mean()
+            app.dark_library = None
 
             # Debug info in console
             print(f"Shape: {dark_frame.shape}")
@@ -56,11 +65,50 @@ def capture_dark_frame(app):
         app.set_status("Camera not initialized!", "error")
         app.show_step(1) # Redirect to Step 1
 
+def capture_dark_library(app):
+    """Capture and save the master darks in the background (light source off)."""
+    if not getattr(app, "camera", None):
+        app.set_status("Camera not initialized!", "error")
+        app.show_step(1) # Redirect to Step 1
+        return
+
+    def run():
+        try:
+            library = DarkLibrary()
+            library.capture(app.camera, lambda: capture_raw_image(app.camera),
+                            progress=lambda done, total: app.set_status(f"Capturing dark library... {done}/{total}", "info"))
+            library.save()
+            app.after(0, lambda: use_dark_library(app, library))  # Continue on the GUI thread
+        except Exception as e:
+            logging.error(f"Dark library capture failed: {e}")
+            app.set_status("Dark library capture failed", "error")
+
+    app.set_status("Capturing dark library...", "info")
+    threading.Thread(target=run, daemon=True).start()
+
+def load_dark_library(app):
+    """Use the dark library saved in an earlier session."""
+    library = DarkLibrary()
+    if library.load():
+        use_dark_library(app, library)
+    else:
+        app.set_status("No saved dark library found", "error")
+
+def use_dark_library(app, library):
+    """Correct measurements with the dark library; its black level also serves as the scalar dark value."""
+    app.dark_library = library
+    app.dark_value = library.black_level()
+
+    logging.info(f"Mean intensity (dark_value): {app.dark_value}")
+    app.set_status(f"Dark library ready ({len(library.masters)} masters) - Black level: {app.dark_value:.2f}", "success")
+    app.next_step()
+
 def set_nominal_dark_value(app, entry):
     """Use manually entered nominal dark value."""
     try:
         value = float(entry.get()) # Convert input text to float
         app.dark_value = value
+        app.dark_library = None
 
         logging.info(f"Mean intensity (dark_value): {app.dark_value}")
         app.set_status(f"Nominal dark value set: {app.dark_value:.2f}", "success")
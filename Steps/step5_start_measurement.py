@@ -1,7 +1,10 @@
 import threading, os, logging
+import tkinter as tk
 from tkinter import ttk, filedialog
 from capture_image import run_full_measurement
-from output_data import generate_zemax_bsdf_file, save_relative_errors
+from output_data import write_zemax_bsdf, save_relative_errors
+from scan_planner import cached_plan
+from frame_writer import SAVE_FORMATS
 
 def create(app, container):
     """Create function for Step 5: Start the measurement process."""
@@ -39,9 +42,39 @@ def create(app, container):
     summary_label = ttk.Label(summary_row, text=summary_text, justify="left")
     summary_label.grid(row=0, column=0, sticky="w")
 
+    # Planning a large grid takes seconds, so the plan is made in the background and added to the summary when ready
+    plan_label = ttk.Label(summary_row, text="Planning scan order...", justify="left")
+    plan_label.grid(row=1, column=0, sticky="w")
+    threading.Thread(target=plan_in_background, args=(app, plan_label), daemon=True).start()
+
     # Back button 
     ttk.Button(summary_row, text="Back", command=lambda: app.show_step(4)).grid(row=0, column=1, padx=10, sticky="e")
 
+    # Sample name, used to reuse converged exposures from earlier scans of the same sample
+    sample_row = ttk.Frame(frame)
+    sample_row.pack(fill="x", padx=10)
+    ttk.Label(sample_row, text="Sample Name: ").pack(side="left")
+    app.sample_entry = ttk.Entry(sample_row, width=20)
+    app.sample_entry.insert(0, getattr(app, "sample_name", "default"))
+    app.sample_entry.pack(side="left")
+
+    # HDR mode: fixed exposure bracket per position instead of the exposure search
+    app.hdr_var = tk.BooleanVar(value=getattr(app, "capture_mode", "adaptive") == "hdr")
+    ttk.Checkbutton(sample_row, text="HDR bracket capture", variable=app.hdr_var).pack(side="left", padx=10)
+
+    # Format of the saved frames
+    ttk.Label(sample_row, text="Save Frames: ").pack(side="left")
+    app.save_format_var = tk.StringVar(value=getattr(app, "save_format", "archive"))
+    ttk.Combobox(sample_row, textvariable=app.save_format_var, values=SAVE_FORMATS, state="readonly", width=8).pack(side="left")
+
+    # Resume: keep the positions in the journal of this sample and measure only the rest
+    app.resume_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(sample_row, text="Resume previous scan", variable=app.resume_var).pack(side="left", padx=10)
+
+    # The motor position is lost if the scan stopped during a move: the user moves all axes home by hand and ticks this
+    app.motors_homed_var = tk.BooleanVar(value=False)
+    ttk.Checkbutton(sample_row, text="Motors at home", variable=app.motors_homed_var).pack(side="left")
+
     # Buttons for measurement control
     button_frame = ttk.Frame(frame)
     button_frame.pack(pady=10)
@@ -54,11 +87,26 @@ def create(app, container):
     app.stop_button = ttk.Button(button_frame, text="Stop", command=lambda: stop_measurement(app))
     app.stop_button.pack(side="left", padx=5)
 
-    # Save BSDF button (disabled until measurement completes)
+    # Save BSDF button (disabled until a measurement starts, then saves the positions measured so far)
     app.save_bsdf_button = ttk.Button(button_frame, text="Save BSDF", command=lambda: save_bsdf(app))
     app.save_bsdf_button.pack(side="left", padx=5)
     app.save_bsdf_button.config(state="disabled")  
 
+def plan_in_background(app, plan_label):
+    """Plan the visit order and show the predicted motor time against plain nested loops."""
+    plan = cached_plan(app.light_radial_angles, app.incidence_angles, app.det_azimuth_angles, app.det_radial_angles)
+    saving_percent = 100 * plan.saving / plan.baseline_duration if plan.baseline_duration else 0.0
+    text = (
+        f"Planned Positions: {len(plan.visits)} ({plan.blocked_count} blocked)\n"
+        f"Predicted Motor Time: {plan.duration / 60:.1f} min "
+        f"(saves {plan.saving / 60:.1f} min, {saving_percent:.0f}%)\n"
+    )
+
+    def show():
+        if plan_label.winfo_exists():  # The step may have been left meanwhile
+            plan_label.config(text=text)
+    app.after(0, show)  # Widgets are only touched on the GUI thread
+
 def start_measurement(app):
     """Start measurement process."""
     # Validation checks
@@ -70,22 +118,27 @@ def start_measurement(app):
         app.set_status("Dark value missing. Capture or enter it first.", "error")
         return
 
+    app.sample_name = app.sample_entry.get().strip() or "default"
+    app.capture_mode = "hdr" if app.hdr_var.get() else "adaptive"
+    app.save_format = app.save_format_var.get()
+    app.resume = app.resume_var.get()
+    app.motors_homed = app.motors_homed_var.get()
+    app.motors_homed_var.set(False) # Only true for this start
     app.stop_requested = False
     app.start_button.config(state="disabled") # Disable start button
 
     def run_measurement_thread():
         """Background thread to run the measurement without blocking the GUI."""
         try:
-            app.set_status("Starting full measurement...", "info")
-            run_full_measurement(app)
-
-            if not app.stop_requested:
+            app.set_status("Resuming measurement..." if app.resume else "Starting full measurement...", "info")
+            app.save_bsdf_button.config(state="normal") # Partial results can be saved while measuring
+            # Errors (e.g. a scan that cannot be resumed) are already on the status bar
+            if run_full_measurement(app):
                 app.set_status("Measurement completed!", "success")
-                app.save_bsdf_button.config(state="normal") # Enable BSDF save
 
         except Exception as e:
             logging.error(f"Measurement error: {e}")
-            app.set_status(f"Measurement failed", "error")
+            app.set_status(f"Measurement failed: {e}", "error")
         finally:
             app.start_button.config(state="normal") # Re-enable start button
 
@@ -116,35 +169,12 @@ def save_bsdf(app):
         spectral_content = "RGB"
         scatter_type = app.measurement_type.get() if hasattr(app, "measurement_type") else "BRDF"
         
-        # Prepare angle lists
-        sample_rotations = app.light_radial_angles         
-        incidence_angles = app.incidence_angles           
-        azimuth_angles = app.det_azimuth_angles            
-        radial_angles = app.det_radial_angles              
-
-        tis_data = {}    # Total integrated scatter values
-        bsdf_data = {}   # Full 4D BSDF matrix
-
-        # Build data from measurements
-        for rot in sample_rotations: 
-            for inc in incidence_angles:  
-                scatter_grid = []
-                tis_total = 0.0
-
-                for az in azimuth_angles:
-                    row = []
-                    for rad in radial_angles:
-                        key = (rot, inc, az, rad)
-                        value = app.bsdf_measurements.get(key, (0.0, 0.0, 0.0))
-                        row.append(value)
-                        tis_total += sum(value)
-                    scatter_grid.append(row)
-
-                tis_data[(rot, inc)] = tis_total
-                bsdf_data[(rot, inc)] = scatter_grid
+        # Angle lists of the measurement grid
+        store = app.measurements
+        sample_rotations, incidence_angles, azimuth_angles, radial_angles = (axis.tolist() for axis in store.axes)
 
         # Write the .bsdf file 
-        generate_zemax_bsdf_file(
+        write_zemax_bsdf(
             filename=filename,
             symmetry=symmetry,
             spectral_content=spectral_content,
@@ -153,8 +183,7 @@ def save_bsdf(app):
             incidence_angles=incidence_angles,
             azimuth_angles=azimuth_angles,
             radial_angles=radial_angles,
-            tis_data=tis_data,
-            bsdf_data=bsdf_data,
+            data=store.values,  # TIS is the sum over the scatter grid
         )
 
         app.set_status("BSDF file and relative errors saved successfully!", "success")
@@ -163,7 +192,7 @@ def save_bsdf(app):
         try:
             result_dir = os.path.dirname(filename)
             error_filename = os.path.splitext(os.path.basename(filename))[0] + "_relative_errors.csv"
-            save_relative_errors(app, output_folder=result_dir, filename=error_filename)
+            save_relative_errors(store, output_folder=result_dir, filename=error_filename)
         except Exception as e:
             logging.warning(f"Warning: Could not save relative errors: {e}")
 
@@ -0,0 +1,45 @@
+import numpy as np
+
+# Running per-pixel mean and variance of a burst of frames (Welford's update).
+# Buffers are allocated on the first frame and reused after reset(), so memory does not grow with the burst size.
+class FrameAccumulator:
+    def __init__(self):
+        self.count = 0
+        self.mean = None        # Running mean frame (float32)
+        self._m2 = None         # Sum of squared differences from the mean, per pixel
+        self._delta = None      # Scratch buffer
+
+    def reset(self):
+        """Start a new burst, keeping the buffers."""
+        self.count = 0
+
+    def add(self, frame):
+        """Add one frame to the running mean and variance, without allocating."""
+        if self.mean is None or self.mean.shape != frame.shape:
+            self.mean = np.empty(frame.shape, dtype=np.float32)
+            self._m2 = np.empty(frame.shape, dtype=np.float32)
+            self._delta = np.empty(frame.shape, dtype=np.float32)
+            self.count = 0
+
+        self.count += 1
+        if self.count == 1:
+            np.copyto(self.mean, frame, casting="unsafe")
+            self._m2.fill(0)
+            return
+
+        # delta = x - mean; mean += delta / n; m2 += delta^2 * (n - 1) / n
+        n = self.count
+        d = self._delta
+        np.subtract(frame, self.mean, out=d, casting="unsafe")
+        d /= n
+        self.mean += d
+        np.square(d, out=d)
+        d *= n * (n - 1)
+        self._m2 += d
+
+    @property
+    def variance(self):
+        """Per-pixel sample variance of single frames (NaN with fewer than two frames)."""
+        if self.count < 2:
+            return np.full(self.mean.shape, np.nan, dtype=np.float32)
+        return self._m2 / np.float32(self.count - 1)
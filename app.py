@@ -9,7 +9,7 @@ class ScatteringApp(tk.Tk):
 
         # Set up window properties
         self.title("Optical Scattering Measurement")
-        self.geometry("600x350")
+        self.geometry("600x450")
         self.configure(bg="#f0f2f5")
 
         # Apply a visual style
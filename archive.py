@@ -0,0 +1,135 @@
+import os, time, logging
+import numpy as np
+import tables
+
+# Compression of the frame and metadata datasets: fast enough to keep up with capture, lossless for raw counts
+FILTERS = tables.Filters(complevel=5, complib="blosc:lz4", shuffle=True)
+
+# Order of the angles in a geometry, as in the scan plan and the MeasurementStore
+GEOMETRY_AXES = ("light_rad", "light_az", "det_az", "det_rad")
+
+# Metadata of every stored frame, one row per frame in the same order as the frames
+class FrameInfo(tables.IsDescription):
+    position = tables.Int32Col(pos=0)       # Row of the position in /positions
+    attempt = tables.Int32Col(pos=1)        # Attempt index within the burst
+    exposure = tables.Float32Col(pos=2)     # Exposure time (µs)
+    gain = tables.Float32Col(pos=3)         # Analogue gain
+    timestamp = tables.Float64Col(pos=4)    # Unix time the frame was stored
+    variance = tables.Float32Col(pos=5)     # Noise check scores, NaN if the frame was not screened
+    entropy = tables.Float32Col(pos=6)
+
+# Geometry index: one row per measured position with the range of its frames
+class Position(tables.IsDescription):
+    light_rad = tables.Float64Col(pos=0)
+    light_az = tables.Float64Col(pos=1)
+    det_az = tables.Float64Col(pos=2)
+    det_rad = tables.Float64Col(pos=3)
+    first = tables.Int64Col(pos=4)          # Index of the first frame of the position
+    count = tables.Int32Col(pos=5)          # Number of frames
+
+def archive_path(save_dir, sample_name="default"):
+    """New archive file for a measurement of a sample, named by the start time."""
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in sample_name) or "default"
+    return os.path.join(save_dir, f"{safe_name}_{time.strftime('%Y%m%d_%H%M%S')}.h5")
+
+# HDF5 archive of the raw frames (full frames or ROI windows) of a measurement with their metadata.
+# Frames are stored in one chunked, compressed uint16 array in capture order, and the frames
+# of a position are contiguous, so reading them is a single slice instead of a directory scan.
+class MeasurementArchive:
+    def __init__(self, path, mode="r", attributes=None):
+        """
+        Open an archive for reading ("r"), create a new one ("w") with measurement-wide attributes,
+        or add frames to an existing one ("a", e.g. when a scan is resumed; created like "w" if it does not exist).
+        """
+        self.path = path
+        if mode != "r":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = tables.open_file(path, mode, title="BSDF measurement")
+
+        if "/frame_info" not in self._file:
+            self._info = self._file.create_table("/", "frame_info", FrameInfo, "Per-frame metadata", filters=FILTERS)
+            self._positions = self._file.create_table("/", "positions", Position, "Geometry index", filters=FILTERS)
+            self._frames = None  # Created on the first frame, once the frame shape is known
+            for name, value in (attributes or {}).items():
+                self._file.root._v_attrs[name] = value
+        else:
+            self._info = self._file.root.frame_info
+            self._positions = self._file.root.positions
+            self._frames = getattr(self._file.root, "frames", None)
+
+        # Geometry -> (first frame, frame count); a position stored twice keeps its last frames
+        self.index = {tuple(float(row[axis]) for axis in GEOMETRY_AXES): (int(row["first"]), int(row["count"]))
+                      for row in self._positions.read()}
+        self._geometry = None   # Position currently being written
+        self._first = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def attributes(self):
+        """Measurement-wide attributes (dark value, Bayer pattern, ...)."""
+        attrs = self._file.root._v_attrs
+        return {name: attrs[name] for name in attrs._f_list("user")}
+
+    @property
+    def frame_count(self):
+        return 0 if self._frames is None else self._frames.nrows
+
+    def geometries(self):
+        """Measured positions in capture order."""
+        return list(self.index)
+
+    def append(self, frame, geometry, attempt=0, exposure=np.nan, gain=np.nan, scores=None):
+        """Store one raw frame of a position. Frames of one position must be appended one after the other."""
+        geometry = tuple(float(angle) for angle in geometry)
+        if geometry != self._geometry:
+            self._end_position()
+            self._geometry, self._first = geometry, self.frame_count
+
+        if self._frames is None:
+            # One frame per chunk: any frame is read without decompressing its neighbours
+            self._frames = self._file.create_earray("/", "frames", tables.UInt16Atom(), (0, *frame.shape),
+                                                    "Raw frames", filters=FILTERS, chunkshape=(1, *frame.shape))
+        elif self._frames.shape[1:] != frame.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the archive {self._frames.shape[1:]}")
+
+        self._frames.append(frame[np.newaxis].astype(np.uint16, copy=False))
+
+        variance, entropy = scores if scores is not None else (np.nan, np.nan)
+        self._info.append([(self._positions.nrows, attempt, exposure, gain, time.time(), variance, entropy)])
+
+    def frames(self, geometry):
+        """All frames of a position as a (count, height, width) uint16 array."""
+        first, count = self.index[tuple(float(angle) for angle in geometry)]
+        return self._frames[first:first + count]
+
+    def frame_info(self, geometry):
+        """Metadata rows of the frames of a position, as a structured array."""
+        first, count = self.index[tuple(float(angle) for angle in geometry)]
+        return self._info.read(first, first + count)
+
+    def flush(self):
+        """Close the current position and write everything to disk."""
+        self._end_position()
+        self._file.flush()
+
+    def close(self):
+        if self._file.isopen:
+            if self._file.mode != "r":
+                self.flush()
+                logging.info(f"Archive {self.path}: {len(self.index)} positions, {self.frame_count} frames")
+            self._file.close()
+
+    def _end_position(self):
+        """Add the position being written to the geometry index."""
+        if self._geometry is None:
+            return
+
+        count = self.frame_count - self._first
+        self._positions.append([(*self._geometry, self._first, count)])
+        self.index[self._geometry] = (self._first, count)
+        self._geometry = None
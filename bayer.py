@@ -0,0 +1,42 @@
+import logging
+import numpy as np
+
+# Color filter pattern of the camera as configured in camera.py (SRGGB10), used when the configuration is unknown
+DEFAULT_PATTERN = "RGGB"
+# Bayer cells: the two greens on one diagonal
+PATTERNS = ("RGGB", "BGGR", "GRBG", "GBRG")
+
+def bayer_offsets(pattern):
+    """Position (row, column) in the 2x2 Bayer cell of the R, G1, G2 and B pixels, e.g. "RGGB" -> R at (0, 0)."""
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown Bayer pattern: {pattern!r}")
+
+    offsets = {}
+    for index, color in enumerate(pattern):
+        name = color if color != "G" else ("G1" if "G1" not in offsets else "G2")
+        offsets[name] = (index // 2, index % 2)
+    return offsets
+
+def pattern_from_format(raw_format):
+    """Bayer pattern of a raw stream format such as "SRGGB10" or "SBGGR12_CSI2P"."""
+    pattern = raw_format[1:5] if raw_format.startswith("S") else raw_format[:4]
+    bayer_offsets(pattern)  # Validate
+    return pattern
+
+def camera_pattern(picam2):
+    """Bayer pattern of the raw stream of the camera, from its active configuration."""
+    try:
+        return pattern_from_format(picam2.camera_configuration()["raw"]["format"])
+    except Exception as e:
+        logging.warning(f"Could not read the Bayer pattern from the camera configuration ({e}), using {DEFAULT_PATTERN}")
+        return DEFAULT_PATTERN
+
+def bayer_planes(image, pattern=DEFAULT_PATTERN):
+    """Strided views (no copies) of the R, G1, G2 and B planes of a raw Bayer frame."""
+    return {name: image[row::2, col::2] for name, (row, col) in bayer_offsets(pattern).items()}
+
+def green_mean(g1, g2):
+    """Average of the two green planes in float32 (integer data is not promoted to float64)."""
+    green = np.add(g1, g2, dtype=np.float32)
+    green *= np.float32(0.5)
+    return green
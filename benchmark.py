@@ -0,0 +1,389 @@
+import os, time, tempfile, argparse, logging, resource, tracemalloc
+from datetime import datetime
+import cv2
+import numpy as np
+from skimage.measure import shannon_entropy
+from fake_camera import FakePicamera2, DARK_LEVEL
+from fake_arduino import FakeArduino, FakeSerial
+from motors import Motors
+from capture_image import capture_raw_image, check_and_adjust_exposure, run_full_measurement
+from process_image import detect_static_noise, static_noise_scores, extract_color_channels, circular_roi_mean
+from roi import roi_channel_stats
+from frame_writer import SAVE_FORMATS
+from archive import MeasurementArchive
+from reprocess import reprocess
+from journal import ScanJournal, journal_path
+from measurement_store import MeasurementStore, BLOCKED
+from output_data import generate_zemax_bsdf_file, write_zemax_bsdf, read_zemax_bsdf
+from resample import METHODS, resample, target_axes
+from scan_planner import is_blocked
+from Steps.step4_angle_steps import generate_angle_lists
+
+# Angle step sizes (ls_az, ls_rad, det_az, det_rad) of the benchmark grids, as selected in Step 4
+GRIDS = {
+    "small": (200, 200, 60, 60),
+    "medium": (30, 200, 30, 30),
+    "large": (20, 30, 10, 10),
+}
+
+# Angle step sizes of the grid used to time the Zemax writer: 1° detector steps
+ZEMAX_STEPS = (30, 30, 1, 1)
+
+# Angle step sizes of the grid used to time resampling: 20° light source steps, 1° detector steps
+RESAMPLE_STEPS = (20, 20, 1, 1)
+
+# Stand-in for the Tk app with the attributes the measurement code uses.
+# Records when every position starts, so per-position times can be reported.
+class BenchmarkApp:
+    def __init__(self, camera, motors, step_sizes, capture_mode="adaptive", save_format="archive"):
+        self.camera = camera
+        self.motors = motors
+        self.dark_value = DARK_LEVEL
+        self.capture_mode = capture_mode
+        self.save_format = save_format
+        self.sample_name = "benchmark"
+        self.stop_requested = False
+
+        self.angle_step_sizes = dict(zip(("ls_az", "ls_rad", "det_az", "det_rad"), step_sizes))
+        generate_angle_lists(self)
+
+        self.position_starts = []
+        self.stop_after = None  # Request a stop when this many positions have been started
+        self.status = None
+
+    def set_status(self, message, level="info"):
+        self.status = (message, level)
+        if message.startswith("Capturing at"):
+            if self.stop_after is not None and len(self.position_starts) >= self.stop_after:
+                self.stop_requested = True
+            self.position_starts.append(time.perf_counter())
+
+def measure(func, repeat):
+    """Run func `repeat` times. Returns (mean ms, min ms, peak traced memory in MB)."""
+    func()  # Warm-up
+    tracemalloc.start()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return 1000 * np.mean(times), 1000 * np.min(times), peak / 2**20
+
+def bench_stages(repeat, out_dir):
+    """Time the single processing stages on synthetic frames."""
+    camera = FakePicamera2(geometry=lambda: {"LIGHT_AZ": 45, "DET_RAD": 45})
+    camera.start()
+
+    # Converge exposure first so the frames look like measurement frames
+    for _ in range(10):
+        if check_and_adjust_exposure(camera, capture_raw_image(camera), dark_level=DARK_LEVEL):
+            break
+
+    image = capture_raw_image(camera)
+    corrected = np.clip(image.astype(np.float32) - DARK_LEVEL, 0, None)
+    R, G, B = extract_color_channels(corrected)
+
+    # BSDF data of a medium grid
+    app = BenchmarkApp(camera, None, GRIDS["medium"])
+    rows = [[(1.0, 2.0, 3.0)] * len(app.det_radial_angles) for _ in app.det_azimuth_angles]
+    keys = [(rot, inc) for rot in app.light_radial_angles for inc in app.incidence_angles]
+    bsdf_path = os.path.join(out_dir, "benchmark.bsdf")
+
+    stages = {
+        "capture_raw_image": lambda: capture_raw_image(camera),
+        "check_and_adjust_exposure": lambda: check_and_adjust_exposure(camera, image, dark_level=DARK_LEVEL),
+        "detect_static_noise": lambda: detect_static_noise(image),
+        "extract_color_channels": lambda: extract_color_channels(corrected),
+        "circular_roi_mean": lambda: circular_roi_mean(R),
+        "roi_channel_stats": lambda: roi_channel_stats(corrected),
+        "generate_zemax_bsdf_file": lambda: generate_zemax_bsdf_file(
+            bsdf_path, "Asymmetrical4D", "RGB", "BRDF", app.light_radial_angles, app.incidence_angles,
+            app.det_azimuth_angles, app.det_radial_angles, {key: 0.0 for key in keys}, {key: rows for key in keys}),
+    }
+
+    print(f"\n{'Stage':<28}{'mean ms':>10}{'min ms':>10}{'peak MB':>10}")
+    for name, func in stages.items():
+        mean_ms, min_ms, peak_mb = measure(func, repeat)
+        print(f"{name:<28}{mean_ms:>10.2f}{min_ms:>10.2f}{peak_mb:>10.1f}")
+
+def reference_noise_scores(image):
+    """Local variance and entropy as computed by the original detect_static_noise, for comparison."""
+    resized = cv2.resize(image, (256, 256))
+    variance = np.var(cv2.absdiff(resized, cv2.GaussianBlur(resized, (5, 5), 0)))
+    entropy = shannon_entropy(image.astype(np.float32) / 1023.0)
+    return variance, entropy
+
+def bench_noise(repeat, burst=10):
+    """Time the burst noise scorer against the original implementation on full frames."""
+    camera = FakePicamera2(geometry=lambda: {"LIGHT_AZ": 45, "DET_RAD": 45})
+    camera.start()
+    for _ in range(10):
+        if check_and_adjust_exposure(camera, capture_raw_image(camera), dark_level=DARK_LEVEL):
+            break
+    frames = [capture_raw_image(camera).copy() for _ in range(burst)]
+
+    reference_ms, _, _ = measure(lambda: reference_noise_scores(frames[0]), repeat)
+    single_ms, _, _ = measure(lambda: detect_static_noise(frames[0]), repeat)
+    burst_ms, _, _ = measure(lambda: static_noise_scores(np.stack(frames)), max(repeat // burst, 1))
+    print(f"\nNoise check per full frame: original {reference_ms:.2f} ms, single frame {single_ms:.2f} ms "
+          f"({reference_ms / single_ms:.1f}x), burst of {burst} {burst_ms / burst:.2f} ms per frame")
+
+def bsdf_array(bsdf_measurements, sample_rotations, incidence_angles, azimuth_angles, radial_angles):
+    """
+    Dense (rotation, incidence, azimuth, radial, R/G/B) array of measurements keyed (rotation, incidence, azimuth, radial).
+    Missing positions are zeros; measurements off the grid are ignored.
+    """
+    axes = (sample_rotations, incidence_angles, azimuth_angles, radial_angles)
+    data = np.zeros(tuple(len(axis) for axis in axes) + (3,))
+    if not bsdf_measurements:
+        return data
+
+    keys = np.array(list(bsdf_measurements), dtype=float)
+    values = np.array(list(bsdf_measurements.values()), dtype=float)
+
+    # Grid index of every key along each axis, found by binary search
+    indices, on_grid = [], np.ones(len(keys), dtype=bool)
+    for column, axis in enumerate(axes):
+        axis = np.asarray(axis, dtype=float)
+        order = np.argsort(axis)
+        position = np.searchsorted(axis[order], keys[:, column]).clip(0, len(axis) - 1)
+        on_grid &= axis[order][position] == keys[:, column]
+        indices.append(order[position])
+
+    data[tuple(index[on_grid] for index in indices)] = values[on_grid]
+    return data
+
+def reference_zemax_file(filename, sample_rotations, incidence_angles, azimuth_angles, radial_angles, bsdf_measurements):
+    """Grid building of save_bsdf and the Zemax writer as they were before the array writer, for comparison."""
+    tis_data, bsdf_data = {}, {}
+    for rot in sample_rotations:
+        for inc in incidence_angles:
+            scatter_grid = []
+            tis_total = 0.0
+            for az in azimuth_angles:
+                row = []
+                for rad in radial_angles:
+                    value = bsdf_measurements.get((rot, inc, az, rad), (0.0, 0.0, 0.0))
+                    row.append(value)
+                    tis_total += sum(value)
+                scatter_grid.append(row)
+            tis_data[(rot, inc)] = tis_total
+            bsdf_data[(rot, inc)] = scatter_grid
+
+    with open(filename, "w") as f:
+        f.write("# Data Generated by Python BSDF Generator\n")
+        f.write(f"# {datetime.now().strftime('%m/%d/%Y %I:%M:%S %p')}\n")
+        f.write("Source  Measured\nSymmetry  Asymmetrical4D\nSpectralContent  RGB\nScatterType  BRDF\n")
+        f.write(f"SampleRotation {len(sample_rotations)}\n" + "\t".join(map(str, sample_rotations)) + "\n")
+        f.write(f"AngleOfIncidence  {len(incidence_angles)}\n" + "\t".join(map(str, incidence_angles)) + "\n")
+        f.write(f"ScatterAzimuth {len(azimuth_angles)}\n" + "\t".join(map(str, azimuth_angles)) + "\n")
+        f.write(f"ScatterRadial {len(radial_angles)}\n" + "\t".join(map(str, radial_angles)) + "\n\n")
+
+        for component_index, label in enumerate("RGB"):
+            f.write(f"{label}\nDataBegin\n")
+            for rot in sample_rotations:
+                for inc in incidence_angles:
+                    f.write(f"TIS {tis_data.get((rot, inc), 0.0):.2f}\n")
+                    for row in bsdf_data[(rot, inc)]:
+                        f.write("\t".join(f"{triple[component_index]:.3E}" for triple in row) + "\n")
+            f.write("DataEnd\n\n")
+
+def bench_zemax(out_dir):
+    """Time the Zemax writer against the previous one on a 1° detector grid and check the reader round trip."""
+    app = BenchmarkApp(None, None, ZEMAX_STEPS)
+    angles = (app.light_radial_angles, app.incidence_angles, app.det_azimuth_angles, app.det_radial_angles)
+    rng = np.random.default_rng(0)
+    keys = [(rot, inc, az, rad) for rot in angles[0] for inc in angles[1] for az in angles[2] for rad in angles[3]]
+    values = rng.lognormal(0, 3, size=(len(keys), 3))
+    measurements = dict(zip(keys[::2], map(tuple, values[::2].tolist())))  # Every other position missing
+
+    # Timed once without tracemalloc, which slows the many small allocations of the previous writer down a lot
+    reference_path, path = os.path.join(out_dir, "reference.bsdf"), os.path.join(out_dir, "array.bsdf")
+    start = time.perf_counter()
+    reference_zemax_file(reference_path, *angles, measurements)
+    reference_ms = 1000 * (time.perf_counter() - start)
+    start = time.perf_counter()
+    write_zemax_bsdf(path, "Asymmetrical4D", "RGB", "BRDF", *angles, bsdf_array(measurements, *angles))
+    array_ms = 1000 * (time.perf_counter() - start)
+
+    # Same file apart from the time stamp
+    with open(reference_path) as reference, open(path) as f:
+        for line_number, (expected, line) in enumerate(zip(reference, f)):
+            assert line_number == 1 or expected == line, f"line {line_number + 1} differs from the previous writer"
+
+    start = time.perf_counter()
+    bsdf = read_zemax_bsdf(path)
+    read_ms = 1000 * (time.perf_counter() - start)
+    data = bsdf_array(measurements, *angles)
+    assert [axis.tolist() for axis in bsdf[3:7]] == [list(map(float, axis)) for axis in angles], "angles differ after reading"
+    assert np.allclose(bsdf.data, data, rtol=5e-4, atol=0), "BSDF values differ after reading"
+    assert np.allclose(bsdf.tis, data.sum(axis=(2, 3, 4))[..., np.newaxis], rtol=0, atol=0.005), "TIS differs after reading"
+
+    print(f"\nZemax file, {data.size} values ({os.path.getsize(path) / 2**20:.1f} MB): previous writer {reference_ms:.0f} ms, "
+          f"array writer {array_ms:.0f} ms ({reference_ms / array_ms:.1f}x), reader {read_ms:.0f} ms")
+
+def bench_resample(out_dir):
+    """Time resampling a full-resolution grid with missing points onto uniform and decimated grids."""
+    app = BenchmarkApp(None, None, RESAMPLE_STEPS)
+    axes = [np.asarray(angles, dtype=float) for angles in
+            (app.light_radial_angles, app.incidence_angles, app.det_azimuth_angles, app.det_radial_angles)]
+    valid = ~is_blocked(*np.ix_(*axes))
+
+    # A BSDF linear in every angle (tests/test_resample.py checks that it is recovered exactly)
+    grid = np.meshgrid(*axes, indexing="ij")
+    values = ((100 + 0.5 * grid[0] + 0.2 * grid[1] - 0.3 * grid[2] + 0.1 * grid[3])[..., np.newaxis]
+              * np.array([1.0, 2.0, 3.0])).astype(np.float32)
+    values[~valid] = 0.0
+
+    print(f"\nResampling {values.shape[:4]} ({values.nbytes / 2**20:.0f} MB):")
+    path = os.path.join(out_dir, "resample_source.bsdf")
+    write_zemax_bsdf(path, "Asymmetrical4D", "RGB", "BRDF", *(axis.tolist() for axis in axes), values)
+    for name, steps, factors in (("uniform 15°/2°", (15, 15, 2, 2), None), ("decimated 2x/4x", None, (2, 2, 4, 4))):
+        target = target_axes(axes, steps, factors)
+        for method in METHODS:
+            start = time.perf_counter()
+            result, _ = resample(axes, values, valid, target, method)
+            elapsed = time.perf_counter() - start
+
+            out = os.path.join(out_dir, f"resampled_{method}.bsdf")
+            write_zemax_bsdf(out, "Asymmetrical4D", "RGB", "BRDF", *(axis.tolist() for axis in target), result)
+            print(f"  {name} {method}: {result.shape[:4]} in {elapsed:.2f} s, "
+                  f"file {os.path.getsize(out) / 2**20:.1f} MB (full grid {os.path.getsize(path) / 2**20:.1f} MB)")
+
+def bench_serial(repeat):
+    """Time command round trips to the fake Arduino over the in-process serial backend."""
+    arduino = FakeArduino(time_scale=0, in_process=True).start()
+    motors = Motors(connection=FakeSerial(arduino))
+
+    ping_ms, _, _ = measure(lambda: motors.request("PING"), repeat)
+    targets = [{"DET_AZ": 8 + i % 2, "DET_RAD": 8 + i % 3} for i in range(repeat)]
+    start = time.perf_counter()
+    futures = [motors.queue_move(target) for target in targets]
+    motors.wait_for_move(futures[-1])
+    move_ms = 1000 * (time.perf_counter() - start) / repeat
+
+    motors.close()
+    arduino.stop()
+    print(f"\nSerial round trip (PING): {ping_ms:.3f} ms, queued move: {move_ms:.3f} ms")
+
+def bench_measurement(grid, image_count, capture_mode, save_format, motor_time_scale, out_dir):
+    """Run run_full_measurement on a grid with the fake camera and Arduino and report per-position timings."""
+    arduino = FakeArduino(time_scale=motor_time_scale, in_process=True).start()
+    motors = Motors(connection=FakeSerial(arduino))
+    camera = FakePicamera2(geometry=arduino.angles)
+    camera.start()
+
+    app = BenchmarkApp(camera, motors, GRIDS[grid], capture_mode, save_format)
+    positions = len(app.light_radial_angles) * len(app.incidence_angles) * len(app.det_azimuth_angles) * len(app.det_radial_angles)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    save_dir = os.path.join(out_dir, grid)
+    run_full_measurement(app, image_count=image_count, save_dir=save_dir)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    motors.close()
+    arduino.stop()
+
+    # Time per visited position, from one status update to the next
+    per_position = np.diff(app.position_starts + [start + elapsed]) if app.position_starts else np.zeros(1)
+    print(f"\nMeasurement '{grid}' ({capture_mode}, {image_count} images): {len(app.position_starts)}/{positions} positions in {elapsed:.1f} s")
+    print(f"  per position: mean {1000 * per_position.mean():.1f} ms, median {1000 * np.median(per_position):.1f} ms, "
+          f"p95 {1000 * np.percentile(per_position, 95):.1f} ms, max {1000 * per_position.max():.1f} ms")
+    print(f"  sensor frames: {camera.frame_count} ({camera.frame_count / elapsed:.1f} frames/s), "
+          f"positions stored: {len(app.measurements)}, peak traced memory: {peak / 2**20:.1f} MB")
+    if save_format != "archive":
+        print(f"  frames saved ({save_format}): {len(os.listdir(save_dir))}")
+        return
+
+    # Random access into the archive: all frames of one position are a single slice
+    path = os.path.join(save_dir, os.listdir(save_dir)[0])
+    with MeasurementArchive(path) as archive:
+        geometries = archive.geometries()
+        read_ms, _, _ = measure(lambda: archive.frames(geometries[len(geometries) // 2]), 10)
+        print(f"  archive: {archive.frame_count} frames of {len(geometries)} positions, "
+              f"{os.path.getsize(path) / 2**20:.1f} MB, one position read in {read_ms:.2f} ms")
+
+    # Reprocessing time (tests/test_reprocess.py checks that it reproduces the measurement)
+    for workers in sorted({1, os.cpu_count()}):
+        start = time.perf_counter()
+        reprocess(path, workers)
+        print(f"  reprocessed with {workers} workers in {time.perf_counter() - start:.2f} s")
+
+def bench_resume(grid, image_count, capture_mode, out_dir):
+    """Time resuming a measurement stopped halfway after a simulated restart (checked in tests/test_journal.py)."""
+    arduino = FakeArduino(in_process=True).start()
+    camera = FakePicamera2(geometry=arduino.angles)
+    camera.start()
+    save_dir = os.path.join(out_dir, "resume")
+
+    # First run: stopped when half of the positions have been started
+    first = BenchmarkApp(camera, Motors(connection=FakeSerial(arduino)), GRIDS[grid], capture_mode, "none")
+    planned = int(np.count_nonzero(MeasurementStore.from_app(first).status != BLOCKED))
+    first.sample_name, first.stop_after = "resume", planned // 2
+    run_full_measurement(first, image_count=image_count, save_dir=save_dir)
+    first.motors.close()
+
+    # Restart: opening the port resets the board, the last journaled position is declared instead of home
+    journal = ScanJournal(journal_path("resume"))
+    journal.load()
+    arduino.reset_position()
+    motors = Motors(connection=FakeSerial(arduino))
+    motors.set_position(journal.motors)
+
+    second = BenchmarkApp(camera, motors, GRIDS[grid], capture_mode, "none")
+    second.sample_name, second.resume = "resume", True
+    start = time.perf_counter()
+    run_full_measurement(second, image_count=image_count, save_dir=save_dir)
+    elapsed = time.perf_counter() - start
+    motors.close()
+    arduino.stop()
+
+    # Cost of one durable record
+    copy = ScanJournal(journal.path + ".bench")
+    copy.start(journal.header)
+    record_ms, _, _ = measure(lambda: copy.record_position((8.0, 8.0, 8.0, 8.0), (1.0, 2.0, 3.0), (0.01,) * 6, 1000, 1.0), 20)
+    copy.close()
+
+    print(f"\nResume '{grid}' ({capture_mode}): stopped after {len(first.measurements)}/{planned} positions, "
+          f"{len(second.position_starts)} measured on resume in {elapsed:.1f} s, one journal record {record_ms:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks with the synthetic camera and motor backends.")
+    parser.add_argument("--grids", default="small", help=f"Comma-separated grids to measure ({', '.join(GRIDS)}) or 'none'")
+    parser.add_argument("--images", type=int, default=10, help="Images per position")
+    parser.add_argument("--mode", default="adaptive", choices=("adaptive", "hdr"), help="Capture mode")
+    parser.add_argument("--save-format", default="archive", choices=SAVE_FORMATS, help="Format of the saved frames")
+    parser.add_argument("--motor-time-scale", type=float, default=0.0, help="1 for real motor travel times, 0 to skip them")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per stage")
+    parser.add_argument("--verbose", action="store_true", help="Show the measurement log")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(asctime)s - %(message)s")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        # Exposure cache and images go to the temporary directory
+        cwd = os.getcwd()
+        os.chdir(out_dir)
+        try:
+            bench_stages(args.repeat, out_dir)
+            bench_noise(args.repeat)
+            bench_serial(args.repeat)
+            bench_zemax(out_dir)
+            bench_resample(out_dir)
+            for grid in args.grids.split(","):
+                if grid != "none":
+                    bench_measurement(grid, args.images, args.mode, args.save_format, args.motor_time_scale, out_dir)
+            if args.grids != "none":
+                bench_resume("small", args.images, args.mode, out_dir)
+        finally:
+            os.chdir(cwd)
+
+    print(f"\nProcess peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+if __name__ == "__main__":
+    main()
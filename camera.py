@@ -1,26 +1,166 @@
 from picamera2 import Picamera2
-import time
+from concurrent.futures import Future
+import threading, queue, time, logging
 
-def initialize_camera():
-  """Initialize and configure Picamera2 for RAW10 capture."""
-  # Create a Picamera2 instance
-  picam2 = Picamera2()
+# Controls applied at startup
+DEFAULT_CONTROLS = {
+  "ExposureTime": 100000,   # Set fixed exposure time (microseconds). TODO: Change if necessary
+  "AeEnable": False,        # Disable auto-exposure
+  "AwbEnable": False,       # Disable auto-white balance
+  "AnalogueGain": 1.0,      # Set analog gain
+}
 
-  # Create a still image configuration with RAW10 format and specified resolution
-  config = picam2.create_still_configuration(raw={"format": "SRGGB10", "size": (1456, 1088)})
-  picam2.configure(config)
+READY_TIMEOUT_S = 5.0  # Time allowed for the startup controls to show up in frame metadata
 
-  # Start the camera
-  picam2.start()
-  time.sleep(1.0)
+def controls_applied(metadata, controls, tolerance=0.02):
+  """Return True if the frame metadata reflects the requested numeric controls."""
+  for name in ("ExposureTime", "AnalogueGain"):
+    if name not in controls:
+      continue
+    actual = metadata.get(name)
+    # Exposure is rounded to whole sensor lines, so allow a small difference
+    if actual is None or abs(actual - controls[name]) > tolerance * controls[name] + (50 if name == "ExposureTime" else 0.01):
+      return False
+  return True
 
-  picam2.set_controls({
-    "ExposureTime": 100000,   # Set fixed exposure time (microseconds). TODO: Change if necessary
-    "AeEnable": False,        # Disable auto-exposure
-    "AwbEnable": False,       # Disable auto-white balance
-    "AnalogueGain": 1.0,      # Set analog gain
-  }) 
+# Owns the Picamera2 instance on its own thread and executes commands from a queue.
+# Offers the Picamera2 methods used in this project, so it can stand in for the camera everywhere.
+class CameraService:
+  def __init__(self):
+    self.picam2 = None
+    self.ready = threading.Event()      # Set once the startup controls are in effect
+    self.error = None                   # Exception raised during startup, if any
 
-  time.sleep(2)  # TODO: should be removed and substituted with a thread that listens to camera commands
+    self._commands = queue.Queue()
+    self._thread = None
+    self._closed = False                # Set when the camera thread stops taking commands
+    self._lock = threading.Lock()       # Orders queued commands against the camera thread shutting down
 
-  return picam2  # Return the camera instance
+  def start(self):
+    """Open and configure the camera in the background. Returns immediately."""
+    self._thread = threading.Thread(target=self._run, daemon=True)
+    self._thread.start()
+    return self
+
+  def wait_ready(self, timeout=None):
+    """Block until the camera is ready. Raises the startup error if there was one."""
+    self.ready.wait(timeout)
+    if self.error is not None:
+      raise self.error
+    return self.ready.is_set()
+
+  def stop(self):
+    """Stop the camera and its thread."""
+    self._commands.put(None)
+    self._thread.join()
+
+  def configure(self, config):
+    """Apply a camera configuration."""
+    return self._call(self._configure, config)
+
+  def set_controls(self, controls, wait=False, timeout=2.0):
+    """Set camera controls, optionally waiting until frame metadata shows them in effect."""
+    self._call(self.picam2.set_controls, controls)
+    if wait:
+      return self._call(self._wait_for_controls, controls, timeout)
+    return True
+
+  def capture_array(self, name="main"):
+    """Capture one frame of the given stream ("main" or "raw")."""
+    return self._call(self.picam2.capture_array, name)
+
+  def capture_metadata(self):
+    """Return the metadata of the next frame."""
+    return self._call(self.picam2.capture_metadata)
+
+  def camera_configuration(self):
+    """Return the active camera configuration."""
+    return self._call(self.picam2.camera_configuration)
+
+  def _call(self, func, *args):
+    """Run a function on the camera thread and return its result."""
+    if threading.current_thread() is self._thread:
+      return func(*args)
+
+    future = Future()
+    with self._lock:
+      # A command queued after the camera thread stopped would never be answered
+      if self._closed or self._thread is None or not self._thread.is_alive():
+        raise RuntimeError("Camera is not running") from self.error
+      self._commands.put((future, func, args))
+    return future.result()
+
+  def _configure(self, config):
+    """Restart the camera with a new configuration."""
+    self.picam2.stop()
+    self.picam2.configure(config)
+    self.picam2.start()
+
+  def _wait_for_controls(self, controls, timeout):
+    """Read frame metadata until it reflects the controls. Returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+      if controls_applied(self.picam2.capture_metadata(), controls):
+        return True
+    return False
+
+  def _run(self):
+    """Camera thread: start the camera, then execute queued commands."""
+    try:
+      # Create a Picamera2 instance
+      self.picam2 = Picamera2()
+
+      # Create a still image configuration with RAW10 format and specified resolution
+      config = self.picam2.create_still_configuration(raw={"format": "SRGGB10", "size": (1456, 1088)})
+      self.picam2.configure(config)
+
+      # Start the camera and apply the fixed controls
+      self.picam2.start()
+      self.picam2.set_controls(DEFAULT_CONTROLS)
+
+      # Ready once the frames are actually taken with the requested controls
+      start = time.monotonic()
+      if not self._wait_for_controls(DEFAULT_CONTROLS, READY_TIMEOUT_S):
+        logging.warning("Camera controls not confirmed by frame metadata, continuing anyway.")
+      logging.info(f"Camera ready after {time.monotonic() - start:.2f} s")
+
+    except Exception as e:
+      logging.error(f"Failed to initialize camera: {e}")
+      self.error = e
+      self._shut_down()
+      self.ready.set()
+      return
+
+    self.ready.set()
+
+    while True:
+      command = self._commands.get()
+      if command is None:
+        break
+
+      future, func, args = command
+      try:
+        future.set_result(func(*args))
+      except Exception as e:
+        future.set_exception(e)
+
+    self._shut_down()
+
+  def _shut_down(self):
+    """Stop taking commands, fail the ones still queued and release the camera."""
+    with self._lock:
+      self._closed = True
+    while True:
+      try:
+        command = self._commands.get_nowait()
+      except queue.Empty:
+        break
+      if command is not None:
+        command[0].set_exception(RuntimeError("Camera stopped"))
+
+    if self.picam2 is not None:
+      try:
+        # Also frees the camera when startup failed half way, so it can be opened again
+        self.picam2.close()
+      except Exception as e:
+        logging.error(f"Failed to close camera: {e}")
@@ -1,208 +1,460 @@
-import os, time, logging, cv2
+import os, time, logging
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from motors import Motors  
-from process_image import extract_color_channels, circular_roi_mean, detect_static_noise
-
-def capture_raw_image(picam2):
-    """Capture a raw Bayer image and return it as a 16-bit 2D array."""
+from scan_planner import cached_plan, is_planned
+from capture_pipeline import CapturePipeline
+from exposure import top_fraction_stats, solve_exposure, wait_for_exposure
+from exposure_cache import ExposureCache
+from hdr import DEFAULT_BRACKET_US, capture_bracket, merge_bracket
+from bayer import DEFAULT_PATTERN, camera_pattern, bayer_planes, green_mean
+from process_image import screen_static_noise, crop_to_roi, ROI_WINDOW_HALF_SIZE
+from roi import DEFAULT_ROI, roi_extent, burst_results
+from accumulator import FrameAccumulator
+from frame_writer import FrameWriter
+from archive import MeasurementArchive, archive_path
+from measurement_store import MeasurementStore
+from journal import ScanJournal, journal_path
+
+# ROI-only mode: keep only a small Bayer-aligned window around the ROI right after capture, so dark correction,
+# averaging and ROI statistics run on the window. The noise check still runs on the full frame first
+# (on a subsampled 256x256 grid of it), since its thresholds are calibrated for full frames.
+ROI_ONLY = True
+# Save full frames as JPEG in ROI-only mode (the window is then cut after saving)
+SAVE_FULL_FRAMES = False
+# "adaptive": tune exposure per position, then average a burst of frames (values in counts)
+# "hdr": capture a fixed exposure bracket per position and merge it (values in counts per µs)
+CAPTURE_MODE = "adaptive"
+# Format of the saved frames: "archive" (one HDF5 file with raw frames and metadata, for reprocessing),
+# "raw" 16-bit TIFFs, "jpeg" previews, or "none"
+SAVE_FORMAT = "archive"
+# Frames captured before their noise check runs once for all of them
+SCREEN_BATCH = 4
+
+def capture_raw_image(picam2, roi_only=False):
+    """Capture a raw Bayer image and return it as a 16-bit 2D array, or only the ROI window of it."""
     try:
         raw_array = picam2.capture_array("raw").view(np.uint16)
+        if roi_only:
+            return crop_to_roi(raw_array)
         return raw_array
 
     except Exception as e:
         logging.error(f"Failed to capture RAW image: {e}")
         return None
 
-def check_and_adjust_exposure(picam2, image, target_min=818, target_max=921):
+def check_and_adjust_exposure(picam2, image, target_min=818, target_max=921, dark_level=0.0, pattern=DEFAULT_PATTERN):
     """
     Adjust exposure so that the mean of the top 5% brightest pixels in the dominant color channel
     falls within 80-90% of the 10-bit range (between 818 and 921).
+    The new exposure is solved from the linear sensor response, so one or two frames are usually enough.
     """
     if image is None or picam2 is None:
         logging.error("Invalid input to exposure check.")
         return False
 
-    # Extract RGB channels from image
-    R, G, B = extract_color_channels(image)
+    # Views of the color planes of the image
+    planes = bayer_planes(image, pattern)
 
-    # Identify dominant channel based on mean intensity
-    channel_means = {'R': np.mean(R), 'G': np.mean(G), 'B': np.mean(B)}
+    # Identify dominant channel based on mean intensity; the G plane is only built if it is needed
+    channel_means = {'R': np.mean(planes["R"]), 'G': (np.mean(planes["G1"]) + np.mean(planes["G2"])) / 2, 'B': np.mean(planes["B"])}
     dominant = max(channel_means, key=channel_means.get)
-    channel_data = {'R': R, 'G': G, 'B': B}[dominant]
+    channel_data = green_mean(planes["G1"], planes["G2"]) if dominant == 'G' else planes[dominant]
 
     logging.info(f"Dominant channel: {dominant}")
 
     # Evaluate top 5% brightest pixels
-    flat = channel_data.flatten()
-    cutoff = int(len(flat) * 0.05)
-    top_pixels = np.sort(flat)[-cutoff:]
-    top_mean = np.mean(top_pixels)
-    top_median = np.median(top_pixels)
-    logging.info(f"Top 5% mean: {top_mean:.2f}, median: {top_median:.2f}")
-
-    # Get current exposure from metadata
-    metadata = picam2.capture_metadata()
-    current_exp = metadata.get("ExposureTime", 10000)
+    top_mean, top_median, saturated = top_fraction_stats(channel_data, fraction=0.05)
+    logging.info(f"Top 5% mean: {top_mean:.2f}, median: {top_median:.2f}, saturated: {saturated:.0%}")
 
     # Stop if already within target range
     if target_min <= top_mean <= target_max:
         logging.info("Exposure is acceptable.\n")
         return True
-    
-    # Calculate difference between top_mean and target midpoint
+
+    # Get current exposure from metadata
+    metadata = picam2.capture_metadata()
+    current_exp = metadata.get("ExposureTime", 10000)
+
+    # Jump straight to the exposure that should hit the target midpoint
     target_mid = (target_min + target_max) / 2
-    diff_ratio = (top_mean - target_mid) / target_mid  # How far off the image is from target
-    scaling_factor = 0.1  # 10% change per unit deviation
-    base_step = max(100, int(current_exp * scaling_factor * abs(diff_ratio)))
-
-    # Adjust exposure adaptively
-    if top_mean > target_max:
-        new_exp = max(current_exp - base_step, 100)
-        logging.info(f"Too bright → Decreasing exposure by {base_step} µs")
-    else:
-        new_exp = current_exp + base_step
-        logging.info(f"Too dark → Increasing exposure by {base_step} µs")
+    new_exp = solve_exposure(current_exp, top_mean, target_mid, dark_level, saturated)
+    if new_exp == current_exp:
+        logging.warning(f"Exposure limit reached at {current_exp} µs")
+        return False
 
     logging.info(f"Adjusting exposure: {current_exp} → {new_exp}")
     picam2.set_controls({"ExposureTime": int(new_exp)})
-    time.sleep(1)  # Let settings apply
-    current_exp = metadata.get("ExposureTime", 10000)
+    current_exp = wait_for_exposure(picam2, new_exp)  # Let settings apply
     logging.info(f"Actual exposure time from metadata: {current_exp}")
 
     return False
 
-def run_full_measurement(app, image_count=10, save_dir="Captured_Data"):
-    """Main function to run the full measurement process."""
+def run_full_measurement(app, image_count=10, save_dir="Captured_Data", roi_only=ROI_ONLY, save_full_frames=SAVE_FULL_FRAMES):
+    """Main function to run the full measurement process. Returns True if the measurement ran to completion."""
     picam2 = app.camera
     dark_value = app.dark_value
 
     # Basic checks
     if picam2 is None or dark_value is None:
         app.set_status("Camera or dark value not set.", "error")
-        return
-
-    os.makedirs(save_dir, exist_ok=True)
+        return False
 
     # Load angle configurationd from the app
     light_radial_angles = app.light_radial_angles       
     light_azimuth_angles = app.incidence_angles         
     det_azimuth_angles = app.det_azimuth_angles         
     det_radial_angles = app.det_radial_angles           
+    sample_name = getattr(app, "sample_name", "default")
+    capture_mode = getattr(app, "capture_mode", CAPTURE_MODE)
+    logging.info(f"Capture mode: {capture_mode}")
+
+    # ROI for the BSDF values; ROI-only mode needs it to fit into the window cut around the centre
+    roi = getattr(app, "roi", DEFAULT_ROI)
+    pattern = camera_pattern(picam2)
+    logging.info(f"Bayer pattern: {pattern}")
+    if roi_only and roi_extent(roi) >= ROI_WINDOW_HALF_SIZE:
+        logging.warning(f"ROI {roi} does not fit the ROI-only window, capturing full frames.")
+        roi_only = False
+
+    # Results on the full angle grid
+    app.measurements = MeasurementStore.from_app(app)
+
+    # Visit positions in the order planned to minimise motor travel, usually already planned while step 5 was shown
+    if not is_planned(light_radial_angles, light_azimuth_angles, det_azimuth_angles, det_radial_angles):
+        app.set_status("Planning scan order...", "info")
+    visits = cached_plan(light_radial_angles, light_azimuth_angles, det_azimuth_angles, det_radial_angles).visits
+
+    # Every completed position goes to an on-disk journal, so a crashed or stopped scan can be resumed
+    journal = ScanJournal(journal_path(sample_name))
+    header = {
+        "sample_name": sample_name, "capture_mode": capture_mode, "pattern": pattern, "roi": repr(roi),
+        "dark_value": float(dark_value), "image_count": image_count,
+        "light_radial_angles": [float(a) for a in light_radial_angles], "incidence_angles": [float(a) for a in light_azimuth_angles],
+        "det_azimuth_angles": [float(a) for a in det_azimuth_angles], "det_radial_angles": [float(a) for a in det_radial_angles],
+    }
+    # Frames of a resumed scan go to the archive it was started with
+    save_format = getattr(app, "save_format", SAVE_FORMAT)
+    if save_format == "archive":
+        header["archive"] = archive_path(save_dir, sample_name)
+    # Set when the user moved all axes back to the home position by hand
+    motors_homed = getattr(app, "motors_homed", False)
+    motor_positions = None
+    if getattr(app, "resume", False):
+        if not journal.load():
+            app.set_status(f"No scan of '{sample_name}' to resume.", "error")
+            return False
+        changed = journal.mismatches(header)
+        if changed:
+            app.set_status(f"Cannot resume: {', '.join(changed)} changed since the scan was started.", "error")
+            return False
+
+        # Completed positions are kept, the rest of the plan is visited in the planned order
+        completed = journal.restore(app.measurements)
+        visits = [geometry for geometry in visits if tuple(float(angle) for angle in geometry) not in completed]
+        # A new connection needs the position: from the last confirmed move, or the home position after re-homing
+        motor_positions = journal.motors
+        if motor_positions is None and not motors_homed and getattr(app, "motors", None) is None:
+            app.set_status("Cannot resume: the scan was interrupted during a motor move, so the motor position is unknown. "
+                           "Move all axes to the home position and resume with 'Motors at home' ticked.", "error")
+            return False
+        journal.resume()
+        header["archive"] = journal.header.get("archive", header.get("archive"))
+        logging.info(f"Resuming scan: {len(completed)} positions restored, {len(visits)} to go")
+    else:
+        journal.start(header)
+
+    # After a restart the motors are where the last finished move left them
+    motors = get_motors(app, None if motors_homed else motor_positions)
+    if motors_homed:
+        motors.reset_position()
+
+    # Frames are captured on a separate thread while the previous frames are processed
+    # In ROI-only mode the window is cut right after the full-frame noise check, unless full frames are saved
+    crop_on_capture = roi_only and not save_full_frames
+    pipeline = CapturePipeline(lambda: capture_raw_image(picam2), stop_check=lambda: check_stop(app),
+                               screen=lambda frames: screen_frames(frames, crop_on_capture),
+                               screen_batch=SCREEN_BATCH).start()
+    # Converged exposures of earlier scans of the same sample seed the exposure search
+    exposure_cache = ExposureCache(exposure_cache_path(sample_name))
+    # Frames are encoded and written to disk on background threads
+    archive = None
+    if save_format == "archive":
+        # Everything needed to reprocess the raw frames later; a resumed scan appends to its archive
+        archive = MeasurementArchive(header["archive"], "a", attributes={
+            "capture_mode": capture_mode, "dark_value": float(dark_value), "pattern": pattern,
+            "roi": repr(roi), "roi_only": roi_only, "image_count": image_count,
+            "dark_library": getattr(getattr(app, "dark_library", None), "path", ""),
+            "light_radial_angles": list(light_radial_angles), "incidence_angles": list(light_azimuth_angles),
+            "det_azimuth_angles": list(det_azimuth_angles), "det_radial_angles": list(det_radial_angles),
+        })
+        logging.info(f"Saving raw frames to {archive.path} ({archive.frame_count} frames already stored)")
+    writer = FrameWriter(save_dir, save_format, archive=archive).start()
+
+    with journal:
+        try:
+            scan_positions(app, motors, pipeline, writer, journal, visits, exposure_cache, image_count, dark_value, roi_only, capture_mode, roi, pattern)
+        finally:
+            pipeline.stop()
+            writer.stop()
+            exposure_cache.save()
+            logging.info(f"Frame writer: {writer.written} frames written, {writer.dropped} dropped, "
+                         f"{writer.waited} waited ({writer.stalled:.1f} s stalled on a full queue), "
+                         f"{writer.failed} failed, queue depth up to {writer.max_depth}")
+            logging.info(f"Capture pipeline: {pipeline.captured} frames captured, {pipeline.dropped} dropped, "
+                         f"{pipeline.rejected} rejected, {pipeline.failed} failed")
+
+        if check_stop(app): return False
+
+        # Journaled like the scan moves, so a restart knows where the motors are
+        offsets = {"DET_AZ": motors.detector_az_offset, "DET_RAD": motors.detector_rad_offset,
+                   "LIGHT_AZ": motors.light_az_offset, "LIGHT_RAD": motors.light_rad_offset}
+        journal.record_move(offsets)
+        motors.move_detector_to_offset()
+        motors.move_light_to_offset()
+        journal.record_arrival(offsets)
 
-    motors = Motors()
-    motors.reset_position()
-
-    app.bsdf_measurements = {}  
-    app.relative_errors = {}
-
-    capture_index = 1 # Counter for process
-
-    # Scan through all angle combinations
-    for light_rad in light_radial_angles:  
-        if check_stop(app): return
-        motors.move_light_radial(light_rad)
-
-        for light_az in light_azimuth_angles:  
-            if check_stop(app): return
-            motors.move_light_azimuthal(light_az)
-
-            for det_az in det_azimuth_angles:
-                if check_stop(app): return
-                motors.move_detector_azimuthal(det_az)
-
-                for det_rad in det_radial_angles:
-                    if check_stop(app): return
-
-                    # Skip blocked positions
-                    if abs(light_az - det_az) < 2.0 and abs(light_rad - det_rad) < 2.0:
-                        logging.warning(f"Skipping blocked configuration at LS({light_az}, {light_rad}) ≈ DET({det_az}, {det_rad})\n")
-                        continue
-                    
-                    motors.move_detector_radial(det_rad)
-                    time.sleep(1)
-
-                    # Show current measurement status
-                    app.set_status(f"Capturing at LS ({light_rad}, {light_az}) → DET ({det_az}, {det_rad})", "info")
-
-                    corrected_images = []
-
-                    # Exposure adjustment
-                    for attempt in range(image_count):
-                        if check_stop(app): return
-                        test_image = capture_raw_image(picam2)
-                        if test_image is None:
-                            continue
-                        if check_and_adjust_exposure(picam2, test_image):
-                            break
-                    else:
-                        logging.warning("Exposure tuning failed, skipping this position.\n")
-                        continue
-                    
-                    # Capture valid images
-                    valid_count = 0 # How many good images are collected
-                    attempts = 0
-
-                    # Loop continues until desired number of valid images are captured/reached attempt limit
-                    while valid_count < image_count and attempts < image_count:
-                        if check_stop(app): return
-                        img = capture_raw_image(picam2)
-                        attempts += 1
-
-                        if img is None:
-                            logging.error(f"Attempt {attempts}: Image capture failed.")
-                            continue
-
-                        if detect_static_noise(img):
-                            logging.info(f"Attempt {attempts}: Image rejected due to static noise.\n")
-                            continue
-                        
-                        # Subtract dark value and clip negatives
-                        corrected = np.clip(img.astype(np.float32) - dark_value, 0, None)
-                        corrected_images.append(corrected)
-                        valid_count += 1
-
-                        # Save corrected image as JPG
-                        filename =  f"LS({light_rad}_{light_az})_DET({det_az}_{det_rad}).jpg"
-                        save_path = os.path.join(save_dir, filename)
-
-                        # Normalize to 8-bit for visualization
-                        normalized = cv2.normalize(corrected, None, 0, 255, cv2.NORM_MINMAX)
-                        normalized = normalized.astype(np.uint8)
-
-                        # Convert to 3-channel grayscale for consistent JPG
-                        three_channel = cv2.merge([normalized]*3)
-
-                        cv2.imwrite(save_path, three_channel)
-                    
-                    if len(corrected_images) < image_count:
-                        logging.warning(f"Warning: Only {len(corrected_images)} valid images collected (out of {image_count} required)\n")
-
-                    # Process and store result 
-                    if corrected_images:
-                        combined = np.mean(corrected_images, axis=0)
-                        R, G, B = extract_color_channels(combined)
-
-                        r_mean, r_err = circular_roi_mean(R)
-                        g_mean, g_err = circular_roi_mean(G)
-                        b_mean, b_err = circular_roi_mean(B)
-
-                        # Store error estimates
-                        app.relative_errors[(light_az, light_rad, det_az, det_rad)] = (r_err, g_err, b_err)
-                        logging.info(f"Rel. Errors - R: {r_err:.4f}, G: {g_err:.4f}, B: {b_err:.4f}")
-
-                        # Store final mean values for BSDF
-                        logging.info(f"ROI Mean Intensities - R: {r_mean:.2f}, G: {g_mean:.2f}, B: {b_mean:.2f}")
-                        key = (light_rad, light_az, det_az, det_rad)
-                        app.bsdf_measurements[key] = (r_mean, g_mean, b_mean)
-
-                    capture_index += 1
-
-            motors.move_detector_to_offset()
-            time.sleep(1)
-
-    motors.move_light_to_offset()
     app.set_status("Full measurement complete.", "success")
     logging.info("Full measurement complete.\n")
+    return True
+
+def scan_positions(app, motors, pipeline, writer, journal, visits, exposure_cache, image_count, dark_value, roi_only, capture_mode, roi, pattern):
+    """
+    Visit the given positions in order, capture images in the given mode and store the ROI results in the app.
+    Once the frames of a position are captured, the next move is commanded and the position is finished
+    (HDR merge, ROI statistics, storing and journaling) on a worker thread while the motors travel.
+    """
+    if not visits: return
+
+    # Running mean and variance of the frames of a position: one is filled while the worker finishes the other
+    bursts = [FrameAccumulator(), FrameAccumulator()]
+    pending = [None, None]
+
+    # A single worker finishes the positions one after another, so results are stored in plan order
+    with ThreadPoolExecutor(max_workers=1) as worker:
+        move = queue_move(motors, journal, visits[0])
+
+        for index, geometry in enumerate(visits):
+            light_rad, light_az, det_az, det_rad = geometry
+            if check_stop(app):
+                # Let the move in flight finish, so the journal ends on a known motor position
+                motors.wait_for_move(move)
+                journal.record_arrival(motor_targets(geometry))
+                return
+
+            # Finish of the position two visits back must be done before its accumulator is reused
+            slot = index % 2
+            if pending[slot] is not None:
+                pending[slot].result()
+            burst = bursts[slot]
+            burst.reset()
+
+            motors.wait_for_move(move)
+            journal.record_arrival(motor_targets(geometry))
+            started = time.time()
+
+            # Show current measurement status
+            app.set_status(f"Capturing at LS ({light_rad}, {light_az}) → DET ({det_az}, {det_rad})", "info")
+
+            if capture_mode == "hdr":
+                completed, merge, settings = capture_hdr_position(app, burst, writer, geometry, dark_value, roi_only)
+            else:
+                completed, merge, settings = capture_adaptive_position(app, pipeline, burst, writer, exposure_cache, geometry, image_count, dark_value, roi_only, pattern)
+
+            # Stop requested
+            if not completed: return
+
+            # The camera is done with this position: all axes that change travel together while the worker finishes it
+            if index + 1 < len(visits):
+                move = queue_move(motors, journal, visits[index + 1])
+            pending[slot] = worker.submit(finish_position, app, journal, burst, geometry, roi, pattern, merge, settings, started)
+
+        # Surface errors of the last positions
+        for future in pending:
+            if future is not None:
+                future.result()
+
+def motor_targets(geometry):
+    """Motor targets of a planned (light_rad, light_az, det_az, det_rad) position."""
+    return dict(zip(("LIGHT_RAD", "LIGHT_AZ", "DET_AZ", "DET_RAD"), geometry))
+
+def queue_move(motors, journal, geometry):
+    """Journal the move to a position, then command it. Returns the future of the move."""
+    targets = motor_targets(geometry)
+    journal.record_move(targets)
+    return motors.queue_move(targets)
+
+def finish_position(app, journal, burst, geometry, roi, pattern, merge=None, settings=None, started=None):
+    """
+    Worker thread: complete the burst with `merge` if given (HDR), then compute and store the ROI results
+    and append them to the journal with the (exposure, gain) `settings` and the capture start time.
+    Errors are shown on the status bar and raised again on the measurement thread.
+    """
+    light_rad, light_az, det_az, det_rad = geometry
+    try:
+        if merge is not None:
+            merge()
+
+        # Process and store result
+        if burst.count:
+            # R, G and B statistics inside the ROI from one gather of the averaged raw frame
+            # Spatial error from the pixel spread in the ROI, temporal error from the frame-to-frame noise
+            means, errors = burst_results(burst, roi, pattern)
+            r_err, g_err, b_err, r_terr, g_terr, b_terr = errors
+            logging.info(f"Rel. Errors - R: {r_err:.4f}, G: {g_err:.4f}, B: {b_err:.4f} "
+                         f"(temporal R: {r_terr:.4f}, G: {g_terr:.4f}, B: {b_terr:.4f})")
+            logging.info(f"ROI Mean Intensities - R: {means[0]:.2f}, G: {means[1]:.2f}, B: {means[2]:.2f}")
+
+            # Store final mean values for BSDF with their error estimates
+            app.measurements.store(geometry, means, errors)
+            exposure, gain = settings if settings is not None else (None, None)
+            journal.record_position(geometry, means, errors, exposure, gain, started)
+
+    except Exception as e:
+        logging.error(f"Processing failed at LS ({light_rad}, {light_az}) → DET ({det_az}, {det_rad}): {e}")
+        app.set_status(f"Processing failed at LS ({light_rad}, {light_az}) → DET ({det_az}, {det_rad}): {e}", "error")
+        raise
+
+def capture_adaptive_position(app, pipeline, burst, writer, exposure_cache, geometry, image_count, dark_value, roi_only, pattern):
+    """
+    Tune exposure at the current position, then capture a burst of valid, dark-corrected images into the accumulator.
+    Returns (completed, merge, (exposure, gain)) like capture_hdr_position: completed is False if a stop was requested,
+    and merge is always None, as the frames are already in the accumulator.
+    The accumulator stays empty and the settings are None if exposure tuning failed.
+    """
+    picam2 = app.camera
+    dark_library = getattr(app, "dark_library", None)
+    light_rad, light_az, det_az, det_rad = geometry
+
+    # Start the exposure search from the cached or interpolated exposure of this geometry
+    seed = exposure_cache.predict(geometry)
+    if seed is not None:
+        logging.info(f"Exposure seed from cache: {seed[0]} µs, gain {seed[1]:.2f}")
+        picam2.set_controls({"ExposureTime": seed[0], "AnalogueGain": seed[1]})
+        wait_for_exposure(picam2, seed[0])
+
+    # Exposure adjustment
+    exposure_start = time.monotonic()
+    for attempt in range(image_count):
+        if check_stop(app): return False, None, None
+        test_image = capture_raw_image(picam2, roi_only)
+        if test_image is None:
+            continue
+        if check_and_adjust_exposure(picam2, test_image, dark_level=dark_value, pattern=pattern):
+            break
+    else:
+        logging.warning(f"Exposure tuning failed after {image_count} frames "
+                        f"({time.monotonic() - exposure_start:.2f} s), skipping this position.\n")
+        return True, None, None
+
+    logging.info(f"Exposure converged after {attempt + 1} frames in {time.monotonic() - exposure_start:.2f} s")
+
+    metadata = picam2.capture_metadata()
+    exposure, gain = metadata.get("ExposureTime", 10000), metadata.get("AnalogueGain", 1.0)
+    exposure_cache.store(geometry, exposure, gain)
+
+    # Capture valid images: frames are captured and checked for static noise on the pipeline thread, corrected and saved here.
+    # Frames are processed one at a time and the accumulator copies them, so one buffer holds every corrected frame.
+    corrected = None
+
+    def process_frame(img, attempt, scores):
+        nonlocal corrected
+        if img is None:
+            logging.error(f"Attempt {attempt}: Image capture failed.")
+            return
+
+        if corrected is None or corrected.shape != img.shape:
+            corrected = np.empty(img.shape, dtype=np.float32)
+
+        # Subtract dark and clip negatives: the per-pixel master dark of this exposure if a dark library was captured
+        if dark_library is not None:
+            dark_library.correct(img, exposure, gain, out=corrected)
+        else:
+            np.subtract(img, dark_value, out=corrected, dtype=np.float32)
+            np.maximum(corrected, 0, out=corrected)
+
+        # Save the raw frame or a preview of the corrected frame in the background, one file or archive entry per attempt
+        writer.submit(img if writer.save_format in ("raw", "archive") else corrected,
+                      f"LS({light_rad}_{light_az})_DET({det_az}_{det_rad})_{attempt:02d}",
+                      geometry=geometry, attempt=attempt, exposure=exposure, gain=gain, scores=scores)
+
+        # Continue with the ROI window only (no-op if the frame was already cropped on capture)
+        burst.add(crop_to_roi(corrected) if roi_only else corrected)
+
+    # One attempt per requested image
+    if pipeline.capture_burst(image_count, process_frame): return False, None, None
+
+    if burst.count < image_count:
+        logging.warning(f"Warning: Only {burst.count} valid images collected (out of {image_count} required)\n")
+
+    return True, None, (exposure, gain)
+
+def capture_hdr_position(app, burst, writer, geometry, dark_value, roi_only, exposures=DEFAULT_BRACKET_US):
+    """
+    Capture a fixed exposure bracket at the current position. Returns (completed, merge, (exposures, gain)):
+    completed is False if a stop was requested, and merge (None if the capture failed) merges the bracket into
+    one radiance image in counts per microsecond and adds it to the accumulator; it runs on the worker thread.
+    """
+    picam2 = app.camera
+    dark_library = getattr(app, "dark_library", None)
+    light_rad, light_az, det_az, det_rad = geometry
+
+    if check_stop(app): return False, None, None
+    bracket = capture_bracket(picam2, exposures, lambda: capture_raw_image(picam2, roi_only))
+    if not bracket:
+        logging.warning("HDR bracket capture failed, skipping this position.\n")
+        return True, None, None
+    gain = picam2.capture_metadata().get("AnalogueGain", 1.0)
+
+    # Save the raw bracket frames in the background
+    name = f"LS({light_rad}_{light_az})_DET({det_az}_{det_rad})_HDR"
+    if writer.save_format in ("raw", "archive"):
+        for attempt, (frame, exposure) in enumerate(bracket, start=1):
+            writer.submit(frame, f"{name}_{int(exposure)}us", geometry=geometry, attempt=attempt, exposure=exposure, gain=gain)
+
+    def merge():
+        # Per-pixel master dark for every exposure of the bracket, if a dark library was captured
+        darks = None
+        if dark_library is not None:
+            darks = [dark_library.master(exposure, gain, frame.shape) for frame, exposure in bracket]
+
+        radiance = merge_bracket(bracket, dark_level=dark_value, darks=darks)
+
+        # Or a preview of the merged image
+        if writer.save_format not in ("raw", "archive"):
+            writer.submit(radiance, name)
+
+        burst.add(crop_to_roi(radiance) if roi_only else radiance)
+
+    return True, merge, ([float(exposure) for _, exposure in bracket], gain)
+
+def screen_frames(frames, crop):
+    """
+    Reject frames with static noise, checking a batch of frames at once; the check samples the full frame,
+    so the ROI window is only cut afterwards.
+    Returns (frames to keep or None, (variance, entropy) noise scores of every frame).
+    """
+    noisy, (variances, entropies) = screen_static_noise(frames)
+    kept = [None if reject else crop_to_roi(frame) if crop else frame for frame, reject in zip(frames, noisy)]
+    return kept, [(float(v), float(e)) for v, e in zip(variances, entropies)]
+
+def exposure_cache_path(sample_name, cache_dir="Exposure_Cache"):
+    """File holding the exposure cache of a sample."""
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in sample_name) or "default"
+    return os.path.join(cache_dir, f"{safe_name}.json")
+
+def get_motors(app, positions=None):
+    """
+    Return the motor connection of the app, opening it on first use. It stays open across measurements.
+    A new connection starts from the given last known axis angles, or from the home position.
+    """
+    if getattr(app, "motors", None) is None:
+        app.motors = Motors()
+        if positions is not None:
+            app.motors.set_position(positions)
+        else:
+            app.motors.reset_position()
+    return app.motors
 
 def check_stop(app):
     """Return True if the user has requested the measurement to stop."""
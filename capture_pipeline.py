@@ -0,0 +1,195 @@
+import threading, queue, logging
+import numpy as np
+
+# Marker put into the frame queue after the last frame of a burst
+END_OF_BURST = -1
+
+# Interval (s) at which a waiting burst checks that the pipeline threads are still running
+LIVENESS_CHECK_S = 0.5
+
+class FrameRingBuffer:
+    """Fixed set of preallocated uint16 frame slots handed between a producer and a consumer thread."""
+    def __init__(self, slots):
+        self.slot_count = slots
+        self.frames = None  # Allocated on the first frame, once the raw frame shape is known
+        self.info = [None] * slots  # Info passed along with the frame of each slot
+
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._filled = queue.Queue()
+
+    def write(self, image, tag, block=True, info=None):
+        """
+        Copy a frame into a free slot and queue it for the consumer together with a tag and optional info.
+        Blocks while all slots are in use (back-pressure), or returns False if block is False.
+        """
+        if self.frames is None or self.frames.shape[1:] != image.shape:
+            self.frames = np.empty((self.slot_count, *image.shape), dtype=np.uint16)
+
+        try:
+            slot = self._free.get(block=block)
+        except queue.Empty:
+            return False
+
+        np.copyto(self.frames[slot], image, casting="unsafe")
+        self.info[slot] = info
+        self._filled.put((slot, tag))
+        return True
+
+    def put_marker(self, tag):
+        """Queue a tag without frame data for the consumer."""
+        self._filled.put((None, tag))
+
+    def read(self, timeout=None):
+        """
+        Return the next (slot, tag). The frame is self.frames[slot] and its info self.info[slot] until release(slot);
+        slot is None for markers.
+        """
+        return self._filled.get(timeout=timeout)
+
+    def release(self, slot):
+        """Give a slot back to the producer."""
+        self._free.put(slot)
+
+# Captures raw frames on one thread while another thread processes them,
+# so the camera keeps exposing while frames are checked, corrected and saved.
+class CapturePipeline:
+    def __init__(self, capture, slots=4, drop_when_full=False, stop_check=None, screen=None, screen_batch=1):
+        self.capture = capture                  # Function returning one raw frame, or None on failure
+        # Function scoring a list of frames at once and returning (frames to keep, e.g. cropped, or None to reject, infos)
+        self.screen = screen
+        self.screen_batch = screen_batch        # Frames captured before they are screened together
+        self.ring = FrameRingBuffer(slots)
+        self.drop_when_full = drop_when_full    # Drop new frames instead of waiting for a free slot
+        self.stop_check = stop_check            # Function returning True when the user asked to stop
+
+        self.stop_requested = threading.Event()
+        self.captured = 0                       # Frames written into the ring buffer
+        self.dropped = 0                        # Frames lost because the ring buffer was full
+        self.failed = 0                         # Captures that returned no frame
+        self.rejected = 0                       # Frames rejected by the screen function
+
+        self._requests = queue.Queue()
+        self._burst_done = threading.Event()
+        self._process = None
+        self._error = None
+        self._threads = []
+
+    def start(self):
+        """Start the capture and processing threads."""
+        for target in (self._capture_loop, self._process_loop):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Stop both threads once the current burst is finished."""
+        self._requests.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def capture_burst(self, count, process):
+        """
+        Capture `count` frames and call process(frame, attempt, info) for each of them on the processing thread.
+        The frame is None if the capture failed, and is only valid during the call. Rejected frames are skipped.
+        `info` is what the screen function returned with the frame (e.g. noise scores), None without screening.
+        Returns True if the burst was cut short by a stop request.
+        """
+        self._process = process
+        self._error = None
+        self._burst_done.clear()
+        dropped_before = self.dropped
+
+        self._requests.put(count)
+        while not self._burst_done.wait(LIVENESS_CHECK_S):
+            if not all(thread.is_alive() for thread in self._threads):
+                raise RuntimeError("Capture pipeline stopped during a burst") from self._error
+
+        if self.dropped > dropped_before:
+            logging.warning(f"{self.dropped - dropped_before} frames dropped, processing could not keep up")
+        if self._error is not None:
+            raise self._error
+
+        return self.stop_requested.is_set()
+
+    def _capture_loop(self):
+        """Producer: capture the requested number of frames into the ring buffer."""
+        try:
+            self._capture_bursts()
+        except Exception as e:
+            logging.error(f"Frame capture failed: {e}")
+            self._error = e
+            self.ring.put_marker(None)  # Also stops the processing thread
+
+    def _capture_bursts(self):
+        while True:
+            count = self._requests.get()
+            if count is None:
+                self.ring.put_marker(None)
+                return
+
+            batch = []  # (attempt, frame) captured but not screened yet
+            for attempt in range(1, count + 1):
+                if self.stop_check is not None and self.stop_check():
+                    self.stop_requested.set()
+                    break
+
+                image = self.capture()
+                if image is None:
+                    self.failed += 1
+                batch.append((attempt, image))
+                if len(batch) >= self.screen_batch:
+                    self._queue_frames(batch)
+                    batch = []
+
+            self._queue_frames(batch)
+            self.ring.put_marker(END_OF_BURST)
+
+    def _queue_frames(self, batch):
+        """Screen a batch of (attempt, frame) on this thread, so rejected frames never take up a slot, and queue the rest."""
+        captured = [(attempt, image) for attempt, image in batch if image is not None]
+        kept, infos = [image for _, image in captured], [None] * len(captured)
+        if self.screen is not None and captured:
+            kept, infos = self.screen(kept)
+        screened = dict(zip((attempt for attempt, _ in captured), zip(kept, infos)))
+
+        # Queued in capture order; failed captures are passed on as markers
+        for attempt, image in batch:
+            if image is None:
+                self.ring.put_marker(attempt)
+                continue
+
+            image, info = screened[attempt]
+            if image is None:
+                self.rejected += 1
+                logging.info(f"Attempt {attempt}: Image rejected by screening.")
+            elif self.ring.write(image, attempt, block=not self.drop_when_full, info=info):
+                self.captured += 1
+            else:
+                self.dropped += 1
+
+    def _process_loop(self):
+        """Consumer: hand every captured frame to the processing function."""
+        while True:
+            slot, tag = self.ring.read()
+            if tag is None:
+                return
+
+            if tag == END_OF_BURST:
+                self._burst_done.set()
+                continue
+
+            try:
+                if self._error is None:
+                    if slot is None:
+                        self._process(None, tag, None)
+                    else:
+                        self._process(self.ring.frames[slot], tag, self.ring.info[slot])
+            except Exception as e:
+                logging.error(f"Frame processing failed: {e}")
+                self._error = e
+            finally:
+                if slot is not None:
+                    self.ring.release(slot)
@@ -0,0 +1,136 @@
+import os, json, time, logging
+import numpy as np
+from accumulator import FrameAccumulator
+from exposure import wait_for_exposure
+from process_image import crop_to_roi
+
+# Exposure times (µs) and gains at which master darks are taken
+# TODO: Change if necessary, the ladder should span the exposures used in measurements
+DARK_EXPOSURES_US = (100, 1000, 10000, 100000, 1000000)
+DARK_GAINS = (1.0,)
+DARK_FRAMES = 8                 # Frames averaged per master dark
+
+DARK_LIBRARY_PATH = os.path.join("Dark_Library", "dark_library.npz")
+
+# Averaged per-pixel dark frames over a ladder of exposure times and gains.
+# Darks for exposures in between are interpolated linearly, as dark current grows linearly with exposure time.
+class DarkLibrary:
+    def __init__(self, path=DARK_LIBRARY_PATH):
+        self.path = path
+        self.masters = {}       # (exposure, gain) -> float32 master dark
+        self.metadata = {}      # (exposure, gain) -> {"frames", "temperature", "timestamp"}
+        self._cache = {}        # (exposure, gain, shape) -> interpolated dark, for the current exposure
+
+    def capture(self, picam2, capture, exposures=DARK_EXPOSURES_US, gains=DARK_GAINS, frames=DARK_FRAMES, progress=None):
+        """
+        Capture the master darks with the light source off. `capture` returns one raw frame,
+        `progress(done, total)` is called after every master.
+        """
+        accumulator = FrameAccumulator()
+        ladder = [(exposure, gain) for gain in gains for exposure in exposures]
+
+        for done, (exposure, gain) in enumerate(ladder, start=1):
+            picam2.set_controls({"ExposureTime": int(exposure), "AnalogueGain": gain})
+            wait_for_exposure(picam2, exposure)
+
+            accumulator.reset()
+            while accumulator.count < frames:
+                frame = capture()
+                if frame is not None:
+                    accumulator.add(frame)
+
+            metadata = picam2.capture_metadata()
+            self.masters[(exposure, gain)] = accumulator.mean.copy()
+            self.metadata[(exposure, gain)] = {
+                "frames": frames,
+                "temperature": metadata.get("SensorTemperature"),
+                "timestamp": time.time(),
+            }
+            logging.info(f"Master dark at {exposure} µs, gain {gain}: mean {accumulator.mean.mean():.2f}")
+
+            if progress is not None:
+                progress(done, len(ladder))
+
+        self._cache = {}
+
+    def save(self):
+        """Write all masters and their metadata to one file. The file is replaced atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = sorted(self.masters)
+        metadata = [{"exposure": exposure, "gain": gain, **self.metadata[(exposure, gain)]} for exposure, gain in keys]
+
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, metadata=json.dumps(metadata), **{f"dark_{i}": self.masters[key] for i, key in enumerate(keys)})
+        os.replace(tmp_path, self.path)
+        logging.info(f"Dark library with {len(keys)} masters saved to {self.path}")
+
+    def load(self):
+        """Load the masters from disk. Returns False if there is no usable library file."""
+        if not os.path.exists(self.path):
+            return False
+
+        try:
+            with np.load(self.path) as data:
+                metadata = json.loads(str(data["metadata"]))
+                if not metadata:
+                    raise ValueError("no darks")
+                self.masters = {(entry["exposure"], entry["gain"]): data[f"dark_{i}"] for i, entry in enumerate(metadata)}
+            self.metadata = {(entry.pop("exposure"), entry.pop("gain")): entry for entry in metadata}
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read dark library {self.path}: {e}")
+            return False
+
+        self._cache = {}
+        oldest = min(entry["timestamp"] for entry in self.metadata.values())
+        logging.info(f"Loaded {len(self.masters)} master darks from {self.path} "
+                     f"(taken {time.strftime('%Y-%m-%d %H:%M', time.localtime(oldest))})")
+        return True
+
+    def black_level(self):
+        """Mean of the shortest-exposure master, the scalar dark value used where no per-pixel dark is needed."""
+        return float(self.masters[min(self.masters)].mean())
+
+    def master(self, exposure, gain=1.0, shape=None):
+        """
+        Per-pixel dark for an exposure and gain: linear interpolation between the two nearest exposures
+        of the nearest gain. With `shape` of a crop_to_roi window, the same window of the dark is returned.
+        """
+        key = (exposure, gain, shape)
+        if key not in self._cache:
+            self._cache = {key: self._interpolate(exposure, gain, shape)}  # Bursts share one exposure
+        return self._cache[key]
+
+    def correct(self, frame, exposure, gain=1.0, out=None):
+        """Subtract the dark from a frame and clip negatives, in float32. Writes into `out` if it is given."""
+        dark = self.master(exposure, gain, frame.shape)
+        out = np.subtract(frame, dark, out=out, dtype=np.float32)
+        np.maximum(out, 0, out=out)
+        return out
+
+    def _interpolate(self, exposure, gain, shape):
+        """Interpolated dark of the full frame, cut to a crop_to_roi window if `shape` is smaller."""
+        if not self.masters:
+            raise ValueError("Dark library is empty")
+
+        nearest_gain = min({g for _, g in self.masters}, key=lambda g: abs(g - gain))
+        ladder = sorted(e for e, g in self.masters if g == nearest_gain)
+
+        # Exposures outside the ladder use the nearest end
+        exposure = min(max(exposure, ladder[0]), ladder[-1])
+        upper = next(i for i, e in enumerate(ladder) if e >= exposure)
+        lower = max(upper - 1, 0)
+        low, high = self.masters[(ladder[lower], nearest_gain)], self.masters[(ladder[upper], nearest_gain)]
+
+        if shape is not None and shape != low.shape:
+            low, high = crop_to_roi(low), crop_to_roi(high)
+            if low.shape != shape:
+                raise ValueError(f"Dark library frames {self.masters[(ladder[lower], nearest_gain)].shape} do not match {shape}")
+
+        if upper == lower:
+            return low
+
+        weight = (exposure - ladder[lower]) / (ladder[upper] - ladder[lower])
+        dark = high - low
+        dark *= np.float32(weight)
+        dark += low
+        return dark
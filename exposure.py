@@ -0,0 +1,78 @@
+import time, logging
+import numpy as np
+
+# Sensor output range (10-bit raw)
+SENSOR_LEVELS = 1024
+SATURATION_LEVEL = SENSOR_LEVELS - 1
+
+# Exposure limits in microseconds
+MIN_EXPOSURE_US = 100
+MAX_EXPOSURE_US = 1_000_000
+
+# Largest exposure change per step; the linear model is not trusted beyond this
+MAX_STEP_FACTOR = 8.0
+# Exposure divisor when the brightest pixels are clipped and the true signal is unknown
+SATURATION_BACKOFF = 4.0
+# Top pixels at the saturation level above which the frame counts as clipped
+SATURATED_FRACTION = 0.1
+
+def top_fraction_stats(channel, fraction=0.05):
+    """
+    Mean, median and clipped share of the brightest `fraction` of pixels.
+    Integer (raw) data is evaluated from a 1024-bin histogram, other data with a partial sort.
+    """
+    flat = channel.ravel()
+    cutoff = max(1, int(flat.size * fraction))
+
+    if np.issubdtype(flat.dtype, np.integer):
+        # Histogram walked from the brightest bin down
+        counts = np.bincount(flat, minlength=SENSOR_LEVELS)[::-1]
+        values = np.arange(len(counts))[::-1]
+        cumulative = np.cumsum(counts)
+
+        # Full bins above the cutoff plus the part of the bin the cutoff falls into
+        last = int(np.searchsorted(cumulative, cutoff))
+        taken = counts[:last + 1].copy()
+        taken[last] -= cumulative[last] - cutoff
+        top_mean = float(np.dot(taken, values[:last + 1]) / cutoff)
+
+        # Median of the top pixels: middle ranks counted from the brightest pixel
+        middle = np.searchsorted(cumulative, [cutoff // 2, (cutoff - 1) // 2], side="right")
+        top_median = float(values[middle].mean())
+
+        saturated = min(int(counts[values >= SATURATION_LEVEL].sum()), cutoff) / cutoff
+    else:
+        top_pixels = np.partition(flat, flat.size - cutoff)[-cutoff:]
+        top_mean = float(np.mean(top_pixels))
+        top_median = float(np.median(top_pixels))
+        saturated = float(np.count_nonzero(top_pixels >= SATURATION_LEVEL)) / cutoff
+
+    return top_mean, top_median, saturated
+
+def solve_exposure(current_exp, top_mean, target, dark_level=0.0, saturated=0.0):
+    """
+    Exposure that brings `top_mean` to `target`, using the linear response of the sensor:
+    signal above the dark level is proportional to exposure time.
+    Clipped frames carry no usable signal level, so exposure is cut by a fixed factor instead.
+    """
+    if saturated > SATURATED_FRACTION:
+        factor = 1 / SATURATION_BACKOFF
+    else:
+        signal = top_mean - dark_level
+        factor = (target - dark_level) / signal if signal > 0 else MAX_STEP_FACTOR
+        factor = min(max(factor, 1 / MAX_STEP_FACTOR), MAX_STEP_FACTOR)
+
+    return int(min(max(current_exp * factor, MIN_EXPOSURE_US), MAX_EXPOSURE_US))
+
+def wait_for_exposure(picam2, exposure, timeout=2.0, tolerance=0.02):
+    """Wait until frame metadata reports the requested exposure, instead of sleeping a fixed time."""
+    deadline = time.monotonic() + timeout
+    actual = None
+    while time.monotonic() < deadline:
+        actual = picam2.capture_metadata().get("ExposureTime")
+        # The sensor rounds exposure to whole lines, so allow a small difference
+        if actual is not None and abs(actual - exposure) <= max(tolerance * exposure, 50):
+            return actual
+
+    logging.warning(f"Exposure {exposure} µs not confirmed by metadata within {timeout:.1f} s (last: {actual})")
+    return actual
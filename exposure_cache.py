@@ -0,0 +1,69 @@
+import os, json, logging
+import numpy as np
+
+# Neighbours used to predict the exposure of a new geometry
+NEIGHBOURS = 4
+
+# Converged exposure settings per scan geometry, used as the starting point for new positions.
+# BSDF varies smoothly with angle, so nearby geometries need nearly the same exposure.
+class ExposureCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}   # (light_rad, light_az, det_az, det_rad) -> (ExposureTime, AnalogueGain)
+        self._unsaved = 0
+        self.load()
+
+    def load(self):
+        """Load cached settings from disk, if the file exists."""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.entries = {tuple(entry["geometry"]): (entry["exposure"], entry["gain"]) for entry in data["entries"]}
+            logging.info(f"Loaded {len(self.entries)} cached exposures from {self.path}")
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Could not read exposure cache {self.path}: {e}")
+
+    def save(self):
+        """Write the cache to disk. The file is replaced atomically so a crash never leaves it half written."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        data = {"entries": [{"geometry": list(geometry), "exposure": exposure, "gain": gain}
+                            for geometry, (exposure, gain) in self.entries.items()]}
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def store(self, geometry, exposure, gain, save_every=20):
+        """Remember the converged settings of a geometry and save every few new entries."""
+        self.entries[tuple(geometry)] = (int(exposure), float(gain))
+        self._unsaved += 1
+        if self._unsaved >= save_every:
+            self.save()
+
+    def predict(self, geometry):
+        """
+        Starting exposure and gain for a geometry: the cached value if it was measured before,
+        otherwise an inverse-distance weighted mean (in log exposure) of the nearest cached geometries.
+        Returns None while the cache is empty.
+        """
+        geometry = tuple(geometry)
+        if geometry in self.entries:
+            return self.entries[geometry]
+        if not self.entries:
+            return None
+
+        geometries = np.array(list(self.entries.keys()), dtype=np.float64)
+        settings = np.array(list(self.entries.values()), dtype=np.float64)
+
+        distances = np.linalg.norm(geometries - np.array(geometry, dtype=np.float64), axis=1)
+        nearest = np.argsort(distances)[:NEIGHBOURS]
+        weights = 1 / distances[nearest]
+
+        exposure = np.exp(np.average(np.log(settings[nearest, 0]), weights=weights))
+        gain = np.average(settings[nearest, 1], weights=weights)
+        return int(round(exposure)), float(gain)
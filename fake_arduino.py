@@ -0,0 +1,215 @@
+import os, pty, tty, select, threading, queue, time, logging
+from motion_model import STEPS_PER_DEG, HOME_ANGLE, AXIS_PROFILES, profile_duration
+from motors import encode_frame, decode_frame, POSITION_AXES
+
+QUEUE_SIZE = 8  # Must match motors_arduino.ino
+
+# Stand-in for the motor controller Arduino on a pseudo-terminal.
+# Speaks the same framed protocol as motors_arduino.ino and takes as long as the real steppers would,
+# so Motors can be run and timed without the rig: Motors(port=FakeArduino().start().port)
+# With in_process=True there is no terminal and Motors talks to it through FakeSerial instead:
+# Motors(connection=FakeSerial(FakeArduino(in_process=True).start()))
+class FakeArduino:
+    def __init__(self, time_scale=1.0, in_process=False):
+        self.time_scale = time_scale  # < 1 to simulate faster than real time, 0 to skip travel time
+        self.in_process = in_process
+
+        if in_process:
+            # Replies are picked up by FakeSerial.readline()
+            self.port = None
+            self.replies = queue.Queue()
+        else:
+            # Pseudo-terminal pair: the Python side opens `port`, the fake reads and writes `master_fd`
+            self.master_fd, self.slave_fd = pty.openpty()
+            tty.setraw(self.slave_fd)
+            self.port = os.ttyname(self.slave_fd)
+
+        self.current_steps = {}
+        self.reset_position()
+
+        self.moving = False
+        self.move_queue = queue.Queue(QUEUE_SIZE)
+
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start answering commands and running queued moves in background threads."""
+        targets = (self._run_moves,) if self.in_process else (self._serve, self._run_moves)
+        for target in targets:
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self.send(0, "READY")
+        return self
+
+    def stop(self):
+        """Stop the background threads and close the pseudo-terminal."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        if not self.in_process:
+            os.close(self.master_fd)
+            os.close(self.slave_fd)
+
+    def angles(self):
+        """Current angle of every axis in degrees."""
+        return {axis: steps / STEPS_PER_DEG[axis] for axis, steps in self.current_steps.items()}
+
+    def reset_position(self):
+        """Set all axes to the home angle, like RESET on the firmware."""
+        self.current_steps = {axis: int(HOME_ANGLE * spd) for axis, spd in STEPS_PER_DEG.items()}
+
+    def handle_frame(self, line):
+        """Answer one received frame, like handle_frame() on the firmware."""
+        try:
+            seq, fields = decode_frame(line)
+        except ValueError as e:
+            seq_text = line[1:].split("*", 1)[0].split(",", 1)[0]
+            self.send(int(seq_text) if seq_text.isdigit() else 0, "ERR", "CHECKSUM" if str(e).startswith("Checksum") else "FORMAT")
+            return
+
+        command, args = fields[0], fields[1:]
+
+        if command == "PING":
+            self.send(seq, "OK")
+        elif command == "STATUS":
+            self.send(seq, "STATUS", "1" if self.moving else "0", str(self.move_queue.qsize()))
+        elif command == "POS":
+            angles = (self.current_steps[axis] / STEPS_PER_DEG[axis] for axis in POSITION_AXES)
+            self.send(seq, "POS", *(f"{angle:.2f}" for angle in angles))
+        elif command == "RESET":
+            if self.moving or not self.move_queue.empty():
+                self.send(seq, "ERR", "BUSY")
+                return
+            self.reset_position()
+            self.send(seq, "DONE")
+        elif command == "SET":
+            if self.moving or not self.move_queue.empty():
+                self.send(seq, "ERR", "BUSY")
+                return
+            try:
+                angles = {axis: float(angle) for axis, angle in (pair.split("=") for pair in args)}
+            except ValueError:
+                angles = {}
+            if not angles or not set(angles) <= set(STEPS_PER_DEG):
+                self.send(seq, "ERR", "FORMAT")
+                return
+            for axis, angle in angles.items():
+                self.current_steps[axis] = int(angle * STEPS_PER_DEG[axis])
+            self.send(seq, "DONE")
+        elif command == "MOVE":
+            try:
+                targets = {axis: float(angle) for axis, angle in (pair.split("=") for pair in args)}
+            except ValueError:
+                targets = {}
+            if not targets or not set(targets) <= set(STEPS_PER_DEG):
+                self.send(seq, "ERR", "FORMAT")
+                return
+            try:
+                self.move_queue.put_nowait((seq, targets))
+            except queue.Full:
+                self.send(seq, "ERR", "QUEUE_FULL")
+                return
+            self.send(seq, "ACK")
+        else:
+            self.send(seq, "ERR", "UNKNOWN")
+
+    def move(self, targets):
+        """Move all target axes in parallel, taking as long as the slowest axis would on the Arduino."""
+        target_steps = {axis: int(angle * STEPS_PER_DEG[axis]) for axis, angle in targets.items()}
+        move_steps = {axis: abs(steps - self.current_steps[axis]) for axis, steps in target_steps.items()}
+
+        travel_time = max(profile_duration(steps, *AXIS_PROFILES[axis]) for axis, steps in move_steps.items())
+        time.sleep(travel_time * self.time_scale)
+        self.current_steps.update(target_steps)
+
+    def send(self, seq, *fields):
+        """Write one frame terminated like Serial.println()."""
+        frame = encode_frame(seq, *fields).replace(b"\n", b"\r\n")
+        if self.in_process:
+            self.replies.put(frame)
+            return
+        with self._write_lock:
+            os.write(self.master_fd, frame)
+
+    def _run_moves(self):
+        """Execute queued moves one after another, like loop() on the firmware."""
+        while not self._stop.is_set():
+            try:
+                seq, targets = self.move_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            self.moving = True
+            self.move(targets)
+            self.moving = False
+            self.send(seq, "DONE")
+
+    def _serve(self):
+        """Read newline-terminated frames from the pseudo-terminal and answer them."""
+        buffer = b""
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                continue
+
+            try:
+                buffer += os.read(self.master_fd, 1024)
+            except OSError:
+                return # Terminal closed
+
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.decode(errors="replace").strip()
+                if not line:
+                    continue
+                logging.debug(f"Fake Arduino received: {line}")
+                self.handle_frame(line)
+
+# In-process replacement for serial.Serial connected to a FakeArduino, without a pseudo-terminal.
+# Offers the parts of the pyserial interface used by Motors.
+class FakeSerial:
+    def __init__(self, arduino, timeout=0.1):
+        self.arduino = arduino
+        self.timeout = timeout
+        self.is_open = True
+        self._buffer = b""
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        """Hand complete lines to the fake Arduino. Returns the number of bytes written."""
+        with self._lock:
+            self._buffer += data
+            while b"\n" in self._buffer:
+                line, self._buffer = self._buffer.split(b"\n", 1)
+                line = line.decode(errors="replace").strip()
+                if line:
+                    self.arduino.handle_frame(line)
+        return len(data)
+
+    def readline(self):
+        """Return the next reply line, or b"" after the timeout like pyserial."""
+        try:
+            return self.arduino.replies.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+    @property
+    def in_waiting(self):
+        return self.arduino.replies.qsize()
+
+    def close(self):
+        self.is_open = False
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(message)s")
+
+    fake = FakeArduino().start()
+    print(f"Fake Arduino listening on {fake.port} (Ctrl+C to quit)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,141 @@
+import time, threading
+import numpy as np
+from exposure import SATURATION_LEVEL
+from bayer import bayer_offsets, pattern_from_format
+
+# Sensor layout of the real camera (SRGGB10, see camera.py)
+SENSOR_SIZE = (1456, 1088)          # (width, height)
+DARK_LEVEL = 64.0                   # Black level in counts
+READ_NOISE = 0.5                    # Read noise in counts (1 sigma)
+NOISE_MARGIN = 256                  # Extra rows of the precomputed noise field, frames use a random window of it
+
+# Parametric BSDF used to generate frames: Lambertian base plus a Gaussian lobe around the specular direction.
+# The specular direction is taken at DET_AZ == LIGHT_RAD and DET_RAD == LIGHT_AZ (mirror geometry of the rig).
+class BSDFModel:
+    def __init__(self, diffuse=0.002, specular=2.0, lobe_width_deg=3.0, color=(1.0, 0.85, 0.6)):
+        self.diffuse = diffuse                  # Signal rate of the diffuse part (counts per µs at gain 1)
+        self.specular = specular                # Peak signal rate of the specular lobe
+        self.lobe_width_deg = lobe_width_deg    # 1-sigma width of the specular lobe
+        self.color = color                      # Relative response of the R, G and B pixels
+
+    def __call__(self, light_rad, light_az, det_az, det_rad):
+        """Signal rate in counts per µs at gain 1 for a geometry."""
+        distance = np.hypot(det_az - light_rad, det_rad - light_az)
+        return self.diffuse + self.specular * np.exp(-0.5 * (distance / self.lobe_width_deg) ** 2)
+
+# Stand-in for Picamera2 producing raw SRGGB10 frames of a light spot whose brightness follows a BSDFModel.
+# Offers the Picamera2 methods used in this project, so it can be used wherever app.camera is expected.
+class FakePicamera2:
+    def __init__(self, model=None, geometry=None, spot_radius=150.0, realtime=False, seed=0):
+        self.model = model or BSDFModel()
+        self.geometry = geometry            # Function returning the axis angles as a dict, e.g. FakeArduino.angles
+        self.spot_radius = spot_radius      # Radius of the light spot in sensor pixels
+        self.realtime = realtime            # Sleep for the exposure time of every frame like the sensor would
+
+        self.controls = {"ExposureTime": 10000, "AnalogueGain": 1.0}
+        self.frame_count = 0
+        self.config = None
+        self.started = False
+
+        self._pending = {}                  # Controls that take effect with the next frame
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._response = None               # Spot profile times color response per pixel
+        self._noise = None                  # Standard normal noise field, generated once per configuration
+
+    def create_still_configuration(self, raw=None, **kwargs):
+        """Return a configuration like Picamera2 does, with the raw stream format and size."""
+        raw = dict(raw or {})
+        raw.setdefault("format", "SRGGB10")
+        raw.setdefault("size", SENSOR_SIZE)
+        return {"raw": raw, **kwargs}
+
+    def configure(self, config):
+        """Apply a configuration. The spot image and noise field are rebuilt for the raw size."""
+        self.config = config
+        width, height = config["raw"]["size"]
+
+        # Flat-topped spot with soft edges at the frame centre
+        y, x = np.ogrid[:height, :width]
+        r2 = ((x - width / 2) ** 2 + (y - height / 2) ** 2) / self.spot_radius ** 2
+        spot = np.exp(-r2 ** 2).astype(np.float32)
+
+        # Color response per pixel of the Bayer pattern of the raw format
+        channel_gain = dict(zip(("R", "G1", "G2", "B"), np.array(self.model.color)[[0, 1, 1, 2]]))
+        cfa_gain = np.empty((height, width), dtype=np.float32)
+        for name, (row, col) in bayer_offsets(pattern_from_format(config["raw"]["format"])).items():
+            cfa_gain[row::2, col::2] = channel_gain[name]
+        self._response = spot * cfa_gain
+
+        # Drawing fresh noise for every frame would dominate the capture time, so frames take shifted windows of one field
+        self._noise = self._rng.standard_normal((height + NOISE_MARGIN, width), dtype=np.float32)
+
+    def start(self):
+        if self.config is None:
+            self.configure(self.create_still_configuration())
+        self.started = True
+
+    def stop(self):
+        self.started = False
+
+    def close(self):
+        self.stop()
+
+    def camera_configuration(self):
+        """Return the active configuration, including the raw stride in bytes."""
+        width, height = self.config["raw"]["size"]
+        return {**self.config, "raw": {**self.config["raw"], "stride": 2 * width}}
+
+    def set_controls(self, controls):
+        """Queue controls; like the real sensor they apply from the next frame on."""
+        with self._lock:
+            self._pending.update(controls)
+
+    def capture_metadata(self):
+        """Metadata of the next frame."""
+        with self._lock:
+            self._next_frame()
+            return self._metadata()
+
+    def capture_array(self, name="main"):
+        """Capture one frame. The "raw" stream is returned as bytes (uint8) like Picamera2, 2 bytes per pixel."""
+        if not self.started:
+            raise RuntimeError("Camera not started")
+
+        with self._lock:
+            self._next_frame()
+            exposure = self.controls["ExposureTime"]
+            gain = self.controls["AnalogueGain"]
+
+        if self.realtime:
+            time.sleep(exposure / 1e6)
+
+        frame = self._render(exposure, gain)
+        if name == "raw":
+            return frame.view(np.uint8)
+        return frame
+
+    def _next_frame(self):
+        """Start a new frame: pending controls take effect now."""
+        self.frame_count += 1
+        self.controls.update(self._pending)
+        self._pending = {}
+
+    def _metadata(self):
+        return {
+            "ExposureTime": int(self.controls["ExposureTime"]),
+            "AnalogueGain": float(self.controls["AnalogueGain"]),
+            "FrameCount": self.frame_count,
+        }
+
+    def _render(self, exposure, gain):
+        """Generate one 10-bit raw frame: dark level + spot signal with shot and read noise, clipped to 10 bits."""
+        angles = self.geometry() if self.geometry is not None else {}
+        rate = self.model(angles.get("LIGHT_RAD", 0.0), angles.get("LIGHT_AZ", 0.0),
+                          angles.get("DET_AZ", 0.0), angles.get("DET_RAD", 0.0))
+
+        signal = self._response * np.float32(rate * exposure)
+        offset = self._rng.integers(NOISE_MARGIN)
+        noise = self._noise[offset:offset + signal.shape[0]] * np.sqrt(signal + np.float32(READ_NOISE ** 2))
+        counts = np.clip((signal + noise) * np.float32(gain) + np.float32(DARK_LEVEL), 0, SATURATION_LEVEL)
+        return np.rint(counts).astype(np.uint16)
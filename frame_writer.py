@@ -0,0 +1,118 @@
+import os, time, queue, threading, logging, cv2
+import numpy as np
+
+# "archive": raw frames with their metadata in one HDF5 measurement archive (see archive.py),
+# "raw": lossless 16-bit TIFF per raw frame, "jpeg": 8-bit single-channel preview, "none": nothing is written
+SAVE_FORMATS = ("archive", "raw", "jpeg", "none")
+EXTENSIONS = {"raw": ".tiff", "jpeg": ".jpg"}
+
+# Writes frames to disk on background threads, so encoding and SD card writes run alongside capture.
+# The queue is bounded: when the writers fall behind, preview and image files are dropped instead of blocking.
+# Archive frames are the measurement record, so for them submit() waits for room instead (back-pressure):
+# a disk slower than capture then stalls frame processing and, once the ring buffer is full, capture itself.
+# The time spent waiting is counted in `stalled`.
+class FrameWriter:
+    def __init__(self, save_dir, save_format="jpeg", workers=2, queue_size=8, archive=None):
+        if save_format not in SAVE_FORMATS:
+            raise ValueError(f"Unknown save format: {save_format!r}")
+        if (save_format == "archive") != (archive is not None):
+            raise ValueError("The archive format needs a MeasurementArchive, and only that format uses one")
+
+        self.save_dir = save_dir
+        self.save_format = save_format
+        self.archive = archive      # Written by a single thread, HDF5 files must not be written concurrently
+        self.written = 0            # Frames written
+        self.dropped = 0            # Frames not written because the queue was full
+        self.waited = 0             # Archive frames that had to wait for room in the queue
+        self.stalled = 0.0          # Seconds submit() spent waiting for room
+        self.failed = 0             # Frames that could not be written
+        self.max_depth = 0          # Highest number of frames waiting
+
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        workers = 1 if archive is not None else workers
+        self._threads = [threading.Thread(target=self._write_loop, daemon=True) for _ in range(workers)]
+
+    def start(self):
+        """Start the writer threads."""
+        os.makedirs(self.save_dir, exist_ok=True)
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Write the frames still waiting, then stop the writer threads and close the archive."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self.archive is not None:
+            self.archive.close()
+
+    @property
+    def enabled(self):
+        return self.save_format != "none"
+
+    @property
+    def depth(self):
+        """Frames waiting to be written."""
+        return self._queue.qsize()
+
+    def submit(self, frame, name, **metadata):
+        """
+        Queue a copy of a frame to be written as `name` plus the extension of the format.
+        In the archive format the frame is appended to the archive with `metadata` (geometry, exposure, ...) instead.
+        Returns False if nothing is written (format "none" or queue full). Archive frames are never dropped,
+        the call blocks until the writer has room, and the time it waits is added to `stalled`.
+        """
+        if not self.enabled:
+            return False
+
+        item = (np.array(frame, copy=True), name, metadata)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self.archive is not None:
+                start = time.perf_counter()
+                self._queue.put(item)
+                with self._lock:
+                    self.waited += 1
+                    self.stalled += time.perf_counter() - start
+            else:
+                with self._lock:
+                    self.dropped += 1
+                logging.warning(f"Frame writer queue full, {name} not saved")
+                return False
+
+        with self._lock:
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def encode(self, frame):
+        """Image to write for a frame in the selected format."""
+        if self.save_format in ("raw", "archive"):
+            return frame if frame.dtype == np.uint16 else np.clip(np.rint(frame), 0, 65535).astype(np.uint16)
+
+        # Normalize to 8-bit for visualization
+        return cv2.normalize(frame, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    def _write_loop(self):
+        """Writer thread: encode and write queued frames until stopped."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            frame, name, metadata = item
+            path = self.archive.path if self.archive is not None else os.path.join(self.save_dir, name + EXTENSIONS[self.save_format])
+            try:
+                if self.archive is not None:
+                    self.archive.append(self.encode(frame), **metadata)
+                elif not cv2.imwrite(path, self.encode(frame)):
+                    raise OSError(f"cv2.imwrite returned False for {path}")
+                with self._lock:
+                    self.written += 1
+            except Exception as e:
+                logging.error(f"Failed to save {name} to {path}: {e}")
+                with self._lock:
+                    self.failed += 1
@@ -0,0 +1,57 @@
+import logging
+import numpy as np
+from exposure import SATURATION_LEVEL, wait_for_exposure
+
+# Exposure bracket in microseconds, 4x apart so neighbouring frames overlap in usable range
+# TODO: Change if necessary depending on light source power and sample reflectance
+DEFAULT_BRACKET_US = (250, 1000, 4000, 16000, 64000, 256000)
+
+# Pixels at or above this level are treated as clipped
+CLIP_LEVEL = 0.95 * SATURATION_LEVEL
+# Pixels less than this above the dark level carry no usable signal
+NOISE_FLOOR = 4.0
+
+def capture_bracket(picam2, exposures, capture):
+    """Capture one frame per exposure. Returns a list of (frame, actual exposure) pairs."""
+    bracket = []
+    for exposure in exposures:
+        picam2.set_controls({"ExposureTime": int(exposure)})
+        actual = wait_for_exposure(picam2, exposure) or exposure
+
+        frame = capture()
+        if frame is None:
+            logging.error(f"HDR capture failed at {exposure} µs")
+            continue
+        bracket.append((frame, actual))
+
+    return bracket
+
+def merge_bracket(bracket, dark_level=0.0, darks=None):
+    """
+    Merge a bracket into one radiance image in counts per microsecond.
+    The dark is `dark_level`, or the per-pixel dark of every frame if `darks` is given.
+    Each pixel uses only the frames where it is neither clipped nor lost in the noise floor;
+    with photon noise the best estimate is then sum(signal) / sum(exposure time) over those frames.
+    Pixels that are clipped in every frame fall back to the shortest exposure.
+    """
+    signal_sum = np.zeros(bracket[0][0].shape, dtype=np.float32)
+    time_sum = np.zeros(bracket[0][0].shape, dtype=np.float32)
+
+    darks = darks if darks is not None else [dark_level] * len(bracket)
+    for (frame, exposure), dark in zip(bracket, darks):
+        signal = frame.astype(np.float32) - dark
+        valid = (frame < CLIP_LEVEL) & (signal > NOISE_FLOOR)
+        signal_sum += np.where(valid, signal, 0)
+        time_sum += np.where(valid, exposure, 0)
+
+    # Fallback for pixels without any valid frame
+    shortest = min(range(len(bracket)), key=lambda i: bracket[i][1])
+    shortest_frame, shortest_exposure = bracket[shortest]
+    fallback = np.clip(shortest_frame.astype(np.float32) - darks[shortest], 0, None) / shortest_exposure
+
+    covered = time_sum > 0
+    clipped = np.count_nonzero(~covered & (shortest_frame >= CLIP_LEVEL))
+    if clipped:
+        logging.warning(f"HDR merge: {clipped} pixels clipped even at {shortest_exposure} µs")
+
+    return np.where(covered, signal_sum / np.maximum(time_sum, 1), fallback)
@@ -0,0 +1,151 @@
+import os, json, time, argparse, threading, logging
+from measurement_store import MeasurementStore
+from output_data import save_results
+
+# Angle lists of the scan grid in the journal header, in the order of the MeasurementStore axes
+ANGLE_LISTS = ("light_radial_angles", "incidence_angles", "det_azimuth_angles", "det_radial_angles")
+# Header entries that must be unchanged to resume a scan, so old and new positions are comparable
+RESUME_KEYS = ANGLE_LISTS + ("capture_mode", "pattern", "roi")
+
+def journal_path(sample_name, journal_dir="Scan_Journal"):
+    """File holding the scan journal of a sample."""
+    safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in sample_name) or "default"
+    return os.path.join(journal_dir, f"{safe_name}.jsonl")
+
+# Append-only on-disk log of a scan, one JSON record per line: a header with the scan settings,
+# then every completed position (geometry, R/G/B means, errors, exposure, timing) and every motor move.
+# Each record is flushed and fsynced before the call returns, so after a crash or power loss
+# the journal holds everything that finished, and at worst a torn last line, which is ignored.
+class ScanJournal:
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.positions = {}     # (light_rad, light_az, det_az, det_rad) -> position record
+        self.motors = None      # Axis -> angle after the last finished move, None while a move is in flight
+        self._file = None
+        self._valid_size = 0    # Bytes up to the end of the last complete record
+        self._lock = threading.Lock()  # Positions are recorded on the worker thread, moves on the measurement thread
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self):
+        """Read the journal from disk. Returns False if there is no usable journal."""
+        if not os.path.exists(self.path):
+            return False
+
+        self.header, self.positions, self.motors, self._valid_size = None, {}, None, 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("incomplete line")
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(f"Journal {self.path}: ignoring torn record at byte {self._valid_size}")
+                    break
+                self._valid_size += len(line)
+                self._apply(record)
+
+        if self.header is None:
+            logging.warning(f"Journal {self.path} has no header")
+            return False
+        logging.info(f"Loaded journal {self.path}: {len(self.positions)} completed positions")
+        return True
+
+    def mismatches(self, header):
+        """Names of the resume settings that differ between the journal and a new header."""
+        return [key for key in RESUME_KEYS if self.header.get(key) != header.get(key)]
+
+    def start(self, header):
+        """Start a new journal with the settings of the scan. An earlier journal is kept under a timestamped name."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path):
+            # It may be the only record of a crashed scan that was not resumed
+            stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(os.path.getmtime(self.path)))
+            kept = f"{os.path.splitext(self.path)[0]}_{stamp}.jsonl"
+            os.replace(self.path, kept)
+            logging.info(f"Previous scan journal kept as {kept}")
+        self.header, self.positions, self.motors, self._valid_size = header, {}, None, 0
+        self._file = open(self.path, "w")
+        self._write({"header": header})
+
+    def resume(self):
+        """Continue appending to a loaded journal; a torn last record is cut off first."""
+        self._file = open(self.path, "r+")
+        self._file.truncate(self._valid_size)
+        self._file.seek(self._valid_size)
+
+    def record_position(self, geometry, values, errors, exposure=None, gain=None, started=None):
+        """Append a completed position. `exposure` is the exposure time (µs) or the HDR bracket."""
+        self._write({"position": [float(angle) for angle in geometry],
+                     "values": [float(value) for value in values],
+                     "errors": [float(error) for error in errors],
+                     "exposure": exposure, "gain": gain,
+                     "started": started, "finished": time.time()})
+
+    def record_move(self, targets):
+        """Append a motor move before it is commanded: until it is recorded as finished the position is unknown."""
+        self._write({"move": {axis: float(angle) for axis, angle in targets.items()}})
+
+    def record_arrival(self, targets):
+        """Append the end of a motor move."""
+        self._write({"arrived": {axis: float(angle) for axis, angle in targets.items()}})
+
+    def restore(self, store):
+        """Store all journaled positions in a MeasurementStore. Returns the geometries restored."""
+        for geometry, record in self.positions.items():
+            store.store(geometry, record["values"], record["errors"])
+        return set(self.positions)
+
+    def to_store(self):
+        """MeasurementStore with the journaled positions on the grid of the header."""
+        store = MeasurementStore(*(self.header[name] for name in ANGLE_LISTS))
+        self.restore(store)
+        return store
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        """Append one record and force it to disk."""
+        line = json.dumps(record) + "\n"  # ASCII only, so characters are bytes
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._valid_size += len(line)
+            self._apply(record)
+
+    def _apply(self, record):
+        """Update the in-memory state with a record."""
+        if "header" in record:
+            self.header = record["header"]
+        elif "position" in record:
+            self.positions[tuple(record["position"])] = record
+        elif "move" in record:
+            self.motors = None
+        elif "arrived" in record:
+            self.motors = record["arrived"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the positions completed so far of a (running or crashed) scan.")
+    parser.add_argument("journal", help="Scan journal (.jsonl) of the sample")
+    parser.add_argument("output", help="Zemax BSDF file to write; the relative errors are written next to it")
+    parser.add_argument("--scatter-type", default="BRDF", choices=("BRDF", "BTDF"), help="Scatter type of the BSDF file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    journal = ScanJournal(args.journal)
+    if not journal.load():
+        raise SystemExit(f"No scan journal in {args.journal}")
+    save_results(journal.to_store(), args.output, args.scatter_type)
+
+if __name__ == "__main__":
+    main()
@@ -21,4 +21,10 @@ if __name__ == "__main__":
 
     # Start GUI application
     app = ScatteringApp()
-    app.mainloop()
\ No newline at end of file
+    app.mainloop()
+
+    # Close the persistent motor connection and camera
+    if getattr(app, "motors", None) is not None:
+        app.motors.close()
+    if getattr(app, "camera", None) is not None:
+        app.camera.stop()
\ No newline at end of file
@@ -0,0 +1,74 @@
+import numpy as np
+from scan_planner import is_blocked
+
+# State of every grid position
+MISSING = 0     # Not measured (yet), or exposure tuning failed
+MEASURED = 1
+BLOCKED = 2     # Detector in front of the light source, never measured
+
+# Columns of the error planes: spatial (pixel spread in the ROI), then temporal (frame-to-frame noise)
+ERROR_NAMES = ("r_err", "g_err", "b_err", "r_temporal_err", "g_temporal_err", "b_temporal_err")
+
+# Results of a measurement on the full 4D angle grid, in preallocated arrays indexed
+# (light_rad, light_az, det_az, det_rad), the order of the scan plan and of the Zemax file.
+class MeasurementStore:
+    def __init__(self, light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles):
+        self.axes = tuple(np.asarray(angles) for angles in
+                          (light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles))
+        self._lookup = [{angle: i for i, angle in enumerate(axis.tolist())} for axis in self.axes]  # Angle -> index
+
+        shape = tuple(len(axis) for axis in self.axes)
+        self.values = np.zeros(shape + (3,), dtype=np.float32)                      # R, G, B ROI means
+        self.errors = np.full(shape + (len(ERROR_NAMES),), np.nan, dtype=np.float32)  # Relative errors
+        self.status = np.full(shape, MISSING, dtype=np.uint8)
+        self.status[is_blocked(*np.ix_(*self.axes))] = BLOCKED
+
+    @classmethod
+    def from_app(cls, app):
+        """Empty store on the angle lists of the app (Step 4)."""
+        return cls(app.light_radial_angles, app.incidence_angles, app.det_azimuth_angles, app.det_radial_angles)
+
+    @property
+    def shape(self):
+        return self.status.shape
+
+    def __len__(self):
+        """Number of measured positions."""
+        return int(np.count_nonzero(self.status == MEASURED))
+
+    def index(self, geometry):
+        """Grid index of a (light_rad, light_az, det_az, det_rad) geometry. Raises KeyError if it is not on the grid."""
+        return tuple(lookup[angle] for lookup, angle in zip(self._lookup, geometry))
+
+    def store(self, geometry, values, errors):
+        """Store the R, G, B values and relative errors of a measured position."""
+        index = self.index(geometry)
+        self.values[index] = values
+        self.errors[index] = errors
+        self.status[index] = MEASURED
+
+    def get(self, geometry):
+        """(values, errors) of a measured position, or None."""
+        index = self.index(geometry)
+        if self.status[index] != MEASURED:
+            return None
+        return self.values[index], self.errors[index]
+
+    def measured(self):
+        """Angles of all measured positions as an (n, 4) array, in grid order."""
+        return self.geometries(self.status == MEASURED)
+
+    def geometries(self, mask):
+        """Angles of the positions selected by a boolean grid mask as an (n, 4) array."""
+        return np.column_stack([axis[index] for axis, index in zip(self.axes, np.nonzero(mask))])
+
+    def tis(self):
+        """Total integrated scatter per (light_rad, light_az): sum of all channels over the scatter grid."""
+        return self.values.sum(axis=(2, 3, 4), dtype=np.float64)
+
+    def mean_errors(self):
+        """Mean of every error column over the measured positions (NaN entries, e.g. single-frame temporal errors, skipped)."""
+        errors = self.errors[self.status == MEASURED]
+        if not len(errors):
+            return np.zeros(len(ERROR_NAMES))
+        return np.nanmean(errors, axis=0)
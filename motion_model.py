@@ -0,0 +1,58 @@
+import math
+import numpy as np
+
+# Motor constants, must match the axis table in motors_arduino.ino
+STEPS_PER_DEG = {
+    "DET_AZ": 12.0,
+    "DET_RAD": 10.0,
+    "LIGHT_AZ": 12.0,
+    "LIGHT_RAD": 10.0,
+}
+HOME_ANGLE = 8  # Position the firmware assumes after RESET_POS
+
+# Trapezoidal speed profile per axis: (max speed in steps/s, acceleration in steps/s²)
+# TODO: Change if necessary, the limits depend on the motors, drivers and load of each axis
+AXIS_PROFILES = {
+    "DET_AZ": (3000.0, 6000.0),
+    "DET_RAD": (2000.0, 4000.0),
+    "LIGHT_AZ": (3000.0, 6000.0),
+    "LIGHT_RAD": (2000.0, 4000.0),
+}
+
+def steps_between(axis, from_angle, to_angle):
+    """Number of motor steps the firmware performs to go from one angle to another."""
+    steps_per_deg = STEPS_PER_DEG[axis]
+    return abs(int(to_angle * steps_per_deg) - int(from_angle * steps_per_deg))
+
+def profile_duration(steps, max_speed, acceleration):
+    """Time (s) to travel a number of steps with a trapezoidal (or triangular) speed profile from rest to rest."""
+    if steps <= 0:
+        return 0.0
+
+    # Steps needed to accelerate to max speed (and the same again to stop)
+    ramp_steps = max_speed ** 2 / (2 * acceleration)
+
+    if steps >= 2 * ramp_steps:
+        # Accelerate, cruise at max speed, decelerate
+        return steps / max_speed + max_speed / acceleration
+
+    # Triangular profile: max speed is never reached
+    return 2 * math.sqrt(steps / acceleration)
+
+def move_duration(axis, from_angle, to_angle):
+    """Predicted travel time (s) of one axis between two angles."""
+    max_speed, acceleration = AXIS_PROFILES[axis]
+    return profile_duration(steps_between(axis, from_angle, to_angle), max_speed, acceleration)
+
+def multi_move_duration(positions, targets):
+    """Predicted time (s) of a batched move: axes run in parallel, so the slowest one sets the pace."""
+    return max((move_duration(axis, positions[axis], angle) for axis, angle in targets.items()), default=0.0)
+
+def profile_durations(steps, max_speed, acceleration):
+    """Vectorised profile_duration for an array of step counts."""
+    steps = np.asarray(steps, dtype=np.float64)
+    ramp_steps = max_speed ** 2 / (2 * acceleration)
+
+    trapezoid = steps / max_speed + max_speed / acceleration
+    triangle = 2 * np.sqrt(steps / acceleration)
+    return np.where(steps >= 2 * ramp_steps, trapezoid, triangle)
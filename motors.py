@@ -1,13 +1,80 @@
 import serial
 import time
 import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from motion_model import STEPS_PER_DEG, HOME_ANGLE, multi_move_duration
+
+# Serial protocol settings, must match motors_arduino.ino
+BAUD_RATE = 115200
+MAX_QUEUED_MOVES = 4        # Moves in flight at once (the firmware queue holds 8)
+COMMAND_TIMEOUT_S = 1.0     # Reply time for queries (PING, STATUS, POS, RESET)
+READY_TIMEOUT_S = 5.0       # Time for the board to come up after the port is opened
+
+# Extra time allowed on top of the predicted travel time before a move is considered lost
+MOVE_TIMEOUT_FACTOR = 1.5
+MOVE_TIMEOUT_MARGIN_S = 2.0
+
+# Order of the angles in a POS reply
+POSITION_AXES = ("DET_AZ", "DET_RAD", "LIGHT_AZ", "LIGHT_RAD")
+
+class CommandError(RuntimeError):
+    """The Arduino rejected a command (ERR reply)."""
+
+def move_timeout(travel_time):
+    """Maximum time (s) to wait for the completion message of a move with the given predicted duration."""
+    return travel_time * MOVE_TIMEOUT_FACTOR + MOVE_TIMEOUT_MARGIN_S
+
+def frame_checksum(payload):
+    """XOR of all characters of the frame payload."""
+    checksum = 0
+    for byte in payload.encode():
+        checksum ^= byte
+    return checksum
+
+def encode_frame(seq, *fields):
+    """Build a frame: $<seq>,<field>,...*<checksum>"""
+    payload = ",".join([str(seq), *fields])
+    return f"${payload}*{frame_checksum(payload):02X}\n".encode()
+
+def decode_frame(line):
+    """
+    Parse a frame into (seq, fields), fields[0] being the command or reply type.
+    Raises ValueError for malformed frames, checksum mismatches or frames without a command.
+    """
+    line = line.strip()
+    if not line.startswith("$") or "*" not in line:
+        raise ValueError(f"Malformed frame: {line!r}")
+
+    payload, checksum = line[1:].rsplit("*", 1)
+    if int(checksum, 16) != frame_checksum(payload):
+        raise ValueError(f"Checksum mismatch: {line!r}")
+
+    seq, *fields = payload.split(",")
+    if not seq.isdigit() or not fields or not fields[0]:
+        raise ValueError(f"Malformed frame: {line!r}")
+    return int(seq), fields
 
 # Control stepper motors via Arduino over serial connection
 class Motors:
-    def __init__(self):
-        # Connect to Arduino
-        self.arduino = serial.Serial(port='/dev/ttyACM0', baudrate=9600, timeout=1)  
-        time.sleep(2)  # Allow time to initialize
+    def __init__(self, port='/dev/ttyACM0', baudrate=BAUD_RATE, connection=None):
+        # Connect to Arduino, unless an open connection (e.g. fake_arduino.FakeSerial) is given
+        self.arduino = connection if connection is not None else serial.Serial(port=port, baudrate=baudrate, timeout=0.1)
+
+        # Commands waiting for their reply, by sequence number
+        self._pending = {}
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+        # Limit moves in flight so the firmware queue never overflows
+        self._move_slots = threading.BoundedSemaphore(MAX_QUEUED_MOVES)
+        self._queue_end = time.monotonic()  # Predicted time when all queued moves are done
+
+        self._stop = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+        self.wait_until_ready()
 
         # Default offset positions in degress TODO: change if necessary depending on mechanical/optical setup
         self.light_az_offset = 8
@@ -15,55 +82,206 @@ class Motors:
         self.detector_az_offset = 8
         self.detector_rad_offset = 8
 
+        # Angle of every axis once all queued moves are done
+        self.positions = self.query_position()
+
+    def close(self):
+        """Stop the reader thread and close the serial port."""
+        self._stop.set()
+        self._reader.join()
+        self.arduino.close()
+
+    def wait_until_ready(self):
+        """Ping the Arduino until it answers. Opening the port resets the board, so the first pings may get lost."""
+        deadline = time.monotonic() + READY_TIMEOUT_S
+        while time.monotonic() < deadline:
+            try:
+                self.request("PING", timeout=0.2)
+                logging.info("Motor controller ready.")
+                return
+            except TimeoutError:
+                continue
+        raise TimeoutError(f"Motor controller did not answer within {READY_TIMEOUT_S:.1f} s")
+
     def reset_position(self):
         """Assume that the position where the motors are at the moment is the starting point."""
-        self.arduino.write(b"RESET_POS\n")
-        response = self.arduino.readline().decode().strip()
-        logging.info(f"Arduino response: {response}")
+        self.request("RESET")
+        self.positions = {axis: HOME_ANGLE for axis in STEPS_PER_DEG}
+        logging.info(f"Position reset to {HOME_ANGLE} degrees on all axes.")
+
+    def set_position(self, angles):
+        """Declare the current angle of the given axes without moving, e.g. the last known position after a restart."""
+        unknown = set(angles) - set(STEPS_PER_DEG)
+        if unknown:
+            raise ValueError(f"Unknown axes: {sorted(unknown)}")
+        self.request("SET", *(f"{axis}={angle}" for axis, angle in angles.items()))
+        self.positions.update(angles)
+        logging.info(f"Position set to {angles}.")
+
+    def query_position(self):
+        """Return the live angle of every axis as reported by the Arduino."""
+        fields = self.request("POS")
+        return {axis: float(angle) for axis, angle in zip(POSITION_AXES, fields[1:])}
 
     def move_light_to_offset(self):
         """Move light source axes (azimuthal and radial) to offset position."""
-        self.move_light_azimuthal(self.light_az_offset)
-        self.move_light_radial(self.light_rad_offset)
+        logging.info(f"Command: Go to light offset ({self.light_az_offset}°, {self.light_rad_offset}°)")
+        self.move_many({"LIGHT_AZ": self.light_az_offset, "LIGHT_RAD": self.light_rad_offset})
 
     def move_detector_to_offset(self):
         """Move detector axes (azimuthal and radial) to offset position."""
-        self.move_detector_azimuthal(self.detector_az_offset)
-        self.move_detector_radial(self.detector_rad_offset)
+        logging.info(f"Command: Go to detector offset ({self.detector_az_offset}°, {self.detector_rad_offset}°)")
+        self.move_many({"DET_AZ": self.detector_az_offset, "DET_RAD": self.detector_rad_offset})
 
     def move_light_azimuthal(self, angle):
         """Move light source in the azimuthal direction."""
         logging.info(f"Command: Go to light azimuthal {angle}°")
-        command = f"LIGHT_AZ_ABS:{angle:.2f}\n"
-        self.arduino.write(command.encode())
-        response = self.arduino.readline().decode().strip()
-        logging.info(f"Arduino response: {response}")
-        time.sleep(2)
+        self.move_many({"LIGHT_AZ": angle})
 
     def move_light_radial(self, angle):
         """Move light source in the radial direction."""
         logging.info(f"Command: Go to light radial {angle}°")
-        command = f"LIGHT_RAD_ABS:{angle:.2f}\n"
-        self.arduino.write(command.encode())
-        response = self.arduino.readline().decode().strip()
-        logging.info(f"Arduino response: {response}")
-        time.sleep(2)
+        self.move_many({"LIGHT_RAD": angle})
 
     def move_detector_azimuthal(self, angle):
         """Move detector in the azimuthal direction."""
         logging.info(f"Command: Go to detector azimuthal {angle}°")
-        command = f"DET_AZ_ABS:{angle:.2f}\n"
-        self.arduino.write(command.encode())
-        response = self.arduino.readline().decode().strip()
-        logging.info(f"Arduino response: {response}")
-        time.sleep(2)
+        self.move_many({"DET_AZ": angle})
 
     def move_detector_radial(self, angle):
         """Move detector in the radial direction."""
         logging.info(f"Command: Go to detector radial {angle}°")
-        command = f"DET_RAD_ABS:{angle:.2f}\n"
-        self.arduino.write(command.encode())
-        response = self.arduino.readline().decode().strip()
-        logging.info(f"Arduino response: {response}")
-        time.sleep(2)
+        self.move_many({"DET_RAD": angle})
+
+    def move_many(self, targets):
+        """
+        Move several axes at once, e.g. {"LIGHT_AZ": 20, "DET_AZ": 35}, and wait until the move is done.
+        All axes step in parallel, so the move takes as long as the slowest axis.
+        """
+        self.wait_for_move(self.queue_move(targets))
+
+    def queue_move(self, targets):
+        """
+        Send a batched move without waiting for it to finish and return a future for its completion.
+        The future carries the `deadline` (monotonic time) by which the move should be done.
+        Blocks while MAX_QUEUED_MOVES moves are already in flight.
+        """
+        unknown = set(targets) - set(STEPS_PER_DEG)
+        if unknown:
+            raise ValueError(f"Unknown motor axes: {sorted(unknown)}")
+
+        # Axes that are already at their target are left out of the command
+        targets = {axis: angle for axis, angle in targets.items() if angle != self.positions[axis]}
+        if not targets:
+            future = Future()
+            future.set_result(["DONE"])
+            future.deadline = time.monotonic()
+            return future
+
+        self._move_slots.acquire()
+
+        # Queued moves run one after another, so this one finishes after all earlier ones
+        travel_time = multi_move_duration(self.positions, targets)
+        start_time = max(self._queue_end, time.monotonic())
+        previous_positions, previous_queue_end = dict(self.positions), self._queue_end
+        self._queue_end = start_time + travel_time
+        self.positions.update(targets)
+
+        try:
+            future = self.submit("MOVE", *(f"{axis}={angle:.2f}" for axis, angle in targets.items()))
+        except Exception:
+            # The move was never sent: give the slot back and forget the planned position
+            self.positions, self._queue_end = previous_positions, previous_queue_end
+            self._move_slots.release()
+            raise
+        future.deadline = start_time + move_timeout(travel_time)
+        future.add_done_callback(lambda _: self._move_slots.release())
+        return future
+
+    def wait_for_move(self, future):
+        """Block until a queued move is done."""
+        try:
+            future.result(timeout=max(future.deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            self._forget(future)
+            # Neither the planned positions nor the predicted queue end hold any more
+            self._queue_end = time.monotonic()
+            try:
+                self.positions = self.query_position()
+            except Exception as e:
+                logging.error(f"Could not read the motor position after a move timeout: {e}")
+            raise TimeoutError("Move did not complete in time") from None
+        except CommandError:
+            # The planned positions are no longer valid, read back where the motors really are
+            self.positions = self.query_position()
+            raise
+
+    def request(self, *fields, timeout=COMMAND_TIMEOUT_S):
+        """Send a command and wait for its reply fields."""
+        future = self.submit(*fields)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self._forget(future)
+            raise TimeoutError(f"No reply to {fields[0]} within {timeout:.1f} s") from None
+
+    def submit(self, *fields):
+        """Send a command frame and return a future that resolves with the reply fields."""
+        future = Future()
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq = self._next_seq % 65535 + 1  # Sequence 0 is reserved for unsolicited frames
+            self._pending[seq] = future
+            try:
+                self.arduino.write(encode_frame(seq, *fields))
+            except Exception:
+                del self._pending[seq]
+                raise
+        logging.debug(f"Sent #{seq}: {','.join(fields)}")
+        return future
+
+    def _forget(self, future):
+        """Stop waiting for the reply of a command that timed out."""
+        with self._lock:
+            self._pending = {seq: f for seq, f in self._pending.items() if f is not future}
+        future.cancel()
+
+    def _read_loop(self):
+        """Read reply frames and resolve the matching pending commands."""
+        while not self._stop.is_set():
+            try:
+                line = self.arduino.readline().decode(errors="replace").strip()
+            except serial.SerialException as e:
+                logging.error(f"Serial connection lost: {e}")
+                return
+
+            if not line:
+                continue
+
+            try:
+                self._handle_reply(line)
+            except ValueError as e:
+                logging.warning(f"Ignoring invalid frame from Arduino: {e}")
+            except Exception:
+                # One bad frame must not stop the reader, every later command would time out
+                logging.exception(f"Error handling frame from Arduino: {line!r}")
+
+    def _handle_reply(self, line):
+        """Resolve the pending command a reply frame belongs to."""
+        seq, fields = decode_frame(line)
+        logging.debug(f"Received #{seq}: {','.join(fields)}")
+        if fields[0] == "ACK":
+            return  # Move queued, the DONE reply follows when it finishes
+
+        with self._lock:
+            future = self._pending.pop(seq, None)
+
+        if future is None:
+            if fields[0] != "READY":
+                logging.warning(f"Unexpected reply from Arduino: #{seq} {','.join(fields)}")
+            return
 
+        if fields[0] == "ERR":
+            future.set_exception(CommandError(f"Arduino rejected command #{seq}: {','.join(fields[1:])}"))
+        else:
+            future.set_result(fields)
@@ -1,3 +1,4 @@
+
 // === Pin Definitions ===
 // Make sure pins match your setup
 #define DET_AZ_STEP 3
@@ -15,142 +16,371 @@ const float DET_AZ_STEPS_PER_DEG = 12.0;
 const float DET_RAD_STEPS_PER_DEG = 10.0;
 const float LIGHT_AZ_STEPS_PER_DEG = 12.0;
 const float LIGHT_RAD_STEPS_PER_DEG = 10.0;
-const unsigned int STEP_DELAY_US = 500;  // Motor speed control
 
-// === State ===
-long current_det_az_steps = long(8 * DET_AZ_STEPS_PER_DEG);
-long current_det_rad_steps = long(8 * DET_RAD_STEPS_PER_DEG);
-long current_light_az_steps = long(8 * LIGHT_AZ_STEPS_PER_DEG);
-long current_light_rad_steps = long(8 * LIGHT_RAD_STEPS_PER_DEG);
+// Trapezoidal speed profile per axis (must match AXIS_PROFILES in motion_model.py)
+// TODO: Change if necessary (the limits depend on the motors, drivers and load of each axis)
+const float DET_AZ_MAX_SPEED = 3000.0;      // steps/s
+const float DET_AZ_ACCEL = 6000.0;          // steps/s^2
+const float DET_RAD_MAX_SPEED = 2000.0;
+const float DET_RAD_ACCEL = 4000.0;
+const float LIGHT_AZ_MAX_SPEED = 3000.0;
+const float LIGHT_AZ_ACCEL = 6000.0;
+const float LIGHT_RAD_MAX_SPEED = 2000.0;
+const float LIGHT_RAD_ACCEL = 4000.0;
+
+// Serial protocol
+const long BAUD_RATE = 115200;
+const int MAX_FRAME = 96;                   // Longest accepted frame, without line ending
+const int QUEUE_SIZE = 8;                   // Moves that can wait while another one runs
+
+const float MIN_SPEED = 50.0;               // Floor for the first step of a ramp (steps/s)
+const unsigned int STEP_PULSE_US = 5;       // Width of the step pulse
 
 // === Enum for Axis Selection ===
 enum MotorAxis {
   DETECTOR_AZ,
   DETECTOR_RAD,
   LIGHT_AZ,
-  LIGHT_RAD
+  LIGHT_RAD,
+  AXIS_COUNT
+};
+
+// === Axis Table ===
+struct Axis {
+  const char* name;       // Name used in serial commands
+  int step_pin;
+  int dir_pin;
+  float steps_per_deg;
+  float max_speed;        // steps/s
+  float acceleration;     // steps/s^2
+  long current_steps;     // Position at the end of the move in progress
+  long remaining_steps;   // Steps left in the move in progress
+  long done_steps;        // Steps already taken in the move in progress
+  int direction;          // +1 or -1 for the move in progress
+  unsigned long next_step_us; // Time of the next step, relative to the start of the move
 };
 
+Axis axes[AXIS_COUNT] = {
+  {"DET_AZ", DET_AZ_STEP, DET_AZ_DIR, DET_AZ_STEPS_PER_DEG, DET_AZ_MAX_SPEED, DET_AZ_ACCEL, long(8 * DET_AZ_STEPS_PER_DEG), 0, 0, 1, 0},
+  {"DET_RAD", DET_RAD_STEP, DET_RAD_DIR, DET_RAD_STEPS_PER_DEG, DET_RAD_MAX_SPEED, DET_RAD_ACCEL, long(8 * DET_RAD_STEPS_PER_DEG), 0, 0, 1, 0},
+  {"LIGHT_AZ", LIGHT_AZ_STEP, LIGHT_AZ_DIR, LIGHT_AZ_STEPS_PER_DEG, LIGHT_AZ_MAX_SPEED, LIGHT_AZ_ACCEL, long(8 * LIGHT_AZ_STEPS_PER_DEG), 0, 0, 1, 0},
+  {"LIGHT_RAD", LIGHT_RAD_STEP, LIGHT_RAD_DIR, LIGHT_RAD_STEPS_PER_DEG, LIGHT_RAD_MAX_SPEED, LIGHT_RAD_ACCEL, long(8 * LIGHT_RAD_STEPS_PER_DEG), 0, 0, 1, 0},
+};
+
+// === Move Queue ===
+// MOVE commands are acknowledged when queued and reported DONE when finished,
+// so the host can send the next move while the current one is running.
+struct MoveCommand {
+  unsigned int seq;
+  bool selected[AXIS_COUNT];
+  float target_angles[AXIS_COUNT];
+};
+
+MoveCommand move_queue[QUEUE_SIZE];
+int queue_head = 0;
+int queue_count = 0;
+bool moving = false;
+
+// === Serial Receive Buffer ===
+char rx_buffer[MAX_FRAME + 1];
+int rx_length = 0;
+bool rx_overflow = false;
+
 // === Function Prototypes ===
-void move_to_absolute(MotorAxis axis, float target_angle);
-void move_motor(int step_pin, int dir_pin, int steps, bool direction);
+void poll_serial();
+void handle_frame(char* frame);
+void handle_command(unsigned int seq, char* command, char* args);
+void queue_move(unsigned int seq, char* args);
+void set_position(unsigned int seq, char* args);
+void send_frame(unsigned int seq, const char* body);
+void send_position(unsigned int seq);
+int find_axis(const char* name);
+void prepare_move(MotorAxis axis, float target_angle);
+void run_moves();
+unsigned long step_interval_us(Axis& a);
 void reset_position();
 
 void setup() {
-  Serial.begin(9600);
-
-  pinMode(DET_AZ_STEP, OUTPUT);
-  pinMode(DET_AZ_DIR, OUTPUT);
-  pinMode(DET_RAD_STEP, OUTPUT);
-  pinMode(DET_RAD_DIR, OUTPUT);
-  pinMode(LIGHT_AZ_STEP, OUTPUT);
-  pinMode(LIGHT_AZ_DIR, OUTPUT);
-  pinMode(LIGHT_RAD_STEP, OUTPUT);
-  pinMode(LIGHT_RAD_DIR, OUTPUT);
-
-  Serial.println("Motor controller ready.");
+  Serial.begin(BAUD_RATE);
+
+  for (int i = 0; i < AXIS_COUNT; i++) {
+    pinMode(axes[i].step_pin, OUTPUT);
+    pinMode(axes[i].dir_pin, OUTPUT);
+  }
+
+  send_frame(0, "READY");
 }
 
 void loop() {
-  if (Serial.available()) {
-    String command = Serial.readStringUntil('\n');
-    command.trim();
+  poll_serial();
+
+  // Start the next queued move
+  if (queue_count > 0) {
+    MoveCommand command = move_queue[queue_head];
+    queue_head = (queue_head + 1) % QUEUE_SIZE;
+    queue_count--;
+
+    for (int i = 0; i < AXIS_COUNT; i++) {
+      if (command.selected[i]) prepare_move(MotorAxis(i), command.target_angles[i]);
+    }
+
+    moving = true;
+    run_moves();
+    moving = false;
+
+    send_frame(command.seq, "DONE");
+  }
+}
 
-    if (command == "RESET_POS") {
-      reset_position();
+// === Serial Protocol ===
+// Frame: $<seq>,<COMMAND>[,<arg>...]*<checksum>\n
+// The checksum is the XOR of all characters between '$' and '*' as two hex digits.
+// Commands:  PING            -> OK
+//            STATUS          -> STATUS,<moving>,<queued moves>
+//            POS             -> POS,<DET_AZ>,<DET_RAD>,<LIGHT_AZ>,<LIGHT_RAD> (live angles)
+//            RESET           -> DONE (only when idle)
+//            SET,AXIS=ANGLE[,AXIS=ANGLE...]  -> DONE (only when idle; declares the current angles, no motion)
+//            MOVE,AXIS=ANGLE[,AXIS=ANGLE...] -> ACK when queued, DONE when finished
+// Errors:    ERR,CHECKSUM | ERR,FORMAT | ERR,UNKNOWN | ERR,QUEUE_FULL | ERR,BUSY
+
+void poll_serial() {
+  // Collect bytes into a line without blocking; called between step pulses as well
+  while (Serial.available()) {
+    char c = Serial.read();
+
+    if (c == '\n') {
+      rx_buffer[rx_length] = '\0';
+      if (!rx_overflow && rx_length > 0) handle_frame(rx_buffer);
+      rx_length = 0;
+      rx_overflow = false;
+    } else if (c != '\r') {
+      if (rx_length < MAX_FRAME) rx_buffer[rx_length++] = c;
+      else rx_overflow = true;
+    }
+  }
+}
+
+void handle_frame(char* frame) {
+  char* star = strchr(frame, '*');
+  if (frame[0] != '$' || star == NULL) {
+    send_frame(0, "ERR,FORMAT");
+    return;
+  }
+
+  // Verify checksum
+  byte checksum = 0;
+  for (char* p = frame + 1; p < star; p++) checksum ^= *p;
+  *star = '\0';
+  unsigned int seq = (unsigned int)strtoul(frame + 1, NULL, 10);
+  if ((byte)strtoul(star + 1, NULL, 16) != checksum) {
+    send_frame(seq, "ERR,CHECKSUM");
+    return;
+  }
+
+  // Split "<seq>,<COMMAND>,<args>"
+  char* command = strchr(frame, ',');
+  if (command == NULL) {
+    send_frame(seq, "ERR,FORMAT");
+    return;
+  }
+  command++;
+
+  char* args = strchr(command, ',');
+  if (args != NULL) *args++ = '\0';
+
+  handle_command(seq, command, args);
+}
+
+void handle_command(unsigned int seq, char* command, char* args) {
+  if (strcmp(command, "PING") == 0) {
+    send_frame(seq, "OK");
+  } else if (strcmp(command, "STATUS") == 0) {
+    char body[24];
+    snprintf(body, sizeof(body), "STATUS,%d,%d", moving ? 1 : 0, queue_count);
+    send_frame(seq, body);
+  } else if (strcmp(command, "POS") == 0) {
+    send_position(seq);
+  } else if (strcmp(command, "RESET") == 0) {
+    if (moving || queue_count > 0) {
+      send_frame(seq, "ERR,BUSY");
+      return;
+    }
+    reset_position();
+    send_frame(seq, "DONE");
+  } else if (strcmp(command, "SET") == 0) {
+    if (moving || queue_count > 0) {
+      send_frame(seq, "ERR,BUSY");
       return;
     }
+    set_position(seq, args);
+  } else if (strcmp(command, "MOVE") == 0) {
+    queue_move(seq, args);
+  } else {
+    send_frame(seq, "ERR,UNKNOWN");
+  }
+}
+
+void queue_move(unsigned int seq, char* args) {
+  if (queue_count >= QUEUE_SIZE) {
+    send_frame(seq, "ERR,QUEUE_FULL");
+    return;
+  }
 
-    int colonIndex = command.indexOf(':');
-    if (colonIndex == -1) {
-      Serial.println("Invalid format.");
+  // Parse comma separated AXIS=ANGLE pairs and validate all of them before queueing
+  MoveCommand& command = move_queue[(queue_head + queue_count) % QUEUE_SIZE];
+  command.seq = seq;
+  for (int i = 0; i < AXIS_COUNT; i++) command.selected[i] = false;
+
+  char* pair = args == NULL ? NULL : strtok(args, ",");
+  if (pair == NULL) {
+    send_frame(seq, "ERR,FORMAT");
+    return;
+  }
+
+  while (pair != NULL) {
+    char* equal = strchr(pair, '=');
+    if (equal != NULL) *equal = '\0';
+    int axis = equal == NULL ? -1 : find_axis(pair);
+    if (axis == -1) {
+      send_frame(seq, "ERR,FORMAT");
       return;
     }
 
-    String target = command.substring(0, colonIndex);
-    float angle = command.substring(colonIndex + 1).toFloat();
-
-    if (target == "DET_AZ_ABS") {
-      move_to_absolute(DETECTOR_AZ, angle);
-    } else if (target == "DET_RAD_ABS") {
-      move_to_absolute(DETECTOR_RAD, angle);
-    } else if (target == "LIGHT_AZ_ABS") {
-      move_to_absolute(LIGHT_AZ, angle);
-    } else if (target == "LIGHT_RAD_ABS") {
-      move_to_absolute(LIGHT_RAD, angle);
-    } else {
-      Serial.println("Unknown command.");
+    command.target_angles[axis] = atof(equal + 1);
+    command.selected[axis] = true;
+    pair = strtok(NULL, ",");
+  }
+
+  queue_count++;
+  send_frame(seq, "ACK");
+}
+
+void set_position(unsigned int seq, char* args) {
+  // Parse and validate all AXIS=ANGLE pairs before changing any position
+  long steps[AXIS_COUNT];
+  bool selected[AXIS_COUNT] = {false};
+
+  char* pair = args == NULL ? NULL : strtok(args, ",");
+  if (pair == NULL) {
+    send_frame(seq, "ERR,FORMAT");
+    return;
+  }
+
+  while (pair != NULL) {
+    char* equal = strchr(pair, '=');
+    if (equal != NULL) *equal = '\0';
+    int axis = equal == NULL ? -1 : find_axis(pair);
+    if (axis == -1) {
+      send_frame(seq, "ERR,FORMAT");
+      return;
     }
+
+    steps[axis] = long(atof(equal + 1) * axes[axis].steps_per_deg);
+    selected[axis] = true;
+    pair = strtok(NULL, ",");
+  }
+
+  for (int i = 0; i < AXIS_COUNT; i++) {
+    if (selected[i]) axes[i].current_steps = steps[i];
   }
+  send_frame(seq, "DONE");
 }
 
-void move_to_absolute(MotorAxis axis, float target_angle) {
-  long target_steps = 0;
-  long* current_steps;
-  int step_pin, dir_pin;
-  float steps_per_deg;
+void send_frame(unsigned int seq, const char* body) {
+  char payload[MAX_FRAME];
+  snprintf(payload, sizeof(payload), "%u,%s", seq, body);
+
+  byte checksum = 0;
+  for (char* p = payload; *p; p++) checksum ^= *p;
+
+  char tail[4];
+  snprintf(tail, sizeof(tail), "*%02X", checksum);
 
-  switch (axis) {
-    case DETECTOR_AZ:
-      steps_per_deg = DET_AZ_STEPS_PER_DEG;
-      current_steps = &current_det_az_steps;
-      step_pin = DET_AZ_STEP;
-      dir_pin = DET_AZ_DIR;
-      break;
-    case DETECTOR_RAD:
-      steps_per_deg = DET_RAD_STEPS_PER_DEG;
-      current_steps = &current_det_rad_steps;
-      step_pin = DET_RAD_STEP;
-      dir_pin = DET_RAD_DIR;
-      break;
-    case LIGHT_AZ:
-      steps_per_deg = LIGHT_AZ_STEPS_PER_DEG;
-      current_steps = &current_light_az_steps;
-      step_pin = LIGHT_AZ_STEP;
-      dir_pin = LIGHT_AZ_DIR;
-      break;
-    case LIGHT_RAD:
-      steps_per_deg = LIGHT_RAD_STEPS_PER_DEG;
-      current_steps = &current_light_rad_steps;
-      step_pin = LIGHT_RAD_STEP;
-      dir_pin = LIGHT_RAD_DIR;
-      break;
-  }
-
-  target_steps = long(target_angle * steps_per_deg);
-  long step_diff = target_steps - *current_steps;
-  bool direction = step_diff >= 0;
-  long move_steps = abs(step_diff);
-
-  digitalWrite(dir_pin, direction ? HIGH : LOW);
-  for (long i = 0; i < move_steps; i++) {
-    digitalWrite(step_pin, HIGH);
-    delayMicroseconds(STEP_DELAY_US);
-    digitalWrite(step_pin, LOW);
-    delayMicroseconds(STEP_DELAY_US);
-  }
-
-  *current_steps = target_steps;
-
-  Serial.print("Moved ");
-  switch (axis) {
-    case DETECTOR_AZ: Serial.print("DET_AZ"); break;
-    case DETECTOR_RAD: Serial.print("DET_RAD"); break;
-    case LIGHT_AZ: Serial.print("LIGHT_AZ"); break;
-    case LIGHT_RAD: Serial.print("LIGHT_RAD"); break;
-  }
-  Serial.print(" to ");
-  Serial.print(target_angle, 2);
-  Serial.println(" degrees.");
-  Serial.println("OK");
+  Serial.print('$');
+  Serial.print(payload);
+  Serial.println(tail);
 }
 
-void reset_position() {
-  current_det_az_steps = long(8 * DET_AZ_STEPS_PER_DEG);
-  current_det_rad_steps = long(8 * DET_RAD_STEPS_PER_DEG);
-  current_light_az_steps = long(8 * LIGHT_AZ_STEPS_PER_DEG);
-  current_light_rad_steps = long(8 * LIGHT_RAD_STEPS_PER_DEG);
+void send_position(unsigned int seq) {
+  char body[MAX_FRAME] = "POS";
+  char angle[12];
+
+  for (int i = 0; i < AXIS_COUNT; i++) {
+    // Live position: the end position minus the steps still to go
+    long steps = axes[i].current_steps - axes[i].direction * axes[i].remaining_steps;
+    dtostrf(steps / axes[i].steps_per_deg, 0, 2, angle);
+    strcat(body, ",");
+    strcat(body, angle);
+  }
+  send_frame(seq, body);
+}
+
+// === Motion ===
 
-  Serial.println("Position reset to 8 degrees on all axes.");
-  Serial.println("OK");
+int find_axis(const char* name) {
+  for (int i = 0; i < AXIS_COUNT; i++) {
+    if (strcmp(name, axes[i].name) == 0) return i;
+  }
+  return -1;
+}
+
+void prepare_move(MotorAxis axis, float target_angle) {
+  Axis& a = axes[axis];
+
+  long target_steps = long(target_angle * a.steps_per_deg);
+  long step_diff = target_steps - a.current_steps;
+
+  a.direction = step_diff >= 0 ? 1 : -1;
+  digitalWrite(a.dir_pin, step_diff >= 0 ? HIGH : LOW);
+  a.remaining_steps = abs(step_diff);
+  a.current_steps = target_steps;
+}
+
+void run_moves() {
+  // Step all prepared axes together, each with its own acceleration/cruise/deceleration profile.
+  // The move takes as long as the slowest axis.
+  for (int i = 0; i < AXIS_COUNT; i++) {
+    axes[i].done_steps = 0;
+    axes[i].next_step_us = 0;
+  }
+
+  unsigned long start_us = micros();
+  bool stepping = true;
+  while (stepping) {
+    stepping = false;
+    unsigned long now_us = micros() - start_us;
+
+    for (int i = 0; i < AXIS_COUNT; i++) {
+      Axis& a = axes[i];
+      if (a.remaining_steps == 0) continue;
+      stepping = true;
+      if (now_us < a.next_step_us) continue;  // Not yet time for this axis
+
+      digitalWrite(a.step_pin, HIGH);
+      delayMicroseconds(STEP_PULSE_US);
+      digitalWrite(a.step_pin, LOW);
+
+      a.remaining_steps--;
+      a.done_steps++;
+      a.next_step_us += step_interval_us(a);
+    }
+
+    // Keep answering queries and queueing moves while stepping
+    poll_serial();
+  }
+}
+
+unsigned long step_interval_us(Axis& a) {
+  // Fastest speed allowed by accelerating from the start and by still being able to stop at the target,
+  // capped at the axis maximum: v = min(v_max, sqrt(2 a n_done), sqrt(2 a n_remaining))
+  float speed = min(sqrt(2.0 * a.acceleration * a.done_steps), sqrt(2.0 * a.acceleration * a.remaining_steps));
+  speed = constrain(speed, MIN_SPEED, a.max_speed);
+  return (unsigned long)(1000000.0 / speed);
+}
+
+void reset_position() {
+  for (int i = 0; i < AXIS_COUNT; i++) {
+    axes[i].current_steps = long(8 * axes[i].steps_per_deg);
+    axes[i].remaining_steps = 0;
+  }
 }
@@ -1,6 +1,118 @@
-import csv, os, logging
+import os, logging
 import numpy as np
+from collections import namedtuple
 from datetime import datetime
+from itertools import islice
+from measurement_store import MEASURED, ERROR_NAMES
+
+# Angle columns of the relative error file, in the order of the measurement grid
+GEOMETRY_COLUMNS = ("light_rad", "light_az", "det_az", "det_rad")
+
+# Labels of the data blocks of the spectral contents the writer supports
+SPECTRAL_LABELS = {"RGB": ("R", "G", "B")}
+
+# Grids with fewer values are formatted value by value, which is faster for them
+FAST_FORMAT_MIN_SIZE = 256
+
+ZemaxBSDF = namedtuple("ZemaxBSDF", ["symmetry", "spectral_content", "scatter_type", "sample_rotations",
+                                     "incidence_angles", "azimuth_angles", "radial_angles", "tis", "data"])
+
+def format_grid(grid):
+    """
+    Text of a 2D grid in the "%.3E" format, tab-separated with one line per row, built as one byte array.
+    Values whose rounding is too close to call in floating point are formatted by Python, as are small grids
+    and grids with negative, non-finite or very large/small values, so the text is always the same as with "%.3E".
+    """
+    grid = np.asarray(grid, dtype=float)
+    values = grid.ravel()
+    zero = values == 0
+    if values.size < FAST_FORMAT_MIN_SIZE or not np.all(np.isfinite(values) & (values >= 0)):
+        return _format_grid_slow(grid)
+
+    # Decimal exponent and 4-digit mantissa, with the exponent corrected where log10 is off by one
+    magnitude = np.where(zero, 1.0, values)
+    exponent = np.floor(np.log10(magnitude)).astype(np.int64)
+    for _ in range(2):
+        scaled = magnitude / 10.0 ** (exponent - 3)
+        exponent += (scaled >= 9999.5).astype(np.int64) - (scaled < 999.5).astype(np.int64)
+    scaled = magnitude / 10.0 ** (exponent - 3)
+    mantissa = np.rint(scaled).astype(np.int64)
+    mantissa[zero], exponent[zero] = 0, 0
+    if np.any(np.abs(exponent) > 99) or np.any((mantissa > 9999) | (~zero & (mantissa < 1000))):
+        return _format_grid_slow(grid)
+
+    # d.dddE+dd followed by a tab, or a newline at the end of a row
+    text = np.empty((values.size, 10), dtype=np.uint8)
+    text[:, 0] = 48 + mantissa // 1000
+    text[:, 1] = ord(".")
+    text[:, 2] = 48 + mantissa // 100 % 10
+    text[:, 3] = 48 + mantissa // 10 % 10
+    text[:, 4] = 48 + mantissa % 10
+    text[:, 5] = ord("E")
+    text[:, 6] = np.where(exponent < 0, ord("-"), ord("+"))
+    text[:, 7] = 48 + np.abs(exponent) // 10
+    text[:, 8] = 48 + np.abs(exponent) % 10
+    text[:, 9] = ord("\t")
+    text.reshape(grid.shape + (10,))[..., -1, 9] = ord("\n")
+
+    # Near a rounding tie the binary scaling above can round the other way than Python,
+    # also at 9.9995 where the tie decides the exponent
+    tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    tie |= (mantissa == 1000) & (np.abs(magnitude / 10.0 ** (exponent - 4) - 9999.5) < 1e-6)
+    for index in np.flatnonzero(tie):
+        text[index, :9] = np.frombuffer(f"{values[index]:.3E}".encode(), dtype=np.uint8)
+
+    return text.tobytes().decode("ascii")
+
+def _format_grid_slow(grid):
+    """Text of a 2D grid formatted value by value."""
+    row_format = "\t".join(["%.3E"] * grid.shape[1]) + "\n"
+    return (row_format * grid.shape[0]) % tuple(grid.ravel().tolist())
+
+def write_zemax_bsdf(filename, symmetry, spectral_content, scatter_type, sample_rotations, incidence_angles,
+                     azimuth_angles, radial_angles, data, tis=None):
+    """
+    Write a Zemax Tabular BSDF file from a dense (rotation, incidence, azimuth, radial, channel) array.
+    `tis` is one value per (rotation, incidence), or per (rotation, incidence, channel); by default the
+    sum of all channels over the scatter grid. Every 2D grid is formatted at once by format_grid.
+    """
+    labels = SPECTRAL_LABELS[spectral_content]
+    data = np.asarray(data, dtype=float)
+    shape = (len(sample_rotations), len(incidence_angles), len(azimuth_angles), len(radial_angles), len(labels))
+    if data.shape != shape:
+        raise ValueError(f"BSDF data shape {data.shape} does not match the angle lists {shape}")
+
+    if tis is None:
+        tis = data.sum(axis=(2, 3, 4))
+    tis = np.asarray(tis, dtype=float)
+    if tis.ndim == 2:
+        tis = np.repeat(tis[..., np.newaxis], len(labels), axis=2)
+
+    with open(filename, "w") as f:
+        # File metadata and axis definitions
+        f.write("# Data Generated by Python BSDF Generator\n")
+        f.write(f"# {datetime.now().strftime('%m/%d/%Y %I:%M:%S %p')}\n")
+        f.write("Source  Measured\n")
+        f.write(f"Symmetry  {symmetry}\n")
+        f.write(f"SpectralContent  {spectral_content}\n")
+        f.write(f"ScatterType  {scatter_type}\n")
+
+        for name, angles in (("SampleRotation ", sample_rotations), ("AngleOfIncidence  ", incidence_angles),
+                             ("ScatterAzimuth ", azimuth_angles), ("ScatterRadial ", radial_angles)):
+            f.write(f"{name}{len(angles)}\n")
+            f.write("\t".join(map(str, angles)) + "\n")
+        f.write("\n")
+
+        # One data block per channel with a TIS line and a 2D grid per (rotation, incidence)
+        for channel, label in enumerate(labels):
+            f.write(f"{label}\nDataBegin\n")
+            for rot in range(shape[0]):
+                for inc in range(shape[1]):
+                    f.write(f"TIS {tis[rot, inc, channel]:.2f}\n")
+                    f.write(format_grid(data[rot, inc, :, :, channel]))
+            f.write("DataEnd\n\n")
+
+    logging.info(f"BSDF data file saved to {filename}")
 
 def generate_zemax_bsdf_file(
     filename: str,
@@ -14,91 +126,113 @@ def generate_zemax_bsdf_file(
     tis_data: dict,
     bsdf_data: dict,
 ):
-    """Generate a Zemax Tabular BSDF file."""
-    def write_header(f):
-        """Write file metadata and axis definitions for the BSDF format."""
-        f.write("# Data Generated by Python BSDF Generator\n")
-        f.write(f"# {datetime.now().strftime('%m/%d/%Y %I:%M:%S %p')}\n")
-        f.write("Source  Measured\n")
-        f.write(f"Symmetry  {symmetry}\n")
-        f.write(f"SpectralContent  {spectral_content}\n")
-        f.write(f"ScatterType  {scatter_type}\n")
-
-        # Axis definitions
-        f.write(f"SampleRotation {len(sample_rotations)}\n")
-        f.write("\t".join(map(str, sample_rotations)) + "\n")
-
-        f.write(f"AngleOfIncidence  {len(incidence_angles)}\n")
-        f.write("\t".join(map(str, incidence_angles)) + "\n")
-
-        f.write(f"ScatterAzimuth {len(azimuth_angles)}\n")
-        f.write("\t".join(map(str, azimuth_angles)) + "\n")
-
-        f.write(f"ScatterRadial {len(radial_angles)}\n")
-        f.write("\t".join(map(str, radial_angles)) + "\n\n")
-
-    def write_data_block(f, component_index: int, label: str):
-        """Write a block of BSDF data for a specific spectral content (R, G, or B)."""
-        f.write(f"{label}\n")
-        f.write("DataBegin\n")
-
-        for rot in sample_rotations:
-            for inc in incidence_angles:
-                key = (rot, inc)
-                tis = tis_data.get(key, 0.0)
-                grid = bsdf_data.get(key)
-
-                if grid is None:
-                    raise ValueError(f"Missing BSDF data for rotation={rot}, incidence={inc}")
-
-                f.write(f"TIS {tis:.2f}\n")
-
-                # Write 2D grid for this rotation-incidence pair
-                for row in grid:
-                    line = []
-                    for triple in row:
-                        val = triple[component_index] if triple is not None else 0.0
-                        line.append(f"{val:.3E}")
-                    f.write("\t".join(line) + "\n")
-
-        f.write("DataEnd\n\n")
-
-    # Write the complete BSDF file
-    with open(filename, 'w') as f:
-        write_header(f)
-        write_data_block(f, component_index=0, label="R")
-        write_data_block(f, component_index=1, label="G")
-        write_data_block(f, component_index=2, label="B")
-    
-    logging.info(f"BSDF data file saved to {filename}")
-
-def save_relative_errors(app, output_folder, filename):
-    """Save the relative errors to a CSV file."""
+    """Generate a Zemax Tabular BSDF file from TIS values and 2D grids of (R, G, B) triples per (rotation, incidence)."""
+    data = np.zeros((len(sample_rotations), len(incidence_angles), len(azimuth_angles), len(radial_angles), 3))
+    tis = np.zeros(data.shape[:2])
+
+    for i, rot in enumerate(sample_rotations):
+        for j, inc in enumerate(incidence_angles):
+            grid = bsdf_data.get((rot, inc))
+            if grid is None:
+                raise ValueError(f"Missing BSDF data for rotation={rot}, incidence={inc}")
+
+            tis[i, j] = tis_data.get((rot, inc), 0.0)
+            data[i, j] = [[triple if triple is not None else (0.0, 0.0, 0.0) for triple in row] for row in grid]
+
+    write_zemax_bsdf(filename, symmetry, spectral_content, scatter_type, sample_rotations, incidence_angles,
+                     azimuth_angles, radial_angles, data, tis)
+
+def read_zemax_bsdf(filename):
+    """
+    Read a Zemax Tabular BSDF file into arrays, one 2D grid at a time, so the file is never held as Python lists.
+    Returns a ZemaxBSDF with angle arrays, `tis` of shape (rotation, incidence, channel)
+    and `data` of shape (rotation, incidence, azimuth, radial, channel).
+    """
+    header, axes = {}, {}
+    axis_names = {"SampleRotation": "sample_rotations", "AngleOfIncidence": "incidence_angles",
+                  "ScatterAzimuth": "azimuth_angles", "ScatterRadial": "radial_angles"}
+
+    with open(filename) as f:
+        lines = (line.strip() for line in f)
+        for line in lines:
+            if not line or line.startswith("#"):
+                continue
+
+            key, _, value = line.partition(" ")
+            if key in axis_names:
+                axes[axis_names[key]] = np.array(next(lines).split(), dtype=float)
+                if len(axes[axis_names[key]]) != int(value):
+                    raise ValueError(f"{filename}: {key} lists {len(axes[axis_names[key]])} angles, expected {value}")
+            elif not value:
+                # Data block of one channel, labelled by `key`
+                if next(lines, "") != "DataBegin":
+                    raise ValueError(f"{filename}: expected DataBegin after {key!r}")
+                if "data" not in header:
+                    labels = SPECTRAL_LABELS.get(header.get("SpectralContent"), ())
+                    shape = tuple(len(axes[name]) for name in axis_names.values())
+                    header["data"] = np.zeros(shape + (max(len(labels), 1),))
+                    header["tis"] = np.zeros(shape[:2] + (max(len(labels), 1),))
+                    header["labels"] = labels
+                channel = header["labels"].index(key) if key in header["labels"] else 0
+                _read_data_block(lines, header["tis"][..., channel], header["data"][..., channel], filename)
+            else:
+                header[key] = value.strip()
+
+    if "data" not in header:
+        raise ValueError(f"{filename}: no data blocks")
+
+    return ZemaxBSDF(header.get("Symmetry"), header.get("SpectralContent"), header.get("ScatterType"),
+                     axes["sample_rotations"], axes["incidence_angles"], axes["azimuth_angles"], axes["radial_angles"],
+                     header["tis"], header["data"])
+
+def _read_data_block(lines, tis, data, filename):
+    """Fill the TIS values and grids of one channel from the lines after DataBegin, up to DataEnd."""
+    azimuths, radials = data.shape[2:]
+    for rot in range(data.shape[0]):
+        for inc in range(data.shape[1]):
+            key, _, value = next(lines).partition(" ")
+            if key != "TIS":
+                raise ValueError(f"{filename}: expected a TIS line, got {key!r}")
+            tis[rot, inc] = float(value)
+
+            # One conversion for the whole grid
+            grid = np.fromstring(" ".join(islice(lines, azimuths)), sep=" ")
+            if grid.size != azimuths * radials:
+                raise ValueError(f"{filename}: grid with {grid.size} values, expected {azimuths * radials}")
+            data[rot, inc] = grid.reshape(azimuths, radials)
+
+    if next(lines, "") != "DataEnd":
+        raise ValueError(f"{filename}: data block longer than the angle lists")
+
+def save_relative_errors(store, output_folder, filename):
+    """Save the relative errors of all measured positions of a MeasurementStore to a CSV file."""
     os.makedirs(output_folder, exist_ok=True)
     filepath = os.path.join(output_folder, filename)
 
     try:
-        with open(filepath, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["light_az", "light_rad", "det_az", "det_rad", "r_err", "g_err", "b_err"])
-
-            r_list, g_list, b_list = [], [], []
+        geometries = store.measured()
+        errors = store.errors[store.status == MEASURED]
 
-            for (light_az, light_rad, det_az, det_rad), (r_err, g_err, b_err) in app.relative_errors.items():
-                writer.writerow([light_az, light_rad, det_az, det_rad, r_err, g_err, b_err])
-                r_list.append(r_err)
-                g_list.append(g_err)
-                b_list.append(b_err)
-
-            # Compute and write mean values
-            mean_r = np.mean(r_list) if r_list else 0
-            mean_g = np.mean(g_list) if g_list else 0
-            mean_b = np.mean(b_list) if b_list else 0
+        with open(filepath, "w", newline="") as f:
+            # Spatial errors (pixel spread in the ROI), then temporal errors (frame-to-frame noise)
+            f.write(",".join(GEOMETRY_COLUMNS + ERROR_NAMES) + "\n")
+            np.savetxt(f, np.column_stack([geometries, errors]), delimiter=",",
+                       fmt=["%g"] * len(GEOMETRY_COLUMNS) + ["%.6g"] * len(ERROR_NAMES))
 
-            writer.writerow([])
-            writer.writerow(["Mean", "", "", "", mean_r, mean_g, mean_b])
+            # Mean values (temporal errors are NaN for single-frame positions)
+            f.write("\n")
+            f.write(",".join(["Mean"] + [""] * (len(GEOMETRY_COLUMNS) - 1) + [f"{value:.6g}" for value in store.mean_errors()]) + "\n")
 
         logging.info(f"Relative errors saved to {filepath}")
 
     except Exception as e:
-        logging.error(f"Error saving relative errors: {e}")
\ No newline at end of file
+        logging.error(f"Error saving relative errors: {e}")
+
+def save_results(store, filename, scatter_type="BRDF"):
+    """Write the Zemax BSDF file of a MeasurementStore and the relative errors next to it, as Step 5 does."""
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    angles = (axis.tolist() for axis in store.axes)
+    write_zemax_bsdf(filename, "Asymmetrical4D", "RGB", scatter_type, *angles, store.values)
+
+    error_filename = os.path.splitext(os.path.basename(filename))[0] + "_relative_errors.csv"
+    save_relative_errors(store, output_folder=os.path.dirname(filename) or ".", filename=error_filename)
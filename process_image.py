@@ -1,69 +1,108 @@
 import cv2, logging
 import numpy as np
-from skimage.measure import shannon_entropy
+from exposure import SENSOR_LEVELS
+from roi import Circle, roi_stats
+from bayer import DEFAULT_PATTERN, bayer_planes, green_mean
 
-def extract_color_channels(image):
+# Static noise thresholds: frames above either value are rejected
+VARIANCE_THRESHOLD = 100
+ENTROPY_THRESHOLD = 3
+
+# Size of the grid the noise check reads from every frame
+NOISE_GRID_SIZE = 256
+
+# Color-plane pixels kept on each side of the centre by crop_to_roi
+ROI_WINDOW_HALF_SIZE = 32
+
+def extract_color_channels(image, pattern=DEFAULT_PATTERN):
     """Extract Red, Green, and Blue color channels from a Bayer RAW image."""
-    # Bayer pattern: BGGR (Blue in top-left)
-    B = image[0::2, 0::2]     # Blue pixels (even rows and even columns)
-    G1 = image[0::2, 1::2]    # Green pixels (even rows, odd columns)
-    G2 = image[1::2, 0::2]    # Green pixels (odd rows, even columns)
-    R = image[1::2, 1::2]     # Red pixels (odd rows and odd columns)
+    # R and B are views into the raw image, the pattern comes from the camera configuration (bayer.camera_pattern)
+    planes = bayer_planes(image, pattern)
+
+    # Average two green channels (float32)
+    G = green_mean(planes["G1"], planes["G2"])
 
-    # Average two green channels
-    G = (G1 + G2) / 2
+    return planes["R"], G, planes["B"]
 
-    return R, G, B
+def crop_to_roi(image, half_size=ROI_WINDOW_HALF_SIZE):
+    """
+    Cut a Bayer-aligned window out of a raw frame around the ROI at the plane centre.
+    The window spans `half_size` color-plane pixels on each side of the plane centre and starts on
+    an even row and column, so the color channels extracted from it keep the same layout and centre.
+    """
+    plane_cy, plane_cx = (image.shape[0] // 2) // 2, (image.shape[1] // 2) // 2
+    half = min(half_size, plane_cy, plane_cx)
+    return image[2 * (plane_cy - half):2 * (plane_cy + half), 2 * (plane_cx - half):2 * (plane_cx + half)]
 
 def circular_roi_mean(image, diameter=20):
     """Compute the mean intensity and relative 1-sigma error within a circular ROI at image center."""
-    radius = diameter // 2
-    center_y, center_x = image.shape[0] // 2, image.shape[1] // 2
-    
-    # Create circular mask around center
-    y, x = np.ogrid[:image.shape[0], :image.shape[1]]
-    mask = (x - center_x)**2 + (y - center_y)**2 <= radius**2
-    roi_values = image[mask] # Extract pixel values within ROI
+    # ROI pixel indices are cached per image shape and diameter
+    mean_val, std_val, N = roi_stats(image, Circle(diameter)) # TODO: constant*mean_value = BSDF value
 
     # Mean and error estimation
-    N = len(roi_values)
-    mean_val = np.mean(roi_values) # TODO: constant*mean_value = BSDF value
-    std_val = np.std(roi_values)
     sigma = std_val / np.sqrt(N) 
     relative_error = sigma / mean_val 
 
     return float(mean_val), float(relative_error)
 
-def entropy_noise_check(image, entropy_threshold=3):
-    """Use Shannon entropy to detect noise. Low entropy reflects static noise."""
-    gray = image.astype(np.float32) / 1023.0  # Normalize to [0, 1]
-    entropy = shannon_entropy(gray)
-    logging.info(f"Entropy Value: {entropy}")
+def static_noise_scores(frames, grid_size=NOISE_GRID_SIZE, levels=SENSOR_LEVELS):
+    """
+    Local variance and entropy of every frame of a burst: a (frames, height, width) stack or a list of raw frames.
+    Only a grid_size x grid_size grid of every frame is read: a bilinear resample (cv2.resize reads the 4 pixels
+    around every grid point), whose fine detail (grid minus its 5x5 Gaussian blur) gives the variance, and the
+    raw pixels nearest to the grid points, whose histogram gives the entropy.
+    The blur, the variance and the histogram each run once for the whole burst. Returns (variances, entropies).
+    """
+    count = len(frames)
+    height, width = frames[0].shape
+    rows = ((np.arange(grid_size) + 0.5) * height / grid_size).astype(np.intp)[:, np.newaxis]
+    cols = ((np.arange(grid_size) + 0.5) * width / grid_size).astype(np.intp)
 
-    # Return True if entropy suggests noise
-    return entropy > entropy_threshold
+    # Resampled grid and raw grid samples of every frame
+    grid = np.empty((count, grid_size, grid_size), dtype=frames[0].dtype)
+    samples = np.empty((count, grid_size, grid_size), dtype=frames[0].dtype)
+    for frame, resampled, sampled in zip(frames, grid, samples):
+        cv2.resize(frame, (grid_size, grid_size), dst=resampled)
+        sampled[...] = frame[rows, cols]
 
-def local_variance_noise_check(image, var_threshold=100):
-    """Check local variance of image to detect static noise."""
-    image = cv2.resize(image, (256, 256))  # Standardize resolution
-    blur = cv2.GaussianBlur(image, (5, 5), 0) # Blur to remove detail
-    diff = cv2.absdiff(image, blur) # Highlight fine noise
-    variance = np.var(diff)
+    # Fine detail of all frames in one blur call, with the frames as channels
+    grid = np.ascontiguousarray(np.moveaxis(grid, 0, -1))
+    blurred = cv2.GaussianBlur(grid, (5, 5), 0).reshape(grid.shape)  # cv2 drops a single channel
+    detail = cv2.absdiff(grid, blurred).reshape(-1, count).T.astype(np.float32)
+    variances = detail.var(axis=1, dtype=np.float64)
 
-    logging.info(f"Variance Value: {variance}")
+    # One histogram of all frames, every frame counted in its own range of bins
+    samples = samples.reshape(count, -1)
+    levels = max(levels, int(samples.max()) + 1)
+    if count * levels <= 65536 and samples.dtype == np.uint16:
+        bins = samples + (levels * np.arange(count, dtype=np.uint16))[:, np.newaxis]
+        counts = cv2.calcHist([bins.reshape(1, -1)], [0], None, [count * levels], [0, count * levels]).ravel()
+    else:
+        bins = samples.astype(np.intp) + levels * np.arange(count)[:, np.newaxis]
+        counts = np.bincount(bins.ravel(), minlength=count * levels)
+    p = counts.reshape(count, levels).astype(np.float64) / samples.shape[1]
+    entropies = -np.sum(p * np.log2(np.where(p > 0, p, 1)), axis=1)
+    return variances, entropies
 
-    # Return True if variance exceed threshold (image has structure)
-    return variance > var_threshold
-
-def detect_static_noise(image):
+def detect_static_noise(image, var_threshold=VARIANCE_THRESHOLD, entropy_threshold=ENTROPY_THRESHOLD):
     """Noise check using local variance and entropy."""
+    noisy, _ = screen_static_noise([image], var_threshold, entropy_threshold)
+    return bool(noisy[0])
+
+def screen_static_noise(frames, var_threshold=VARIANCE_THRESHOLD, entropy_threshold=ENTROPY_THRESHOLD):
+    """
+    Noise check of a burst (stacked or a list of frames) that also returns the scores it was based on:
+    (noisy, (variances, entropies)), noisy being True for frames with static noise.
+    """
     try:
-        variance_check = local_variance_noise_check(image)
-        entropy_check = entropy_noise_check(image)
-        
-        # Return True if either method detects static noise
-        return variance_check or entropy_check
+        variances, entropies = static_noise_scores(frames)
+        logging.info(f"Variance Values: {np.array2string(variances, precision=1)}")
+        logging.info(f"Entropy Values: {np.array2string(entropies, precision=2)}")
+
+        # Noisy if either method detects static noise
+        return (variances > var_threshold) | (entropies > entropy_threshold), (variances, entropies)
 
     except Exception as e:
         logging.error(f"Error during noise detection: {e}")
-        return False
\ No newline at end of file
+        nan = np.full(len(frames), np.nan)
+        return np.zeros(len(frames), dtype=bool), (nan, nan)
@@ -0,0 +1,130 @@
+import os, time, argparse, logging
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+from archive import MeasurementArchive
+from accumulator import FrameAccumulator
+from dark_library import DarkLibrary
+from hdr import merge_bracket
+from process_image import VARIANCE_THRESHOLD, ENTROPY_THRESHOLD, ROI_WINDOW_HALF_SIZE, crop_to_roi
+from roi import Circle, roi_from_string, roi_extent, burst_results
+from output_data import save_results
+from measurement_store import MeasurementStore
+
+# Positions handed to a worker at once; small enough to keep all workers busy until the end
+CHUNK_SIZE = 8
+
+# Settings and open archive of a worker process, set up once per process by init_worker
+_worker = None
+
+def reprocessing_settings(archive, roi=None, dark_value=None, dark_library=None,
+                          var_threshold=VARIANCE_THRESHOLD, entropy_threshold=ENTROPY_THRESHOLD):
+    """Settings for reprocessing an archive: the stored ones, except where new values are given."""
+    attributes = archive.attributes
+    roi = roi if roi is not None else roi_from_string(str(attributes["roi"]))
+    if attributes["roi_only"] and roi_extent(roi) >= ROI_WINDOW_HALF_SIZE:
+        raise ValueError(f"ROI {roi} does not fit the ROI windows stored in {archive.path}")
+
+    return {
+        "mode": str(attributes["capture_mode"]),
+        "pattern": str(attributes["pattern"]),
+        "roi": roi,
+        "roi_only": bool(attributes["roi_only"]),
+        "dark_value": float(attributes["dark_value"]) if dark_value is None else dark_value,
+        "dark_library": str(attributes["dark_library"]) if dark_library is None else dark_library,
+        "var_threshold": var_threshold,
+        "entropy_threshold": entropy_threshold,
+    }
+
+def init_worker(path, settings):
+    """Open the archive and the dark library once per worker process."""
+    global _worker
+    dark_library = None
+    if settings["dark_library"]:
+        dark_library = DarkLibrary(settings["dark_library"])
+        if not dark_library.load():
+            raise ValueError(f"Could not load dark library {settings['dark_library']}")
+
+    _worker = SimpleNamespace(**settings)
+    _worker.archive, _worker.dark_library, _worker.burst = MeasurementArchive(path), dark_library, FrameAccumulator()
+
+def process_position(geometry):
+    """
+    Recompute the BSDF values of one position from its raw frames, like scan_positions does during capture.
+    Returns (geometry, (r, g, b) means, relative errors), or None if no frame of the position is usable.
+    """
+    w = _worker
+    frames, info = w.archive.frames(geometry), w.archive.frame_info(geometry)
+    w.burst.reset()
+
+    if w.mode == "hdr":
+        # One merged radiance image from the bracket
+        darks = None
+        if w.dark_library is not None:
+            darks = [w.dark_library.master(row["exposure"], row["gain"], frame.shape) for frame, row in zip(frames, info)]
+        radiance = merge_bracket(list(zip(frames, info["exposure"])), dark_level=w.dark_value, darks=darks)
+        w.burst.add(crop_to_roi(radiance) if w.roi_only else radiance)
+    else:
+        # Apply the new noise thresholds to the scores stored with every frame (NaN scores pass)
+        noisy = (info["variance"] > w.var_threshold) | (info["entropy"] > w.entropy_threshold)
+        for frame, row in zip(frames[~noisy], info[~noisy]):
+            if w.dark_library is not None:
+                corrected = w.dark_library.correct(frame, row["exposure"], row["gain"])
+            else:
+                corrected = np.clip(frame.astype(np.float32) - w.dark_value, 0, None)
+            # Full frames saved in ROI-only mode were only averaged inside the ROI window
+            w.burst.add(crop_to_roi(corrected) if w.roi_only else corrected)
+
+    if not w.burst.count:
+        return None
+    means, errors = burst_results(w.burst, w.roi, w.pattern)
+    return geometry, means, errors
+
+def reprocess(path, workers=None, **overrides):
+    """
+    Recompute the BSDF values and relative errors of a stored scan in parallel over positions.
+    `overrides` are new settings (roi, dark_value, dark_library, var_threshold, entropy_threshold).
+    Frames rejected during capture are not in the archive, so looser noise thresholds cannot bring them back.
+    Returns a MeasurementStore like app.measurements after a measurement.
+    """
+    with MeasurementArchive(path) as archive:
+        settings = reprocessing_settings(archive, **overrides)
+        geometries = archive.geometries()
+        angles = {name: np.asarray(archive.attributes[name]).tolist()
+                  for name in ("light_radial_angles", "incidence_angles", "det_azimuth_angles", "det_radial_angles")}
+
+    logging.info(f"Reprocessing {len(geometries)} positions of {path} with {settings}")
+    result = MeasurementStore(*angles.values())
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(path, settings)) as pool:
+        for position in pool.map(process_position, geometries, chunksize=CHUNK_SIZE):
+            if position is None:
+                continue
+            result.store(*position)
+
+    logging.info(f"Reprocessed {len(result)} positions in {time.perf_counter() - start:.1f} s")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute the BSDF of a stored scan with new processing settings.")
+    parser.add_argument("archive", help="Measurement archive (.h5) written during the scan")
+    parser.add_argument("output", help="Zemax BSDF file to write")
+    parser.add_argument("--roi-diameter", type=int, help="Diameter of a centred circular ROI (plane pixels)")
+    parser.add_argument("--dark-value", type=float, help="Scalar dark level instead of the stored one")
+    parser.add_argument("--dark-library", help="Dark library file for per-pixel dark correction ('' for none)")
+    parser.add_argument("--var-threshold", type=float, default=VARIANCE_THRESHOLD, help="Local variance noise threshold")
+    parser.add_argument("--entropy-threshold", type=float, default=ENTROPY_THRESHOLD, help="Entropy noise threshold")
+    parser.add_argument("--scatter-type", default="BRDF", choices=("BRDF", "BTDF"), help="Scatter type of the BSDF file")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    roi = Circle(args.roi_diameter) if args.roi_diameter else None
+    result = reprocess(args.archive, args.workers, roi=roi, dark_value=args.dark_value, dark_library=args.dark_library,
+                       var_threshold=args.var_threshold, entropy_threshold=args.entropy_threshold)
+    save_results(result, args.output, args.scatter_type)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import os, time, argparse, logging
+import numpy as np
+from scipy.interpolate import CubicSpline
+from scan_planner import is_blocked
+from measurement_store import MEASURED
+from output_data import write_zemax_bsdf, read_zemax_bsdf
+from journal import ScanJournal
+
+# Interpolation methods: "linear" is multilinear over the 4 angles, "cubic" a tensor-product natural cubic spline
+METHODS = ("linear", "cubic")
+
+# Interpolation weight below which a target point counts as not covered by measured points
+MIN_WEIGHT = 1e-6
+
+def uniform_axis(angles, step):
+    """Evenly spaced angles with the given step from the first angle, within the range of `angles`."""
+    start, end = min(angles), max(angles)
+    return start + step * np.arange(int(np.floor((end - start) / step + 1e-9)) + 1)
+
+def decimate_axis(angles, factor):
+    """Every `factor`-th angle, always keeping the last one so the range is unchanged."""
+    angles = np.sort(np.asarray(angles, dtype=float))
+    decimated = angles[::factor]
+    return decimated if decimated[-1] == angles[-1] else np.append(decimated, angles[-1])
+
+def interpolation_weights(source, target, method="linear"):
+    """
+    (len(target), len(source)) matrix of 1D interpolation weights. Source angles need not be sorted or evenly spaced;
+    rows of targets outside the source range are zero, so nothing is extrapolated.
+    """
+    source, target = np.asarray(source, dtype=float), np.asarray(target, dtype=float)
+    order = np.argsort(source)
+    x = source[order]
+    weights = np.zeros((len(target), len(source)))
+
+    if len(x) == 1:
+        weights[np.isclose(target, x[0]), order[0]] = 1.0
+        return weights
+
+    inside = (target >= x[0] - 1e-9) & (target <= x[-1] + 1e-9)
+    if method == "cubic" and len(x) > 2:
+        # The spline is linear in the data: interpolating the identity gives the weight of every source point
+        weights[np.ix_(inside, order)] = CubicSpline(x, np.eye(len(x)), bc_type="natural")(target[inside])
+        return weights
+
+    right = np.searchsorted(x, target[inside], side="right").clip(1, len(x) - 1)
+    left = right - 1
+    t = ((target[inside] - x[left]) / (x[right] - x[left])).clip(0, 1)
+    rows = np.nonzero(inside)[0]
+    weights[rows, order[left]] = 1 - t
+    weights[rows, order[right]] = t
+    return weights
+
+def apply_weights(array, weights, axis):
+    """Interpolate `array` along one axis with a weight matrix from interpolation_weights."""
+    return np.moveaxis(np.tensordot(weights, array, axes=(1, axis)), 0, axis)
+
+def separable(array, weight_matrices):
+    """Apply one weight matrix per axis, the most shrinking first so the intermediate arrays stay small."""
+    for axis in sorted(range(len(weight_matrices)), key=lambda a: weight_matrices[a].shape[0] / weight_matrices[a].shape[1]):
+        array = apply_weights(array, weight_matrices[axis], axis)
+    return array
+
+def fill_missing(angles, values, valid, axis):
+    """
+    Fill missing points by linear interpolation between the nearest measured points along one axis
+    (ascending angles), holding the end values beyond them. Returns (values, valid) with the filled points valid.
+    """
+    x = np.asarray(angles, dtype=float)
+    n = len(x)
+    values, valid = np.moveaxis(values.copy(), axis, -2), np.moveaxis(valid.copy(), axis, -1)  # Channel stays last
+
+    # Only lines with missing points are touched
+    lines = ~valid.all(axis=-1)
+    v, vals = valid[lines], values[lines]
+
+    # Nearest measured point before and after every point of a line
+    index = np.arange(n)
+    before = np.maximum.accumulate(np.where(v, index, -1), axis=-1)
+    after = np.minimum.accumulate(np.where(v, index, n)[:, ::-1], axis=-1)[:, ::-1]
+    has_before, has_after = before >= 0, after < n
+    before, after = before.clip(0, n - 1), after.clip(0, n - 1)
+
+    span = x[after] - x[before]
+    t = np.where(has_before & has_after & (span > 0), (x - x[before]) / np.where(span > 0, span, 1), np.where(has_before, 0.0, 1.0))
+    filled = (np.take_along_axis(vals, before[..., np.newaxis], axis=-2) * (1 - t)[..., np.newaxis]
+              + np.take_along_axis(vals, after[..., np.newaxis], axis=-2) * t[..., np.newaxis])
+
+    values[lines] = np.where(v[..., np.newaxis], vals, filled)
+    valid[lines] = has_before | has_after
+    return np.moveaxis(values, -2, axis), np.moveaxis(valid, -1, axis)
+
+def resample(axes, values, valid, target_axes, method="linear"):
+    """
+    Resample (light_rad, light_az, det_az, det_rad, channel) BSDF values measured on `axes` onto `target_axes`.
+    Linear: only points where `valid` is set contribute (normalised convolution), the interpolation weights of
+    missing points are dropped and the rest renormalised. Cubic: missing points are first filled linearly along the
+    scatter axes, then the light axes, and the spline runs over the filled grid. Returns (values, valid) on the
+    target grid; targets outside the measured range, without measured neighbours or blocked by the detector are not valid.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown interpolation method {method!r}, expected one of {METHODS}")
+    values = np.asarray(values, dtype=np.float64)
+    valid = np.asarray(valid, dtype=bool)
+
+    linear = [interpolation_weights(source, target) for source, target in zip(axes, target_axes)]
+    weight = separable(valid.astype(np.float64), linear)
+    covered = weight > MIN_WEIGHT
+
+    if method == "cubic":
+        filled, filled_valid = values, valid
+        for axis in (2, 3, 1, 0):
+            if filled_valid.all():
+                break
+            order = np.argsort(axes[axis])
+            angles = np.asarray(axes[axis], dtype=float)[order]
+            sorted_values, sorted_valid = fill_missing(angles, np.take(filled, order, axis=axis), np.take(filled_valid, order, axis=axis), axis)
+            filled, filled_valid = np.take(sorted_values, np.argsort(order), axis=axis), np.take(sorted_valid, np.argsort(order), axis=axis)
+        splines = [interpolation_weights(source, target, "cubic") for source, target in zip(axes, target_axes)]
+        result = separable(np.where(filled_valid[..., np.newaxis], filled, 0.0), splines)
+    else:
+        masked = values * valid[..., np.newaxis]
+        result = separable(masked, linear) / np.where(covered, weight, 1.0)[..., np.newaxis]
+
+    valid_out = covered & ~is_blocked(*np.ix_(*(np.asarray(axis, dtype=float) for axis in target_axes)))
+    result[~valid_out] = 0.0
+    return result, valid_out
+
+def target_axes(axes, steps=None, factors=None):
+    """New angle lists: uniform with the given step, or decimated by the given factor, per axis (None keeps the axis)."""
+    result = []
+    for i, axis in enumerate(axes):
+        if steps is not None and steps[i]:
+            result.append(uniform_axis(axis, steps[i]))
+        elif factors is not None and factors[i] and factors[i] > 1:
+            result.append(decimate_axis(axis, factors[i]))
+        else:
+            result.append(np.asarray(axis, dtype=float))
+    return result
+
+def load_measurement(path):
+    """Axes, values, valid mask and scatter type of a Zemax BSDF file or a scan journal."""
+    if os.path.splitext(path)[1] == ".jsonl":
+        journal = ScanJournal(path)
+        if not journal.load():
+            raise ValueError(f"No scan journal in {path}")
+        store = journal.to_store()
+        return store.axes, store.values, store.status == MEASURED, None
+
+    bsdf = read_zemax_bsdf(path)
+    # Missing and blocked positions are written as zeros
+    axes = (bsdf.sample_rotations, bsdf.incidence_angles, bsdf.azimuth_angles, bsdf.radial_angles)
+    return axes, bsdf.data, bsdf.data.any(axis=-1), bsdf.scatter_type
+
+def parse_axis_values(text, cast):
+    """Four comma-separated per-axis values, empty or 0 to keep an axis."""
+    if text is None:
+        return None
+    values = text.split(",")
+    if len(values) != 4:
+        raise argparse.ArgumentTypeError(f"expected 4 comma-separated values (ls_rad, ls_az, det_az, det_rad), got {text!r}")
+    return [cast(value) if value.strip() else None for value in values]
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample a measured BSDF onto a uniform or coarser angle grid.")
+    parser.add_argument("input", help="Zemax BSDF file (.bsdf) or scan journal (.jsonl)")
+    parser.add_argument("output", help="Zemax BSDF file to write")
+    parser.add_argument("--step", type=lambda text: parse_axis_values(text, float),
+                        help="Uniform step per axis in degrees: ls_rad,ls_az,det_az,det_rad (empty keeps an axis)")
+    parser.add_argument("--decimate", type=lambda text: parse_axis_values(text, int),
+                        help="Keep every n-th angle per axis: ls_rad,ls_az,det_az,det_rad (empty keeps an axis)")
+    parser.add_argument("--method", default="linear", choices=METHODS, help="Interpolation method")
+    parser.add_argument("--scatter-type", choices=("BRDF", "BTDF"), help="Scatter type (default: that of the input)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    axes, values, valid, scatter_type = load_measurement(args.input)
+    target = target_axes(axes, args.step, args.decimate)
+
+    start = time.perf_counter()
+    data, _ = resample(axes, values, valid, target, args.method)
+    logging.info(f"Resampled {values.shape[:4]} to {data.shape[:4]} ({args.method}) in {time.perf_counter() - start:.2f} s")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    write_zemax_bsdf(args.output, "Asymmetrical4D", "RGB", args.scatter_type or scatter_type or "BRDF",
+                     *([int(a) if a.is_integer() else a for a in axis.tolist()] for axis in target), data)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import ast
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from bayer import DEFAULT_PATTERN, bayer_offsets, green_mean
+
+# ROI shapes in color-plane pixels. Offsets (dy, dx) are relative to the plane centre,
+# so the same ROI selects the same pixels in a full frame and in a crop_to_roi window.
+Circle = namedtuple("Circle", ["diameter", "offset"], defaults=[(0, 0)])
+Annulus = namedtuple("Annulus", ["inner_diameter", "outer_diameter", "offset"], defaults=[(0, 0)])
+Rectangle = namedtuple("Rectangle", ["height", "width", "offset"], defaults=[(0, 0)])
+Circles = namedtuple("Circles", ["diameter", "offsets"])  # Union of equal circles
+
+# ROI used for the BSDF values
+DEFAULT_ROI = Circle(diameter=20)
+
+# Index arrays kept for this many (shape, ROI) combinations
+CACHE_SIZE = 32
+
+def roi_from_string(text):
+    """
+    ROI from its repr, e.g. "Circle(diameter=20, offset=(0, 0))" as stored in a measurement archive.
+    Only a call of one of the ROI shapes with literal arguments is accepted, nothing is evaluated.
+    """
+    shapes = {shape.__name__: shape for shape in (Circle, Annulus, Rectangle, Circles)}
+    try:
+        call = ast.parse(text.strip(), mode="eval").body
+        if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Name) and call.func.id in shapes):
+            raise ValueError("not an ROI shape")
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = {keyword.arg: ast.literal_eval(keyword.value) for keyword in call.keywords}
+        return shapes[call.func.id](*args, **kwargs)
+    except (SyntaxError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid ROI {text!r}: {e}") from None
+
+def roi_extent(roi):
+    """Largest distance (plane pixels) of an ROI pixel from the plane centre."""
+    if isinstance(roi, Circle):
+        return roi.diameter // 2 + max(map(abs, roi.offset))
+    if isinstance(roi, Annulus):
+        return roi.outer_diameter // 2 + max(map(abs, roi.offset))
+    if isinstance(roi, Rectangle):
+        return max(roi.height, roi.width) // 2 + max(map(abs, roi.offset))
+    if isinstance(roi, Circles):
+        return roi.diameter // 2 + max(max(map(abs, offset)) for offset in roi.offsets)
+    raise TypeError(f"Unknown ROI shape: {roi!r}")
+
+def roi_mask(shape, roi):
+    """Boolean mask of an ROI on a color plane of the given shape."""
+    center_y, center_x = shape[0] // 2, shape[1] // 2
+    y, x = np.ogrid[:shape[0], :shape[1]]
+
+    def distance2(offset):
+        return (x - center_x - offset[1])**2 + (y - center_y - offset[0])**2
+
+    if isinstance(roi, Circle):
+        return distance2(roi.offset) <= (roi.diameter // 2)**2
+    if isinstance(roi, Annulus):
+        d2 = distance2(roi.offset)
+        return ((roi.inner_diameter // 2)**2 < d2) & (d2 <= (roi.outer_diameter // 2)**2)
+    if isinstance(roi, Rectangle):
+        dy, dx = y - center_y - roi.offset[0], x - center_x - roi.offset[1]
+        return (-(roi.height // 2) <= dy) & (dy < roi.height - roi.height // 2) & \
+               (-(roi.width // 2) <= dx) & (dx < roi.width - roi.width // 2)
+    if isinstance(roi, Circles):
+        mask = np.zeros(shape, dtype=bool)
+        for offset in roi.offsets:
+            mask |= distance2(offset) <= (roi.diameter // 2)**2
+        return mask
+    raise TypeError(f"Unknown ROI shape: {roi!r}")
+
+@lru_cache(maxsize=CACHE_SIZE)
+def roi_pixels(shape, roi):
+    """Row and column indices of the ROI pixels on a color plane, built once per (shape, ROI)."""
+    rows, cols = np.nonzero(roi_mask(shape, roi))
+    rows.setflags(write=False)
+    cols.setflags(write=False)
+    return rows, cols
+
+@lru_cache(maxsize=CACHE_SIZE)
+def bayer_roi_pixels(shape, roi, pattern=DEFAULT_PATTERN):
+    """
+    Row and column indices in a raw Bayer frame of the ROI pixels of every color plane.
+    Returns (names, rows, cols) with one row of indices per color pixel of the Bayer cell.
+    """
+    plane_shape = ((shape[0] + 1) // 2, (shape[1] + 1) // 2)
+    plane_rows, plane_cols = roi_pixels(plane_shape, roi)
+
+    offsets = bayer_offsets(pattern)
+    names = tuple(offsets)
+    rows = np.stack([2 * plane_rows + offsets[name][0] for name in names])
+    cols = np.stack([2 * plane_cols + offsets[name][1] for name in names])
+    rows.setflags(write=False)
+    cols.setflags(write=False)
+    return names, rows, cols
+
+def roi_channel_stats(image, roi=DEFAULT_ROI, pattern=DEFAULT_PATTERN):
+    """
+    Mean, standard deviation and pixel count of the R, G and B planes of a raw Bayer frame inside the ROI.
+    All color pixels are gathered at once; G is the average of the two green pixels, like extract_color_channels.
+    Returns (means, stds, count) with means and stds ordered R, G, B.
+    """
+    names, rows, cols = bayer_roi_pixels(image.shape, roi, pattern)
+    values = dict(zip(names, image[rows, cols]))
+
+    channels = np.stack([values["R"], green_mean(values["G1"], values["G2"]), values["B"]])
+    return channels.mean(axis=1), channels.std(axis=1), channels.shape[1]
+
+def relative_errors(means, stds, count):
+    """Relative 1-sigma error of ROI means."""
+    return stds / np.sqrt(count) / means
+
+def burst_results(burst, roi=DEFAULT_ROI, pattern=DEFAULT_PATTERN):
+    """
+    R, G, B ROI means of an averaged burst (a FrameAccumulator) and their relative errors:
+    spatial R, G, B from the pixel spread in the ROI, then temporal R, G, B from the frame-to-frame noise.
+    """
+    means, stds, count = roi_channel_stats(burst.mean, roi, pattern)
+    spatial = relative_errors(means, stds, count)
+    temporal = temporal_errors(burst.variance, burst.count, means, roi, pattern)
+    return tuple(means.tolist()), (*spatial.tolist(), *temporal.tolist())
+
+def roi_stats(plane, roi=DEFAULT_ROI):
+    """Mean, standard deviation and pixel count of a single color plane inside the ROI."""
+    rows, cols = roi_pixels(plane.shape, roi)
+    values = plane[rows, cols]
+    return float(np.mean(values)), float(np.std(values)), len(values)
+
+def temporal_errors(variance, frames, means, roi=DEFAULT_ROI, pattern=DEFAULT_PATTERN):
+    """
+    Relative 1-sigma error of the R, G and B ROI means of an averaged burst from the frame-to-frame noise.
+    `variance` is the per-pixel variance of single frames and `frames` the number of averaged frames.
+    """
+    names, rows, cols = bayer_roi_pixels(variance.shape, roi, pattern)
+    values = dict(zip(names, variance[rows, cols]))
+
+    # Variance of every plane pixel; G averages two pixels
+    channels = np.stack([values["R"], (values["G1"] + values["G2"]) / 4, values["B"]])
+    count = channels.shape[1]
+    return np.sqrt(channels.sum(axis=1) / frames) / count / means
@@ -0,0 +1,166 @@
+import itertools, threading, logging
+import numpy as np
+from motion_model import STEPS_PER_DEG, AXIS_PROFILES, HOME_ANGLE, profile_durations
+
+# Motor axis of every entry in a visit tuple (light_rad, light_az, det_az, det_rad)
+VISIT_AXES = ("LIGHT_RAD", "LIGHT_AZ", "DET_AZ", "DET_RAD")
+
+# Light source and detector closer than this (in both directions) block each other
+BLOCKED_AZ_DEG = 2.0
+BLOCKED_RAD_DEG = 2.0
+
+# Plans by angle lists, planning a large grid takes many seconds
+_plan_cache = {}
+_plan_lock = threading.Lock()
+
+# 2-opt refinement is quadratic in the number of positions, skip it for larger scans
+TSP_MAX_POSITIONS = 3000
+
+class ScanPlan:
+    """Ordered list of measurement positions with its predicted motor time."""
+    def __init__(self, visits, duration, baseline_duration, blocked_count):
+        self.visits = visits                          # List of (light_rad, light_az, det_az, det_rad)
+        self.duration = duration                      # Predicted motor time of this order (s)
+        self.baseline_duration = baseline_duration    # Predicted motor time of plain nested loops (s)
+        self.blocked_count = blocked_count            # Positions left out because they are blocked
+
+    @property
+    def saving(self):
+        """Predicted motor time saved compared to the nested loops (s)."""
+        return self.baseline_duration - self.duration
+
+def is_blocked(light_rad, light_az, det_az, det_rad):
+    """Return True if the detector would sit in front of the light source. Works element-wise on arrays."""
+    return (abs(light_az - det_az) < BLOCKED_AZ_DEG) & (abs(light_rad - det_rad) < BLOCKED_RAD_DEG)
+
+def nested_order(angle_lists):
+    """Grid positions (as index array) in plain nested ascending loops, first list outermost."""
+    sizes = [len(angles) for angles in angle_lists]
+    return np.indices(sizes).reshape(len(sizes), -1).T
+
+def serpentine_order(angle_lists, nesting=(0, 1, 2, 3)):
+    """
+    Grid positions (as index array) in boustrophedon order: every inner sweep runs in the opposite
+    direction of the previous one, so no axis ever has to return across its full range.
+    `nesting` gives the loop order of the axes, outermost first.
+    """
+    sizes = [len(angle_lists[axis]) for axis in nesting]
+    counters = np.indices(sizes).reshape(len(sizes), -1)
+
+    order = np.empty((counters.shape[1], len(sizes)), dtype=np.int64)
+    rank = np.zeros(counters.shape[1], dtype=np.int64)  # How many sweeps of this level came before
+    for level, axis in enumerate(nesting):
+        reverse = rank % 2 == 1
+        order[:, axis] = np.where(reverse, sizes[level] - 1 - counters[level], counters[level])
+        rank = rank * sizes[level] + counters[level]
+
+    return order
+
+def index_to_steps(order, angle_lists):
+    """Convert an index array of grid positions to absolute motor steps per axis."""
+    steps = np.empty(order.shape, dtype=np.int64)
+    for i, (axis, angles) in enumerate(zip(VISIT_AXES, angle_lists)):
+        axis_steps = (np.asarray(angles, dtype=np.float64) * STEPS_PER_DEG[axis]).astype(np.int64)
+        steps[:, i] = axis_steps[order[:, i]]
+    return steps
+
+def move_times(from_steps, to_steps):
+    """Predicted time (s) of batched moves between rows of two step arrays."""
+    times = np.zeros(len(to_steps))
+    for i, axis in enumerate(VISIT_AXES):
+        durations = profile_durations(np.abs(to_steps[:, i] - from_steps[:, i]), *AXIS_PROFILES[axis])
+        times = np.maximum(times, durations)
+    return times
+
+def home_steps():
+    """Motor steps of the home/offset position of all axes."""
+    return np.array([[int(HOME_ANGLE * STEPS_PER_DEG[axis]) for axis in VISIT_AXES]], dtype=np.int64)
+
+def path_duration(steps):
+    """Predicted motor time (s) to visit all positions in order, starting and ending at home."""
+    home = home_steps()
+    path = np.concatenate([home, steps, home])
+    return float(move_times(path[:-1], path[1:]).sum())
+
+def two_opt(steps, max_passes=20):
+    """Improve a visit order with 2-opt segment reversals. Returns the new order as index array into `steps`."""
+    home = home_steps()
+    path = np.concatenate([home, steps, home])
+    route = np.arange(len(path))
+    n = len(path)
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 2):
+            # Gain of reversing route[i..j] for all j at once
+            a, b = path[route[i - 1]][None, :], path[route[i]][None, :]
+            c, d = path[route[i:n - 1]], path[route[i + 1:n]]
+            delta = (move_times(a.repeat(len(c), 0), c) + move_times(b.repeat(len(d), 0), d)
+                     - move_times(a, b)[0] - move_times(c, d))
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                route[i:i + j + 1] = route[i:i + j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+
+    return route[1:-1] - 1
+
+def plan_scan(light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles, use_tsp=False):
+    """
+    Order all unblocked measurement positions to minimise the predicted motor time.
+    Every loop nesting of the four axes is tried in serpentine order and the fastest one is kept.
+    With use_tsp, the result is refined further with 2-opt if the scan is small enough.
+    """
+    angle_lists = [light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles]
+
+    def unblocked(order):
+        angles = [np.asarray(a, dtype=np.float64)[order[:, i]] for i, a in enumerate(angle_lists)]
+        return order[~is_blocked(*angles)]
+
+    baseline = unblocked(nested_order(angle_lists))
+    baseline_duration = path_duration(index_to_steps(baseline, angle_lists))
+    blocked_count = int(np.prod([len(a) for a in angle_lists])) - len(baseline)
+
+    # Serpentine order with the fastest nesting of the axes
+    best_order, best_duration = baseline, baseline_duration
+    for nesting in itertools.permutations(range(4)):
+        order = unblocked(serpentine_order(angle_lists, nesting))
+        duration = path_duration(index_to_steps(order, angle_lists))
+        if duration < best_duration:
+            best_order, best_duration = order, duration
+
+    if use_tsp:
+        if len(best_order) <= TSP_MAX_POSITIONS:
+            best_order = best_order[two_opt(index_to_steps(best_order, angle_lists))]
+            best_duration = path_duration(index_to_steps(best_order, angle_lists))
+        else:
+            logging.info(f"Skipping 2-opt refinement for {len(best_order)} positions (limit {TSP_MAX_POSITIONS})")
+
+    visits = [tuple(angle_lists[i][idx] for i, idx in enumerate(row)) for row in best_order]
+
+    logging.info(f"Scan plan: {len(visits)} positions, {blocked_count} blocked, "
+                 f"predicted motor time {best_duration:.0f} s (nested loops: {baseline_duration:.0f} s)")
+
+    return ScanPlan(visits, best_duration, baseline_duration, blocked_count)
+
+def plan_key(*angle_lists):
+    """Hashable form of the angle lists of a scan."""
+    return tuple(tuple(float(a) for a in angles) for angles in angle_lists)
+
+def cached_plan(light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles):
+    """
+    plan_scan, planned only once per set of angle lists. Thread-safe: a caller asking for settings
+    that are being planned on another thread waits for that plan instead of planning again.
+    """
+    key = plan_key(light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles)
+    with _plan_lock:
+        if key not in _plan_cache:
+            _plan_cache.clear()  # Only the current settings are needed
+            _plan_cache[key] = plan_scan(light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles)
+        return _plan_cache[key]
+
+def is_planned(light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles):
+    """Return True if cached_plan has the plan for these angle lists ready."""
+    key = plan_key(light_radial_angles, incidence_angles, det_azimuth_angles, det_radial_angles)
+    return key in _plan_cache
@@ -0,0 +1,15 @@
+import pytest
+from motors import Motors
+from fake_arduino import FakeArduino, FakeSerial
+
+@pytest.fixture
+def arduino():
+    arduino = FakeArduino(time_scale=0, in_process=True).start()
+    yield arduino
+    arduino.stop()
+
+@pytest.fixture
+def motors(arduino):
+    motors = Motors(connection=FakeSerial(arduino))
+    yield motors
+    motors.close()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from accumulator import FrameAccumulator
+
+def burst(count, shape=(16, 24), seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(500, 20, (count, *shape)).astype(np.uint16)
+
+@pytest.mark.parametrize("count", [2, 3, 10])
+def test_mean_and_variance_match_numpy(count):
+    frames = burst(count)
+    accumulator = FrameAccumulator()
+    for frame in frames:
+        accumulator.add(frame)
+
+    assert accumulator.count == count
+    assert accumulator.mean.dtype == np.float32
+    assert np.allclose(accumulator.mean, frames.mean(axis=0), rtol=1e-6)
+    assert np.allclose(accumulator.variance, np.var(frames.astype(np.float64), axis=0, ddof=1), rtol=1e-3, atol=1e-3)
+
+def test_large_offset_keeps_the_variance():
+    # Welford's update keeps a small variance on a large level, where sum(x^2) - n * mean^2 in float32 would cancel out
+    frames = (60000 + np.random.default_rng(1).normal(0, 0.5, (8, 16, 24))).astype(np.float32)
+    accumulator = FrameAccumulator()
+    for frame in frames:
+        accumulator.add(frame)
+    assert np.allclose(accumulator.variance, np.var(frames.astype(np.float64), axis=0, ddof=1), rtol=0.05, atol=1e-2)
+
+def test_single_frame_has_no_variance():
+    accumulator = FrameAccumulator()
+    accumulator.add(burst(1)[0])
+    assert np.all(np.isnan(accumulator.variance))
+
+def test_reset_reuses_the_buffers():
+    accumulator = FrameAccumulator()
+    for frame in burst(4):
+        accumulator.add(frame)
+    mean = accumulator.mean
+
+    accumulator.reset()
+    frames = burst(3, seed=1)
+    for frame in frames:
+        accumulator.add(frame)
+    assert accumulator.mean is mean and accumulator.count == 3
+    assert np.allclose(accumulator.variance, np.var(frames.astype(np.float64), axis=0, ddof=1), rtol=1e-3, atol=1e-3)
+
+def test_new_frame_shape_starts_over():
+    accumulator = FrameAccumulator()
+    for frame in burst(3):
+        accumulator.add(frame)
+    window = burst(1, shape=(4, 4))[0]
+    accumulator.add(window)
+    assert accumulator.count == 1 and np.array_equal(accumulator.mean, window)
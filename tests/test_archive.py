@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from archive import MeasurementArchive, archive_path
+
+ATTRIBUTES = {"capture_mode": "adaptive", "dark_value": 64.0, "pattern": "RGGB", "roi_only": True,
+              "det_azimuth_angles": [8.0, 40.0]}
+
+def frames(count, start=0, shape=(8, 12)):
+    """Raw frames whose first pixel is their index."""
+    rng = np.random.default_rng(start)
+    stack = rng.integers(0, 1024, (count, *shape), dtype=np.uint16)
+    stack[:, 0, 0] = np.arange(start, start + count)
+    return stack
+
+@pytest.fixture
+def archive(tmp_path):
+    """An archive with two positions of 3 and 2 frames, closed after writing."""
+    with MeasurementArchive(str(tmp_path / "scan.h5"), "w", attributes=ATTRIBUTES) as archive:
+        for attempt, frame in enumerate(frames(3), start=1):
+            archive.append(frame, (8, 8, 40, 30), attempt, exposure=1000, gain=1.5, scores=(12.5, 2.5))
+        for attempt, frame in enumerate(frames(2, start=3), start=1):
+            archive.append(frame, (8, 8, 8, 60), attempt, exposure=2000, gain=1.0)
+    return archive
+
+def test_round_trip(archive):
+    with MeasurementArchive(archive.path) as stored:
+        assert stored.geometries() == [(8.0, 8.0, 40.0, 30.0), (8.0, 8.0, 8.0, 60.0)]
+        assert stored.frame_count == 5
+        assert np.array_equal(stored.frames((8, 8, 40, 30)), frames(3))
+        assert np.array_equal(stored.frames((8, 8, 8, 60)), frames(2, start=3))
+
+        info = stored.frame_info((8, 8, 40, 30))
+        assert info["attempt"].tolist() == [1, 2, 3] and info["position"].tolist() == [0, 0, 0]
+        assert np.all(info["exposure"] == 1000) and np.all(info["gain"] == 1.5)
+        assert np.all(info["variance"] == 12.5) and np.all(info["entropy"] == 2.5)
+        assert np.all(np.isnan(stored.frame_info((8, 8, 8, 60))["variance"]))  # Not screened
+
+        attributes = stored.attributes
+        assert attributes["pattern"] == "RGGB" and attributes["dark_value"] == 64.0 and attributes["roi_only"]
+        assert np.asarray(attributes["det_azimuth_angles"]).tolist() == [8.0, 40.0]
+
+def test_append_mode_adds_to_an_existing_archive(archive):
+    with MeasurementArchive(archive.path, "a", attributes={"pattern": "BGGR"}) as resumed:
+        assert resumed.frame_count == 5
+        for frame in frames(2, start=5):
+            resumed.append(frame, (8, 8, 40, 30))  # Measured again after a stop: the new frames count
+
+    with MeasurementArchive(archive.path) as stored:
+        assert stored.attributes["pattern"] == "RGGB"
+        assert stored.geometries() == [(8.0, 8.0, 40.0, 30.0), (8.0, 8.0, 8.0, 60.0)]
+        assert np.array_equal(stored.frames((8, 8, 40, 30)), frames(2, start=5))
+        assert np.array_equal(stored.frames((8, 8, 8, 60)), frames(2, start=3))
+
+def test_append_mode_creates_a_missing_archive(tmp_path):
+    with MeasurementArchive(str(tmp_path / "new" / "scan.h5"), "a", attributes=ATTRIBUTES) as archive:
+        assert archive.frame_count == 0 and archive.attributes["capture_mode"] == "adaptive"
+
+def test_frame_shape_must_match(archive):
+    with MeasurementArchive(archive.path, "a") as resumed:
+        with pytest.raises(ValueError):
+            resumed.append(np.zeros((4, 4), dtype=np.uint16), (90, 8, 8, 60))
+
+def test_archive_path(tmp_path):
+    path = archive_path(str(tmp_path), "glass/frosted 1")
+    assert path.startswith(str(tmp_path / "glass_frosted_1_")) and path.endswith(".h5")
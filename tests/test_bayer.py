@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from bayer import DEFAULT_PATTERN, bayer_offsets, pattern_from_format, camera_pattern, bayer_planes, green_mean
+
+OFFSETS = {
+    "RGGB": {"R": (0, 0), "G1": (0, 1), "G2": (1, 0), "B": (1, 1)},
+    "BGGR": {"B": (0, 0), "G1": (0, 1), "G2": (1, 0), "R": (1, 1)},
+    "GRBG": {"G1": (0, 0), "R": (0, 1), "B": (1, 0), "G2": (1, 1)},
+    "GBRG": {"G1": (0, 0), "B": (0, 1), "R": (1, 0), "G2": (1, 1)},
+}
+
+@pytest.mark.parametrize("pattern", OFFSETS)
+def test_channel_offsets(pattern):
+    assert bayer_offsets(pattern) == OFFSETS[pattern]
+
+@pytest.mark.parametrize("pattern", ["RGBG", "RRGB", "RGB", ""])
+def test_unknown_patterns_are_refused(pattern):
+    with pytest.raises(ValueError):
+        bayer_offsets(pattern)
+
+@pytest.mark.parametrize("raw_format, pattern", [("SRGGB10", "RGGB"), ("SBGGR12_CSI2P", "BGGR"),
+                                                  ("SGRBG10_CSI2P", "GRBG"), ("GBRG", "GBRG")])
+def test_pattern_from_format(raw_format, pattern):
+    assert pattern_from_format(raw_format) == pattern
+
+def test_pattern_from_unknown_format():
+    with pytest.raises(ValueError):
+        pattern_from_format("YUV420")
+
+def test_camera_pattern():
+    camera = SimpleNamespace(camera_configuration=lambda: {"raw": {"format": "SBGGR10_CSI2P"}})
+    assert camera_pattern(camera) == "BGGR"
+    unconfigured = SimpleNamespace(camera_configuration=lambda: {})
+    assert camera_pattern(unconfigured) == DEFAULT_PATTERN
+
+@pytest.mark.parametrize("pattern", OFFSETS)
+def test_planes_are_views_at_the_offsets(pattern):
+    # Every pixel holds the index of its place in the 2x2 cell
+    image = np.tile(np.array([[0, 1], [2, 3]], dtype=np.uint16), (4, 6))
+    planes = bayer_planes(image, pattern)
+    for name, (row, col) in OFFSETS[pattern].items():
+        assert planes[name].shape == (4, 6)
+        assert np.all(planes[name] == 2 * row + col)
+        assert np.shares_memory(planes[name], image)
+
+def test_green_mean_stays_float32():
+    g1 = np.array([[1, 1023]], dtype=np.uint16)
+    g2 = np.array([[2, 1023]], dtype=np.uint16)
+    green = green_mean(g1, g2)
+    assert green.dtype == np.float32
+    assert green.tolist() == [[1.5, 1023.0]]
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from capture_pipeline import CapturePipeline
+
+def run_burst(frames, screen=None, screen_batch=1, slots=2):
+    frames = iter(frames)
+    pipeline = CapturePipeline(lambda: next(frames), slots=slots, screen=screen, screen_batch=screen_batch).start()
+    seen = []
+    try:
+        pipeline.capture_burst(5, lambda frame, attempt, info: seen.append((attempt, None if frame is None else int(frame[0, 0]), info)))
+    finally:
+        pipeline.stop()
+    return pipeline, seen
+
+def test_batched_screening_keeps_capture_order():
+    frames = [np.full((4, 4), value, dtype=np.uint16) for value in (1, 2, 3, 4, 5)]
+    frames[2] = None  # A failed capture
+    batches = []
+
+    def screen(batch):
+        batches.append(len(batch))
+        return [None if frame[0, 0] == 4 else frame for frame in batch], [int(frame[0, 0]) for frame in batch]
+
+    pipeline, seen = run_burst(frames, screen, screen_batch=3)
+    assert batches == [2, 2]  # Failed captures are not screened, the last batch is flushed at the end of the burst
+    assert seen == [(1, 1, 1), (2, 2, 2), (3, None, None), (5, 5, 5)]
+    assert (pipeline.captured, pipeline.failed, pipeline.rejected) == (3, 1, 1)
+
+def test_burst_fails_when_the_capture_thread_dies():
+    def broken_capture():
+        raise OSError("camera gone")
+    pipeline = CapturePipeline(broken_capture).start()
+    with pytest.raises(RuntimeError) as error:
+        pipeline.capture_burst(3, lambda frame, attempt, info: None)
+    assert isinstance(error.value.__cause__, OSError)
+    pipeline.stop()  # Both threads have ended, so this returns
+
+def test_processing_error_is_raised_after_the_burst():
+    def process(frame, attempt, info):
+        raise ValueError("bad frame")
+    pipeline = CapturePipeline(lambda: np.zeros((4, 4), dtype=np.uint16)).start()
+    try:
+        with pytest.raises(ValueError):
+            pipeline.capture_burst(3, process)
+        assert pipeline.capture_burst(2, lambda frame, attempt, info: None) is False  # The pipeline is still usable
+    finally:
+        pipeline.stop()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from process_image import crop_to_roi
+from dark_library import DarkLibrary
+
+SHAPE = (120, 160)
+
+@pytest.fixture
+def library(tmp_path):
+    """Masters at 100 and 1000 µs of gain 1 and at 100 µs of gain 4, each one level plus a per-pixel pattern."""
+    pattern = np.arange(np.prod(SHAPE), dtype=np.float32).reshape(SHAPE) % 7
+    library = DarkLibrary(str(tmp_path / "darks" / "dark_library.npz"))
+    for (exposure, gain), level in {(100, 1.0): 60, (1000, 1.0): 80, (100, 4.0): 200}.items():
+        library.masters[(exposure, gain)] = pattern + np.float32(level)
+        library.metadata[(exposure, gain)] = {"frames": 8, "temperature": 40.0, "timestamp": 1.0e9 + exposure}
+    return library, pattern
+
+def test_interpolates_between_exposures(library):
+    library, pattern = library
+    assert np.allclose(library.master(550, 1.0), pattern + 70)
+    assert np.allclose(library.master(1000, 1.0), pattern + 80)
+    assert library.master(550, 1.0).dtype == np.float32
+
+def test_clamps_to_the_ladder_and_uses_the_nearest_gain(library):
+    library, pattern = library
+    assert np.allclose(library.master(10, 1.0), pattern + 60)
+    assert np.allclose(library.master(50000, 1.2), pattern + 80)
+    assert np.allclose(library.master(500, 3.0), pattern + 200)
+    assert library.black_level() == pytest.approx(float((pattern + 60).mean()))
+
+def test_burst_darks_are_cached(library):
+    library, _ = library
+    dark = library.master(550, 1.0)
+    assert library.master(550, 1.0) is dark
+    assert library.master(700, 1.0) is not dark
+
+def test_correct_writes_into_out(library):
+    library, pattern = library
+    frame = (pattern + 70 + 5 * (np.arange(SHAPE[1]) % 2)).astype(np.uint16)
+    frame[0, :4] = 0  # Below the dark: clipped to zero
+    out = np.empty(SHAPE, dtype=np.float32)
+    corrected = library.correct(frame, 550, 1.0, out=out)
+    assert corrected is out
+    assert np.all(out[0, :4] == 0)
+    assert np.allclose(out[1:], 5 * (np.arange(SHAPE[1]) % 2))
+    assert np.array_equal(library.correct(frame, 550, 1.0), out)
+
+def test_roi_windows_get_the_same_window_of_the_dark(library):
+    library, pattern = library
+    window = crop_to_roi(np.zeros(SHAPE, dtype=np.uint16))
+    assert np.allclose(library.master(100, 1.0, window.shape), crop_to_roi(pattern + 60))
+    with pytest.raises(ValueError):
+        library.master(100, 1.0, (10, 10))
+
+def test_save_and_load(library):
+    library, pattern = library
+    library.save()
+    loaded = DarkLibrary(library.path)
+    assert loaded.load()
+    assert set(loaded.masters) == set(library.masters) and loaded.metadata == library.metadata
+    assert np.allclose(loaded.master(550, 1.0), pattern + 70)
+
+def test_missing_or_empty_library(tmp_path):
+    assert not DarkLibrary(str(tmp_path / "missing.npz")).load()
+    empty = DarkLibrary(str(tmp_path / "empty.npz"))
+    empty.save()
+    assert not empty.load()
+    with pytest.raises(ValueError):
+        DarkLibrary(str(tmp_path / "missing.npz")).master(100)
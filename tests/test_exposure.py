@@ -0,0 +1,40 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from exposure import (top_fraction_stats, solve_exposure, wait_for_exposure, SATURATION_LEVEL, MAX_STEP_FACTOR,
+                      SATURATION_BACKOFF, MIN_EXPOSURE_US, MAX_EXPOSURE_US)
+
+@pytest.mark.parametrize("fraction", [0.05, 0.2, 1e-6])
+def test_histogram_path_matches_partition_path(fraction):
+    rng = np.random.default_rng(3)
+    channel = rng.integers(60, 900, (272, 364), dtype=np.uint16)
+    channel[:4, :40] = SATURATION_LEVEL
+    histogram = top_fraction_stats(channel, fraction)
+    partition = top_fraction_stats(channel.astype(np.float32), fraction)
+    assert histogram == pytest.approx(partition)
+
+def test_top_fraction_stats():
+    channel = np.array([[100, 200, 300, 400, 500, 600, 700, 800, 900, SATURATION_LEVEL]], dtype=np.uint16)
+    top_mean, top_median, saturated = top_fraction_stats(channel, fraction=0.4)
+    assert top_mean == pytest.approx((800 + 900 + SATURATION_LEVEL + 700) / 4)
+    assert top_median == pytest.approx(850)
+    assert saturated == pytest.approx(0.25)
+
+def test_solve_exposure_is_linear_above_the_dark_level():
+    assert solve_exposure(1000, top_mean=264, target=464, dark_level=64) == 2000
+    assert solve_exposure(1000, top_mean=864, target=464, dark_level=64) == 500
+
+def test_solve_exposure_limits():
+    assert solve_exposure(1000, top_mean=65, target=800, dark_level=64) == 1000 * MAX_STEP_FACTOR
+    assert solve_exposure(1000, top_mean=10, target=800, dark_level=64) == 1000 * MAX_STEP_FACTOR
+    assert solve_exposure(1000, top_mean=1023, target=500, saturated=0.5) == 1000 / SATURATION_BACKOFF
+    assert solve_exposure(MIN_EXPOSURE_US, top_mean=1000, target=100) == MIN_EXPOSURE_US
+    assert solve_exposure(MAX_EXPOSURE_US, top_mean=100, target=1000) == MAX_EXPOSURE_US
+
+def test_wait_for_exposure():
+    reported = iter([500, 500, 1010])
+    camera = SimpleNamespace(capture_metadata=lambda: {"ExposureTime": next(reported, 1010)})
+    assert wait_for_exposure(camera, 1000) == 1010
+
+    stale = SimpleNamespace(capture_metadata=lambda: {"ExposureTime": 500})
+    assert wait_for_exposure(stale, 1000, timeout=0.05) == 500
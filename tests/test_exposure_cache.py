@@ -0,0 +1,40 @@
+import json
+import numpy as np
+import pytest
+from exposure_cache import ExposureCache, NEIGHBOURS
+
+@pytest.fixture
+def cache(tmp_path):
+    return ExposureCache(str(tmp_path / "cache" / "sample.json"))
+
+def test_empty_cache_predicts_nothing(cache):
+    assert cache.predict((8, 8, 40, 30)) is None
+
+def test_exact_hit_returns_the_stored_settings(cache):
+    cache.store((8, 8, 40, 30), 1500.7, 2)
+    cache.store((8, 8, 60, 30), 9000, 1)
+    assert cache.predict((8.0, 8.0, 40.0, 30.0)) == (1500, 2.0)
+
+def test_inverse_distance_weights_in_log_exposure(cache):
+    cache.store((8, 8, 40, 30), 1000, 1.0)
+    cache.store((8, 8, 70, 30), 8000, 4.0)
+    # Twice as close to the first geometry: weights 1/10 and 1/20
+    exposure, gain = cache.predict((8, 8, 50, 30))
+    assert exposure == round(np.exp((2 * np.log(1000) + np.log(8000)) / 3))
+    assert gain == pytest.approx((2 * 1.0 + 4.0) / 3)
+
+def test_only_the_nearest_geometries_count(cache):
+    for i in range(NEIGHBOURS):
+        cache.store((8, 8, 40 + i, 30), 1000, 1.0)
+    cache.store((90, 90, 175, 90), 500000, 8.0)
+    assert cache.predict((8, 8, 45, 30)) == (1000, 1.0)
+
+def test_save_and_load(cache):
+    cache.store((8, 8, 40, 30), 1000, 1.5, save_every=2)
+    cache.store((8, 8, 60, 30), 2000, 1.0, save_every=2)  # Saved after the second entry
+    assert ExposureCache(cache.path).entries == cache.entries
+
+def test_unreadable_cache_starts_empty(tmp_path):
+    path = tmp_path / "broken.json"
+    path.write_text(json.dumps({"entries": [{"geometry": [8, 8, 40, 30]}]}))
+    assert ExposureCache(str(path)).entries == {}
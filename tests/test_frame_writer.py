@@ -0,0 +1,48 @@
+import os
+import threading
+import numpy as np
+import pytest
+from frame_writer import FrameWriter
+
+class SlowArchive:
+    """Archive that takes its time for every frame, like a slow SD card."""
+    def __init__(self, path, release):
+        self.path = path
+        self.frames = []
+        self.release = release
+
+    def append(self, frame, **metadata):
+        self.release.wait(5)
+        self.frames.append((frame, metadata))
+
+    def close(self):
+        pass
+
+FRAME = np.arange(12, dtype=np.uint16).reshape(3, 4)
+
+def test_archive_frames_wait_and_the_stall_is_counted(tmp_path):
+    release = threading.Event()
+    archive = SlowArchive(str(tmp_path / "scan.h5"), release)
+    writer = FrameWriter(str(tmp_path), "archive", queue_size=1, archive=archive).start()
+    threading.Timer(0.2, release.set).start()
+    for attempt in range(4):
+        assert writer.submit(FRAME, f"frame_{attempt}", attempt=attempt)
+    writer.stop()
+
+    assert writer.written == 4 and writer.dropped == 0
+    assert writer.waited >= 1 and writer.stalled >= 0.1
+    assert [metadata["attempt"] for _, metadata in archive.frames] == [0, 1, 2, 3]
+
+def test_image_files_are_dropped_instead_of_waiting(tmp_path):
+    writer = FrameWriter(str(tmp_path), "raw", workers=1, queue_size=1)  # Not started: the queue stays full
+    assert writer.submit(FRAME, "first")
+    assert not writer.submit(FRAME, "second")
+    assert writer.dropped == 1 and writer.stalled == 0
+    writer.start().stop()
+    assert os.listdir(tmp_path) == ["first.tiff"]
+
+def test_archive_format_needs_an_archive(tmp_path):
+    with pytest.raises(ValueError):
+        FrameWriter(str(tmp_path), "archive")
+    with pytest.raises(ValueError):
+        FrameWriter(str(tmp_path), "bmp")
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from exposure import SATURATION_LEVEL
+from hdr import merge_bracket, capture_bracket, CLIP_LEVEL
+
+EXPOSURES = (10, 40, 160)
+DARK = 64
+
+def bracket_of(radiance, dark=DARK, exposures=EXPOSURES):
+    """Raw frames of a radiance image (counts per µs), clipped at the sensor saturation level."""
+    return [(np.clip(np.rint(dark + radiance * t), 0, SATURATION_LEVEL).astype(np.uint16), t) for t in exposures]
+
+def test_radiance_recovered_from_unclipped_frames():
+    radiance = np.array([[0.5, 2.0], [4.0, 50.0]])
+    merged = merge_bracket(bracket_of(radiance), dark_level=DARK)
+    assert merged.dtype == np.float32
+    assert np.allclose(merged, radiance)
+
+def test_clipped_frames_are_left_out():
+    # 20 counts/µs clips the 160 µs frame and 40 counts/µs the 40 µs one; a plain average would be far off
+    radiance = np.array([[20.0, 40.0]])
+    bracket = bracket_of(radiance)
+    assert bracket[-1][0].max() >= CLIP_LEVEL
+    assert np.allclose(merge_bracket(bracket, dark_level=DARK), radiance)
+
+def test_pixels_clipped_everywhere_fall_back_to_the_shortest_exposure():
+    merged = merge_bracket(bracket_of(np.array([[500.0]])), dark_level=DARK)
+    assert merged[0, 0] == pytest.approx((SATURATION_LEVEL - DARK) / min(EXPOSURES))
+
+def test_pixels_below_the_noise_floor_use_the_frames_above_it():
+    # 0.05 counts/µs is only 8 counts above the dark level in the longest frame
+    merged = merge_bracket(bracket_of(np.array([[0.05, 0.0]])), dark_level=DARK)
+    assert merged[0, 0] == pytest.approx(0.05)
+    assert merged[0, 1] == 0
+
+def test_per_pixel_darks():
+    dark = np.array([[60.0, 70.0]])
+    radiance = np.array([[3.0, 3.0]])
+    bracket = [(np.rint(dark + radiance * t).astype(np.uint16), t) for t in EXPOSURES]
+    assert np.allclose(merge_bracket(bracket, darks=[dark] * len(bracket)), radiance)
+
+class BracketCamera:
+    """Camera stub that reports every requested exposure in its metadata."""
+    def __init__(self):
+        self.controls = {}
+
+    def set_controls(self, controls):
+        self.controls.update(controls)
+
+    def capture_metadata(self):
+        return dict(self.controls)
+
+def test_capture_bracket_skips_failed_frames():
+    camera = BracketCamera()
+    frames = iter([np.zeros((2, 2)), None, np.ones((2, 2))])
+    bracket = capture_bracket(camera, EXPOSURES, lambda: next(frames))
+    assert [exposure for _, exposure in bracket] == [10, 160]
@@ -0,0 +1,123 @@
+import os
+import numpy as np
+import pytest
+from fake_camera import FakePicamera2
+from fake_arduino import FakeArduino, FakeSerial
+from motors import Motors
+from capture_image import run_full_measurement
+from measurement_store import MeasurementStore, MEASURED, BLOCKED
+from journal import ScanJournal, journal_path
+from archive import MeasurementArchive
+from benchmark import BenchmarkApp, GRIDS
+
+HEADER = {"light_radial_angles": [8, 90], "incidence_angles": [8], "det_azimuth_angles": [8, 40], "det_radial_angles": [8, 60],
+          "capture_mode": "adaptive", "pattern": "RGGB", "roi": "Circle(20)"}
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = ScanJournal(str(tmp_path / "sample.jsonl"))
+    journal.start(HEADER)
+    journal.record_move({"DET_AZ": 40})
+    journal.record_arrival({"DET_AZ": 40})
+    journal.record_position((8, 8, 40, 60), (1.0, 2.0, 3.0), (0.01,) * 6, 1000, 1.0)
+    journal.close()
+    return journal
+
+def test_load_restores_positions_and_motors(journal):
+    loaded = ScanJournal(journal.path)
+    assert loaded.load()
+    assert loaded.header == HEADER and loaded.mismatches(dict(HEADER, roi="Circle(10)")) == ["roi"]
+    assert list(loaded.positions) == [(8.0, 8.0, 40.0, 60.0)]
+    assert loaded.motors == {"DET_AZ": 40.0}
+
+    store = loaded.to_store()
+    assert int(np.count_nonzero(store.status == MEASURED)) == 1
+
+def test_unfinished_move_leaves_motors_unknown(journal):
+    journal.resume()
+    journal.record_move({"DET_AZ": 8})
+    journal.close()
+    loaded = ScanJournal(journal.path)
+    assert loaded.load() and loaded.motors is None
+
+def test_torn_last_record_is_ignored_and_cut_on_resume(journal):
+    with open(journal.path, "a") as f:
+        f.write('{"position": [8.0, 8.0')
+    assert journal.load() and len(journal.positions) == 1
+
+    journal.resume()
+    journal.record_position((90, 8, 8, 60), (4.0, 5.0, 6.0), (0.02,) * 6)
+    journal.close()
+    loaded = ScanJournal(journal.path)
+    assert loaded.load() and len(loaded.positions) == 2
+
+def test_journal_without_header_is_unusable(tmp_path):
+    path = tmp_path / "broken.jsonl"
+    path.write_text('{"header": {"capture_mode"')
+    assert not ScanJournal(str(path)).load()
+    assert not ScanJournal(str(tmp_path / "missing.jsonl")).load()
+
+def test_start_keeps_the_old_journal(journal, tmp_path):
+    ScanJournal(journal.path).start(HEADER)
+    kept = [name for name in os.listdir(tmp_path) if name.startswith("sample_")]
+    assert len(kept) == 1 and ScanJournal(str(tmp_path / kept[0])).load()
+    assert ScanJournal(journal.path).load() and not ScanJournal(journal.path).positions
+
+def test_stopped_measurement_resumes_without_measuring_twice(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    arduino = FakeArduino(time_scale=0, in_process=True).start()
+    camera = FakePicamera2(geometry=arduino.angles)
+    camera.start()
+    try:
+        # First run: stopped when half of the positions have been started
+        first = BenchmarkApp(camera, Motors(connection=FakeSerial(arduino)), GRIDS["small"])
+        planned = int(np.count_nonzero(MeasurementStore.from_app(first).status != BLOCKED))
+        first.sample_name, first.stop_after = "resume", planned // 2
+        assert not run_full_measurement(first, image_count=2, save_dir="data")
+        first.motors.close()
+
+        journal = ScanJournal(journal_path("resume"))
+        assert journal.load() and len(journal.positions) == len(first.measurements)
+        stopped_at = journal.motors
+        assert stopped_at is not None
+
+        # A journal ending in an unconfirmed move cannot be resumed without re-homing
+        journal.resume()
+        journal.record_move({"DET_AZ": 90.0})
+        journal.close()
+        refused = BenchmarkApp(camera, None, GRIDS["small"], save_format="none")
+        refused.sample_name, refused.resume = "resume", True
+        assert not run_full_measurement(refused, image_count=2, save_dir="data")
+        assert refused.status[1] == "error" and "unknown" in refused.status[0]
+
+        # Restart: the board comes back at home, the last journaled position is declared instead
+        journal.load()
+        journal.resume()
+        journal.record_arrival(stopped_at)
+        journal.close()
+        arduino.reset_position()
+        motors = Motors(connection=FakeSerial(arduino))
+        motors.set_position(stopped_at)
+        second = BenchmarkApp(camera, motors, GRIDS["small"])
+        second.sample_name, second.resume = "resume", True
+        assert run_full_measurement(second, image_count=2, save_dir="data")
+        motors.close()
+    finally:
+        arduino.stop()
+
+    # Earlier positions restored unchanged, only the remaining ones measured
+    done = first.measurements.status == MEASURED
+    assert np.array_equal(second.measurements.values[done], first.measurements.values[done])
+    assert np.array_equal(second.measurements.errors[done], first.measurements.errors[done], equal_nan=True)
+    assert len(second.position_starts) == planned - int(done.sum())
+
+    # The journal alone gives the same export as the finished measurement
+    journal.load()
+    exported = journal.to_store()
+    assert np.array_equal(exported.status, second.measurements.status)
+    assert np.array_equal(exported.values, second.measurements.values)
+
+    # Frames of both runs are in the archive the scan was started with
+    assert len(os.listdir("data")) == 1
+    with MeasurementArchive(journal.header["archive"]) as archive:
+        assert set(archive.geometries()) == set(journal.positions)
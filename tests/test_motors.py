@@ -0,0 +1,44 @@
+import time
+import pytest
+from motors import Motors
+from fake_arduino import FakeArduino, FakeSerial
+from motion_model import HOME_ANGLE, multi_move_duration
+
+def test_connects_at_home(motors):
+    assert motors.query_position() == {axis: HOME_ANGLE for axis in motors.positions}
+
+def test_move_completes_and_updates_position(motors, arduino):
+    motors.move_many({"DET_AZ": 20, "LIGHT_RAD": 35.5})
+    assert arduino.angles()["DET_AZ"] == 20 and arduino.angles()["LIGHT_RAD"] == 35.5
+    assert motors.query_position()["DET_AZ"] == 20
+    assert motors.positions["LIGHT_RAD"] == 35.5
+
+def test_move_waits_for_completion_instead_of_sleeping():
+    arduino = FakeArduino(time_scale=1, in_process=True).start()
+    motors = Motors(connection=FakeSerial(arduino))
+    try:
+        targets = {"DET_AZ": 100, "DET_RAD": 60}
+        expected = multi_move_duration(motors.positions, targets)
+        start = time.perf_counter()
+        motors.move_many(targets)
+        elapsed = time.perf_counter() - start
+        assert expected <= elapsed < expected + 0.5
+    finally:
+        motors.close()
+        arduino.stop()
+
+def test_set_position(motors, arduino):
+    motors.set_position({"DET_AZ": 30, "LIGHT_AZ": 12})
+    assert arduino.angles()["DET_AZ"] == 30 and arduino.angles()["LIGHT_AZ"] == 12
+    with pytest.raises(ValueError):
+        motors.set_position({"ARM": 1})
+
+def test_pseudo_terminal_round_trip():
+    arduino = FakeArduino(time_scale=0).start()
+    motors = Motors(port=arduino.port)
+    try:
+        motors.move_many({"DET_RAD": 25})
+        assert motors.query_position()["DET_RAD"] == 25
+    finally:
+        motors.close()
+        arduino.stop()
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from output_data import format_grid, write_zemax_bsdf, read_zemax_bsdf
+
+ANGLES = ([0, 90], [8, 45, 80], [8.5, 20, 175], [8, 12, 16, 20])
+
+def python_format(grid):
+    """Grid text as formatted value by value with "%.3E"."""
+    return "".join("\t".join(f"{value:.3E}" for value in row) + "\n" for row in grid)
+
+def test_format_grid_matches_python_formatting():
+    rng = np.random.default_rng(1)
+    grid = rng.lognormal(0, 6, size=(40, 50))
+    grid[::7, ::3] = 0
+    grid[1, :4] = [9.9995, 1.2345, 0.00099995, 99995]  # Rounding ties, also where they change the exponent
+    assert format_grid(grid) == python_format(grid)
+
+def test_format_grid_small_and_negative_grids():
+    grid = np.array([[-1.5, 0.0], [np.inf, 3.25e-120]])
+    assert format_grid(grid) == python_format(grid)
+
+def test_zemax_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    data = rng.lognormal(0, 3, size=tuple(len(axis) for axis in ANGLES) + (3,))
+    data[0, 1] = 0  # A missing light position
+    path = tmp_path / "sample.bsdf"
+
+    write_zemax_bsdf(path, "Asymmetrical4D", "RGB", "BTDF", *ANGLES, data)
+    bsdf = read_zemax_bsdf(path)
+
+    assert (bsdf.symmetry, bsdf.spectral_content, bsdf.scatter_type) == ("Asymmetrical4D", "RGB", "BTDF")
+    assert [axis.tolist() for axis in bsdf[3:7]] == [list(map(float, axis)) for axis in ANGLES]
+    assert np.allclose(bsdf.data, data, rtol=5e-4, atol=0)
+    assert np.allclose(bsdf.tis, data.sum(axis=(2, 3, 4))[..., np.newaxis], rtol=0, atol=0.005)  # Sum of all channels
+
+def test_read_rejects_file_without_data(tmp_path):
+    path = tmp_path / "empty.bsdf"
+    path.write_text("Symmetry  Asymmetrical4D\nSpectralContent  RGB\n")
+    with pytest.raises(ValueError):
+        read_zemax_bsdf(path)
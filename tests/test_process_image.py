@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import pytest
+from skimage.measure import shannon_entropy
+from process_image import static_noise_scores, screen_static_noise, detect_static_noise, crop_to_roi
+
+SHAPE = (1088, 1456)
+
+def reference_scores(image):
+    """Local variance and entropy as computed by the original full-frame noise check."""
+    resized = cv2.resize(image, (256, 256))
+    variance = np.var(cv2.absdiff(resized, cv2.GaussianBlur(resized, (5, 5), 0)))
+    entropy = shannon_entropy(image.astype(np.float32) / 1023.0)
+    return variance, entropy
+
+@pytest.fixture
+def burst():
+    rng = np.random.default_rng(0)
+    clean = [np.clip(rng.normal(200 + 20 * i, 1 + 0.2 * i, SHAPE), 0, 1023).astype(np.uint16) for i in range(3)]
+    noisy = rng.integers(0, 1024, SHAPE, dtype=np.uint16)
+    return np.stack(clean + [noisy])
+
+def test_scores_match_full_frame_reference(burst):
+    variances, entropies = static_noise_scores(burst)
+    for frame, variance, entropy in zip(burst, variances, entropies):
+        reference_variance, reference_entropy = reference_scores(frame)
+        assert variance == pytest.approx(reference_variance, rel=1e-6)
+        assert entropy == pytest.approx(reference_entropy, abs=0.05)
+
+def test_burst_scores_equal_single_frame_scores(burst):
+    variances, entropies = static_noise_scores(burst)
+    singles = [static_noise_scores([frame]) for frame in burst]
+    assert np.allclose(variances, [v[0] for v, _ in singles], rtol=1e-9, atol=0)
+    assert np.allclose(entropies, [e[0] for _, e in singles], rtol=1e-9, atol=0)
+    assert np.array_equal(static_noise_scores(list(burst))[1], entropies)
+
+def test_values_above_sensor_range(burst):
+    frames = burst[:2].copy()
+    frames[1, ::4, ::4] = 4000
+    _, entropies = static_noise_scores(frames)
+    assert entropies[0] == pytest.approx(static_noise_scores(frames[:1])[1][0])
+    assert entropies[1] > entropies[0]
+
+def test_screen_rejects_noisy_frames(burst):
+    noisy, (variances, entropies) = screen_static_noise(burst)
+    assert noisy.tolist() == [False, False, False, True]
+    assert len(variances) == len(entropies) == len(burst)
+    assert not detect_static_noise(burst[0]) and detect_static_noise(burst[-1])
+    assert not detect_static_noise(burst[0], entropy_threshold=np.inf, var_threshold=np.inf)
+
+def test_crop_to_roi_is_bayer_aligned():
+    image = np.arange(np.prod(SHAPE), dtype=np.uint32).reshape(SHAPE)
+    window = crop_to_roi(image, half_size=8)
+    assert window.shape == (32, 32)
+    top, left = np.argwhere(image == window[0, 0])[0]
+    assert top % 2 == 0 and left % 2 == 0
@@ -0,0 +1,75 @@
+import time
+import pytest
+from fake_arduino import FakeArduino, FakeSerial
+from motors import Motors, CommandError, encode_frame, decode_frame, frame_checksum, MAX_QUEUED_MOVES
+
+def test_frame_round_trip():
+    frame = encode_frame(42, "MOVE", "DET_AZ=20.00", "LIGHT_RAD=8.50")
+    assert frame.endswith(b"\n")
+    assert decode_frame(frame.decode()) == (42, ["MOVE", "DET_AZ=20.00", "LIGHT_RAD=8.50"])
+
+def test_decode_rejects_checksum_mismatch():
+    frame = encode_frame(7, "PING").decode().replace("PING", "PINH")
+    with pytest.raises(ValueError, match="Checksum"):
+        decode_frame(frame)
+
+@pytest.mark.parametrize("payload", ["5", "5,", "x,PING"])
+def test_decode_rejects_frames_without_command(payload):
+    with pytest.raises(ValueError):
+        decode_frame(f"${payload}*{frame_checksum(payload):02X}")
+
+@pytest.mark.parametrize("line", ["PING", "$1,PING", "1,PING*00"])
+def test_decode_rejects_malformed_frames(line):
+    with pytest.raises(ValueError):
+        decode_frame(line)
+
+def test_fake_answers_bad_frames(arduino):
+    assert decode_frame(arduino.replies.get(timeout=1).decode()) == (0, ["READY"])
+    arduino.handle_frame(f"$5*{frame_checksum('5'):02X}")
+    assert decode_frame(arduino.replies.get(timeout=1).decode()) == (5, ["ERR", "FORMAT"])
+    arduino.handle_frame("$6,PING*00")
+    assert decode_frame(arduino.replies.get(timeout=1).decode()) == (6, ["ERR", "CHECKSUM"])
+
+def test_queued_moves_complete_in_order(motors, arduino):
+    futures = [motors.queue_move({"DET_AZ": 10 + i}) for i in range(2 * MAX_QUEUED_MOVES)]
+    for future in futures:
+        motors.wait_for_move(future)
+    assert arduino.angles()["DET_AZ"] == 10 + 2 * MAX_QUEUED_MOVES - 1
+
+def test_rejected_command_raises(motors):
+    with pytest.raises(CommandError):
+        motors.request("JUMP")
+
+def test_reader_survives_bad_frames(motors, arduino):
+    arduino.replies.put(f"$9*{frame_checksum('9'):02X}\r\n".encode())
+    arduino.replies.put(b"garbage\r\n")
+    assert motors.request("PING") == ["OK"]
+
+def test_failed_move_is_rolled_back(motors, monkeypatch):
+    positions = dict(motors.positions)
+
+    def broken_write(data):
+        raise OSError("port closed")
+    monkeypatch.setattr(motors.arduino, "write", broken_write)
+    for _ in range(MAX_QUEUED_MOVES + 1):  # Would block if a slot leaked
+        with pytest.raises(OSError):
+            motors.queue_move({"DET_AZ": 40})
+    monkeypatch.undo()
+
+    assert motors.positions == positions
+    motors.move_many({"DET_AZ": 40})
+    assert motors.query_position()["DET_AZ"] == 40
+
+def test_move_timeout_reads_the_position_back():
+    arduino = FakeArduino(time_scale=1, in_process=True).start()
+    motors = Motors(connection=FakeSerial(arduino))
+    try:
+        future = motors.queue_move({"DET_AZ": 170})
+        future.deadline = time.monotonic()  # Overdue right away
+        with pytest.raises(TimeoutError):
+            motors.wait_for_move(future)
+        assert motors.positions["DET_AZ"] < 170  # Where the motor really is, not the planned target
+        assert motors._queue_end <= time.monotonic()
+    finally:
+        motors.close()
+        arduino.stop()
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import pytest
+from fake_camera import FakePicamera2
+from fake_arduino import FakeArduino, FakeSerial
+from motors import Motors
+from capture_image import run_full_measurement
+from roi import Circle
+from reprocess import reprocess
+from measurement_store import MEASURED
+from benchmark import BenchmarkApp
+
+# Coarse grid of a few positions: (ls_az, ls_rad, det_az, det_rad) step sizes
+STEPS = (200, 200, 90, 90)
+
+@pytest.fixture(scope="module", params=["adaptive", "hdr"])
+def measured(request, tmp_path_factory):
+    """A scan on the fake rig saved as an archive: (archive path, live measurements)."""
+    directory = tmp_path_factory.mktemp(request.param)
+    cwd = os.getcwd()
+    os.chdir(directory)  # Journal and exposure cache go next to the archive
+    arduino = FakeArduino(time_scale=0, in_process=True).start()
+    camera = FakePicamera2(geometry=arduino.angles)
+    camera.start()
+    try:
+        app = BenchmarkApp(camera, Motors(connection=FakeSerial(arduino)), STEPS, request.param)
+        assert run_full_measurement(app, image_count=3, save_dir="data")
+        app.motors.close()
+    finally:
+        arduino.stop()
+        os.chdir(cwd)
+    return os.path.join(directory, "data", os.listdir(directory / "data")[0]), app.measurements
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_reprocess_reproduces_the_measurement(measured, workers):
+    path, live = measured
+    result = reprocess(path, workers)
+    assert len(result) == len(live) > 0
+    assert np.array_equal(result.status, live.status)
+    assert np.array_equal(result.values, live.values)
+    assert np.array_equal(result.errors, live.errors, equal_nan=True)
+
+def test_reprocess_with_new_settings(measured):
+    path, live = measured
+    result = reprocess(path, 1, dark_value=0)
+    done = live.status == MEASURED
+    assert np.array_equal(result.status, live.status)
+    assert np.all(result.values[done] > live.values[done])  # Dark level no longer subtracted
+    with pytest.raises(ValueError):
+        reprocess(path, 1, roi=Circle(200))
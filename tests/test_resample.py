@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from scan_planner import is_blocked
+from output_data import write_zemax_bsdf
+from resample import METHODS, resample, target_axes, interpolation_weights, decimate_axis, uniform_axis, load_measurement
+
+# Uneven source axes with blocked points where the detector covers the light source
+AXES = [np.array(axis, dtype=float) for axis in ([8, 30, 60, 90], [8, 40, 90], [8, 20, 45, 90, 135], [8, 30, 50, 70])]
+
+def plane(axes):
+    """BSDF linear in every angle, scaled per R/G/B channel."""
+    grid = np.meshgrid(*axes, indexing="ij")
+    return (100 + 0.5 * grid[0] + 0.2 * grid[1] - 0.3 * grid[2] + 0.1 * grid[3])[..., np.newaxis] * np.array([1.0, 2.0, 3.0])
+
+@pytest.fixture
+def measured():
+    valid = ~is_blocked(*np.ix_(*AXES))
+    values = plane(AXES)
+    values[~valid] = 0.0
+    return values, valid
+
+def test_interpolation_weights():
+    weights = interpolation_weights([30, 8, 60], [8, 19, 45, 60, 70])
+    assert np.allclose(weights.sum(axis=1), [1, 1, 1, 1, 0])  # Nothing extrapolated beyond 60
+    assert np.allclose(weights[1], [0.5, 0.5, 0])
+    for method in METHODS:
+        assert np.allclose(interpolation_weights(AXES[2], AXES[2], method), np.eye(len(AXES[2])))
+
+@pytest.mark.parametrize("method", METHODS)
+def test_grid_points_pass_through(measured, method):
+    values, valid = measured
+    result, result_valid = resample(AXES, values, valid, AXES, method)
+    assert np.array_equal(result_valid, valid)
+    assert np.allclose(result[valid], values[valid], rtol=1e-12)
+
+@pytest.mark.parametrize("method", METHODS)
+def test_plane_recovered_exactly(method):
+    target = target_axes(AXES, steps=(15, 15, 5, 5))
+    values = plane(AXES)
+    result, result_valid = resample(AXES, values, np.ones(values.shape[:4], dtype=bool), target, method)
+    assert np.allclose(result[result_valid], plane(target)[result_valid], rtol=1e-9)
+    assert np.array_equal(result_valid, ~is_blocked(*np.ix_(*target)))
+
+def test_linear_is_exact_where_all_corners_are_measured(measured):
+    values, valid = measured
+    target = target_axes(AXES, steps=(15, 15, 5, 5))
+    result, result_valid = resample(AXES, values, valid, target)
+    coverage = resample(AXES, valid[..., np.newaxis].astype(float), np.ones_like(valid), target)[0][..., 0]
+    complete = result_valid & (coverage > 1 - 1e-6)
+    assert complete.any()
+    assert np.allclose(result[complete], plane(target)[complete], rtol=1e-9)
+
+def test_unknown_method_is_refused(measured):
+    with pytest.raises(ValueError):
+        resample(AXES, *measured, AXES, "nearest")
+
+def test_target_axes():
+    assert decimate_axis([8, 20, 30, 40, 50], 2).tolist() == [8, 30, 50]
+    assert decimate_axis([8, 20, 30, 40], 2).tolist() == [8, 30, 40]  # The last angle is always kept
+    assert uniform_axis([8, 90], 20).tolist() == [8, 28, 48, 68, 88]
+    decimated = target_axes(AXES, factors=(None, 2, 1, 2))
+    assert [len(axis) for axis in decimated] == [4, 2, 5, 3]
+
+def test_missing_points_read_back_from_zemax_file(measured, tmp_path):
+    values, valid = measured
+    path = tmp_path / "source.bsdf"
+    write_zemax_bsdf(path, "Asymmetrical4D", "RGB", "BRDF", *(axis.tolist() for axis in AXES), values)
+    axes, read_values, read_valid, scatter_type = load_measurement(str(path))
+    assert scatter_type == "BRDF"
+    assert np.array_equal(read_valid, valid)
+    assert np.allclose(read_values, values, rtol=5e-4)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from process_image import extract_color_channels, crop_to_roi
+from roi import (Circle, Annulus, Rectangle, Circles, roi_from_string, roi_extent, roi_mask, roi_pixels,
+                 bayer_roi_pixels, roi_channel_stats, roi_stats)
+
+SHAPE = (40, 60)
+
+def test_circle_and_annulus():
+    circle = roi_mask(SHAPE, Circle(10))
+    assert circle[20, 30] and circle[20, 35] and not circle[20, 36] and not circle[24, 34]
+    assert np.array_equal(roi_mask(SHAPE, Circle(10, (2, -3))), np.roll(circle, (2, -3), axis=(0, 1)))
+
+    annulus = roi_mask(SHAPE, Annulus(4, 10))
+    assert not annulus[20, 30] and not annulus[20, 32] and annulus[20, 33]
+    assert np.array_equal(annulus | roi_mask(SHAPE, Circle(4)), circle)
+
+def test_rectangle_and_circles():
+    rectangle = roi_mask(SHAPE, Rectangle(3, 5, (1, 0)))
+    assert np.count_nonzero(rectangle) == 15
+    assert np.array_equal(np.argwhere(rectangle)[[0, -1]], [[20, 28], [22, 32]])
+
+    circles = roi_mask(SHAPE, Circles(6, ((0, -10), (0, 10))))
+    assert np.array_equal(circles, roi_mask(SHAPE, Circle(6, (0, -10))) | roi_mask(SHAPE, Circle(6, (0, 10))))
+
+def test_roi_extent():
+    assert roi_extent(Circle(20)) == 10
+    assert roi_extent(Annulus(4, 10, (-3, 1))) == 8
+    assert roi_extent(Rectangle(4, 12)) == 6
+    assert roi_extent(Circles(6, ((0, -10), (2, 4)))) == 13
+    with pytest.raises(TypeError):
+        roi_extent((0, 0))
+
+@pytest.mark.parametrize("roi", [Circle(20), Annulus(4, 10, (1, 2)), Rectangle(3, 5), Circles(6, ((0, -10), (0, 10)))])
+def test_roi_from_string_round_trip(roi):
+    assert roi_from_string(repr(roi)) == roi
+
+@pytest.mark.parametrize("text", ["Square(4)", "Circle(__import__('os'))", "Circle(", "print(1)", "Circle(1, 2, 3)"])
+def test_roi_from_string_rejects_anything_else(text):
+    with pytest.raises(ValueError):
+        roi_from_string(text)
+
+def test_index_arrays_are_cached_and_read_only():
+    roi_pixels.cache_clear()
+    rows, cols = roi_pixels(SHAPE, Circle(10))
+    assert roi_pixels(SHAPE, Circle(10))[0] is rows
+    assert roi_pixels.cache_info().hits == 1
+    with pytest.raises(ValueError):
+        rows[0] = 0
+
+    names, bayer_rows, _ = bayer_roi_pixels((2 * SHAPE[0], 2 * SHAPE[1]), Circle(10))
+    assert names == ("R", "G1", "G2", "B") and bayer_rows.shape == (4, len(rows))
+    assert bayer_roi_pixels((2 * SHAPE[0], 2 * SHAPE[1]), Circle(10))[1] is bayer_rows
+
+@pytest.mark.parametrize("roi", [Circle(10), Annulus(4, 12, (2, -3))])
+def test_channel_stats_match_the_color_planes(roi):
+    rng = np.random.default_rng(2)
+    image = rng.integers(0, 1024, (2 * SHAPE[0], 2 * SHAPE[1]), dtype=np.uint16)
+    means, stds, count = roi_channel_stats(image, roi)
+    for plane, mean, std in zip(extract_color_channels(image), means, stds):
+        expected_mean, expected_std, expected_count = roi_stats(plane.astype(np.float64), roi)
+        assert mean == pytest.approx(expected_mean) and std == pytest.approx(expected_std)
+        assert count == expected_count
+
+    # The same ROI selects the same pixels in a crop_to_roi window
+    window = crop_to_roi(image, half_size=12)
+    assert np.allclose(roi_channel_stats(window, roi)[0], means)
@@ -0,0 +1,47 @@
+import itertools
+from types import SimpleNamespace
+import numpy as np
+from scan_planner import plan_scan, cached_plan, is_planned, is_blocked, index_to_steps, path_duration, two_opt
+from Steps.step4_angle_steps import generate_angle_lists
+
+ANGLES = ([8, 30, 60], [8, 40, 90], [8, 9, 50, 100, 175], [8, 9, 45, 90])
+
+def test_blocked_rule():
+    assert is_blocked(10, 20, 21.5, 11)
+    assert not is_blocked(10, 20, 22, 11)
+    assert not is_blocked(10, 20, 21, 12)
+    assert is_blocked(np.array([8, 8]), 8, np.array([8, 30]), 8).tolist() == [True, False]
+
+def test_plan_visits_every_unblocked_position_once():
+    plan = plan_scan(*ANGLES)
+    expected = {position for position in itertools.product(*ANGLES) if not is_blocked(*position)}
+    assert len(plan.visits) == len(set(plan.visits)) == len(expected)
+    assert set(plan.visits) == expected
+    assert plan.blocked_count == len(list(itertools.product(*ANGLES))) - len(expected)
+
+def test_plan_is_not_slower_than_nested_loops():
+    plan = plan_scan(*ANGLES)
+    assert plan.duration <= plan.baseline_duration
+    assert plan.saving >= 0
+
+def test_two_opt_does_not_lengthen_the_path():
+    plan = plan_scan(*ANGLES)
+    order = np.array([[ANGLES[i].index(angle) for i, angle in enumerate(visit)] for visit in plan.visits])
+    steps = index_to_steps(order, ANGLES)
+    refined = two_opt(steps)
+    assert sorted(refined.tolist()) == list(range(len(steps)))
+    assert path_duration(steps[refined]) <= path_duration(steps) + 1e-9
+    assert plan_scan(*ANGLES, use_tsp=True).duration <= plan.duration + 1e-9
+
+def test_plan_of_step4_grid():
+    app = SimpleNamespace(angle_step_sizes={"ls_az": 45, "ls_rad": 90, "det_az": 30, "det_rad": 30})
+    generate_angle_lists(app)
+    plan = plan_scan(app.light_radial_angles, app.incidence_angles, app.det_azimuth_angles, app.det_radial_angles)
+    assert plan.visits and not any(is_blocked(*visit) for visit in plan.visits)
+
+def test_cached_plan_is_planned_once():
+    angles = ([8, 20], [8, 30], [8, 50], [8, 60])
+    plan = cached_plan(*angles)
+    assert is_planned(*angles)
+    assert cached_plan(*(list(map(float, a)) for a in angles)) is plan
+    assert not is_planned([8], [8, 30], [8, 50], [8, 60])